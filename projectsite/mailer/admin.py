@@ -1,13 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.utils.html import format_html, format_html_join
 from .models import (
     UserProfile,
     EmailTemplate,
     EmailConfiguration,
     EmailLog,
-    CertificateBatch
+    ArchivedEmailLog,
+    DailySendStats,
+    CertificateBatch,
+    BatchItem
 )
+from .timing import STAGES
+from .changelists import LargeTableAdminMixin
+from .search import fts_available, search_email_logs
 
 
 # Inline admin for UserProfile
@@ -91,7 +98,10 @@ class EmailConfigurationAdmin(admin.ModelAdmin):
             'fields': ('email_domain', 'from_email', 'from_name')
         }),
         ('SMTP Configuration', {
-            'fields': ('smtp_host', 'smtp_port')
+            'fields': ('smtp_host', 'smtp_port', 'smtp_pool_size')
+        }),
+        ('Rate Limits', {
+            'fields': ('rate_limit_per_minute', 'rate_limit_burst')
         }),
         ('Metadata', {
             'fields': ('updated_at',),
@@ -110,14 +120,29 @@ class EmailConfigurationAdmin(admin.ModelAdmin):
 
 # Email Log Admin
 @admin.register(EmailLog)
-class EmailLogAdmin(admin.ModelAdmin):
-    list_display = ['student_id', 'email', 'status', 'template_used', 'sent_at']
-    list_filter = ['status', 'sent_at', 'template_used__college']
+class EmailLogAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['student_id', 'email', 'status', 'attempt', 'template_used', 'college', 'sent_at']
+    list_filter = ['status', 'sent_at', 'college']
+    list_select_related = ['template_used']
     search_fields = ['student_id', 'email', 'certificate_filename', 'error_message']
-    readonly_fields = ['student_id', 'email', 'certificate_filename', 'template_used', 
-                       'status', 'error_message', 'sent_at']
+    prefix_search_fields = ['student_id', 'email']
+    changelist_defer = ['error_message']
+    readonly_fields = ['student_id', 'email', 'certificate_filename', 'template_used', 'college',
+                       'status', 'attempt', 'error_message', 'sent_at']
     date_hierarchy = 'sent_at'
     
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index on SQLite; prefix (or default) search elsewhere
+        if search_term.strip() and fts_available(queryset.db):
+            return search_email_logs(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+    
+    @property
+    def search_help_text(self):
+        if fts_available():
+            return "Search words or word beginnings in the student ID, email, filename and error message"
+        return super().search_help_text
+    
     def has_add_permission(self, request):
         # Logs are created automatically, not manually
         return False
@@ -127,21 +152,117 @@ class EmailLogAdmin(admin.ModelAdmin):
         return False
 
 
+# Archived Email Log Admin (read-only; filled by manage.py archive_logs)
+@admin.register(ArchivedEmailLog)
+class ArchivedEmailLogAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['student_id', 'email', 'status', 'template_name', 'college', 'term', 'sent_at']
+    list_filter = ['term', 'status', 'college']
+    search_fields = ['student_id', 'email', 'certificate_filename']
+    prefix_search_fields = ['student_id', 'email']
+    changelist_defer = ['error_message']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# Daily Send Statistics Admin (read-only; maintained as logs are written)
+@admin.register(DailySendStats)
+class DailySendStatsAdmin(admin.ModelAdmin):
+    list_display = ['day', 'college', 'template_name', 'status', 'count', 'mean_smtp_ms']
+    list_filter = ['status', 'college']
+    date_hierarchy = 'day'
+    
+    def mean_smtp_ms(self, obj):
+        if not obj.smtp_count:
+            return '-'
+        return f"{obj.smtp_seconds / obj.smtp_count * 1000:.1f}"
+    mean_smtp_ms.short_description = 'Mean SMTP ms'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # Certificate Batch Admin
 @admin.register(CertificateBatch)
-class CertificateBatchAdmin(admin.ModelAdmin):
+class CertificateBatchAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['id', 'template_used', 'status', 'total_certificates', 
                     'successful_sends', 'failed_sends', 'started_at', 'completed_at']
     list_filter = ['status', 'started_at', 'template_used__college']
+    list_select_related = ['template_used']
+    changelist_defer = ['error_details', 'stage_timings']
     search_fields = ['id', 'error_details']
     readonly_fields = ['template_used', 'total_certificates', 'successful_sends', 
-                       'failed_sends', 'status', 'started_at', 'completed_at', 'error_details']
+                       'failed_sends', 'status', 'started_at', 'completed_at', 'error_details',
+                       'stage_timings_table']
+    exclude = ['stage_timings']
     date_hierarchy = 'started_at'
     
+    def stage_timings_table(self, obj):
+        # Per-stage timing histograms recorded by the worker
+        if not obj.stage_timings:
+            return '-'
+        
+        bounds = obj.stage_timings['bucket_bounds_ms']
+        labels = [f"≤{bound} ms" for bound in bounds] + [f">{bounds[-1]} ms"]
+        stage_names = dict(STAGES)
+        
+        header = format_html_join('', '<th>{}</th>', ((label,) for label in labels))
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td>{}</tr>', (
+            (
+                stage_names.get(name, name),
+                stats['count'],
+                f"{stats['total_ms']:.1f}",
+                f"{stats['mean_ms']:.2f}",
+                f"{stats['max_ms']:.2f}",
+                format_html_join('', '<td>{}</td>', ((count or '',) for count in stats['buckets'])),
+            )
+            for name, stats in obj.stage_timings['stages'].items()
+        ))
+        return format_html(
+            '<table><thead><tr><th>Stage</th><th>Count</th><th>Total ms</th><th>Mean ms</th>'
+            '<th>Max ms</th>{}</tr></thead><tbody>{}</tbody></table>',
+            header,
+            rows
+        )
+    stage_timings_table.short_description = 'Stage timings'
+    
     def has_add_permission(self, request):
         # Batches are created automatically, not manually
         return False
     
     def has_change_permission(self, request, obj=None):
         # Batches should not be edited
-        return False
\ No newline at end of file
+        return False
+
+
+# Batch Item Admin
+@admin.register(BatchItem)
+class BatchItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['batch', 'position', 'certificate_filename', 'status', 'updated_at']
+    list_filter = ['status']
+    list_select_related = ['batch']
+    search_fields = ['certificate_filename', 'idempotency_key']
+    prefix_search_fields = ['certificate_filename', 'idempotency_key']
+    raw_id_fields = ['batch']
+    readonly_fields = ['batch', 'position', 'certificate_filename', 'stored_path',
+                       'archive_member', 'idempotency_key', 'status', 'updated_at']
+    
+    def has_add_permission(self, request):
+        # Items are created when a batch is queued
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        # Checkpoints are written by the worker only
+        return False
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class MailerConfig(AppConfig):
     name = "mailer"
+
+    def ready(self):
+        from .search import ensure_fts_index
+        from .sqlite import configure_sqlite_connection
+        post_migrate.connect(ensure_fts_index, sender=self)
+        connection_created.connect(configure_sqlite_connection)
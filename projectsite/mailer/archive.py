@@ -0,0 +1,133 @@
+import os
+import gzip
+import json
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import EmailLog, ArchivedEmailLog
+
+# ============================================================
+# EMAIL LOG ARCHIVAL
+# ============================================================
+# EmailLog rows older than EMAIL_LOG_RETENTION_DAYS are moved to
+# ArchivedEmailLog (searchable in the admin, labelled by academic term)
+# and optionally also written to one gzipped JSONL file per term. Rows are
+# moved in chunks, each in its own short transaction, so sending is never
+# blocked for long while a large backlog is archived.
+# ============================================================
+
+def get_academic_terms():
+    # Academic terms as (starting month, name), in the order of the academic year
+    return settings.ACADEMIC_TERMS
+
+
+def get_academic_term(moment):
+    """
+    Name of the academic term a moment falls in, e.g. "AY 2025-2026 1st Semester".
+
+    Args:
+        moment: Aware datetime
+
+    Returns:
+        str: Academic year and term name
+    """
+    terms = get_academic_terms()
+    local = timezone.localtime(moment)
+
+    # The term whose start month was passed most recently (wrapping over New Year)
+    name = min(terms, key=lambda term: (local.month - term[0]) % 12)[1]
+    first_month = terms[0][0]
+    start_year = local.year if local.month >= first_month else local.year - 1
+    return f"AY {start_year}-{start_year + 1} {name}"
+
+
+def get_archive_cutoff(days=None):
+    # Logs sent before this moment are archived
+    if days is None:
+        days = getattr(settings, 'EMAIL_LOG_RETENTION_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def _archive_record(log):
+    return ArchivedEmailLog(
+        student_id=log.student_id,
+        email=log.email,
+        certificate_filename=log.certificate_filename,
+        template_name=log.template_used.name if log.template_used else '',
+        college=log.college,
+        status=log.status,
+        error_message=log.error_message or '',
+        attempt=log.attempt,
+        smtp_seconds=log.smtp_seconds,
+        content_hash=log.content_hash,
+        sent_at=log.sent_at,
+        term=get_academic_term(log.sent_at),
+    )
+
+
+def _export_records(records, export_dir):
+    # Append to <term>.jsonl.gz; every call adds a gzip member, which readers concatenate
+    by_term = {}
+    for record in records:
+        by_term.setdefault(record.term, []).append(record)
+
+    os.makedirs(export_dir, exist_ok=True)
+    for term, term_records in by_term.items():
+        path = os.path.join(export_dir, f"{term.replace(' ', '_')}.jsonl.gz")
+        with gzip.open(path, 'at', encoding='utf-8') as export_file:
+            for record in term_records:
+                export_file.write(json.dumps({
+                    'student_id': record.student_id,
+                    'email': record.email,
+                    'certificate_filename': record.certificate_filename,
+                    'template': record.template_name,
+                    'college': record.college,
+                    'status': record.status,
+                    'error_message': record.error_message,
+                    'attempt': record.attempt,
+                    'smtp_seconds': record.smtp_seconds,
+                    'content_hash': record.content_hash,
+                    'sent_at': record.sent_at.isoformat(),
+                }) + '\n')
+
+
+def archive_email_logs(cutoff, chunk_size=1000, export_dir=None, pause=0.0, dry_run=False):
+    """
+    Move EmailLog rows sent before the cutoff to ArchivedEmailLog.
+
+    Args:
+        cutoff: Logs sent before this datetime are archived
+        chunk_size: Rows moved per transaction
+        export_dir: Also append the rows to gzipped JSONL files in this directory
+            (each chunk once its transaction has committed)
+        pause: Seconds to sleep between chunks, letting other writers in
+        dry_run: Only count the logs that would be archived
+
+    Yields:
+        int: Number of rows moved by each chunk (the total count once for a dry run)
+    """
+    old_logs = EmailLog.objects.filter(sent_at__lt=cutoff)
+    if dry_run:
+        yield old_logs.count()
+        return
+
+    while True:
+        with transaction.atomic():
+            # Oldest first, so an interrupted run leaves no gaps in the archive
+            chunk = list(
+                old_logs.select_related('template_used').order_by('sent_at', 'id')[:chunk_size]
+            )
+            if not chunk:
+                return
+            records = [_archive_record(log) for log in chunk]
+            ArchivedEmailLog.objects.bulk_create(records)
+            if export_dir:
+                # A rolled back chunk is moved again by the next run; export it then
+                transaction.on_commit(lambda records=records: _export_records(records, export_dir))
+            EmailLog.objects.filter(pk__in=[log.pk for log in chunk]).delete()
+
+        yield len(chunk)
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,358 @@
+import re
+import ssl
+import base64
+import asyncio
+import smtplib
+import threading
+import email.policy
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.mail.utils import DNS_NAME
+
+# ============================================================
+# ASYNCIO SMTP BACKEND
+# ============================================================
+# Drop-in alternative to Django's blocking SMTP backend:
+#
+#   EMAIL_BACKEND = 'mailer.backends.AsyncSMTPBackend'
+#
+# Every backend instance owns one SMTP session, and the socket I/O of all
+# sessions runs on a single shared event loop thread. When the server
+# advertises ESMTP PIPELINING, MAIL FROM, every RCPT TO and DATA go out in
+# one write and their replies are read together, saving a round trip per
+# recipient.
+#
+# The blocking methods (open, close, send_messages) wait for the loop, so
+# the SMTP pool still runs one worker thread per connection; the saving is
+# the pipelined round trips, not fewer threads. Async callers can use
+# aopen, aclose and asend_messages without a thread per send.
+#
+# Errors are raised as smtplib exceptions, so retries, throttling and
+# reconnects work exactly as with the default backend.
+# ============================================================
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    # Shared event loop of all AsyncSMTPBackend sessions, started on first use
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="smtp-event-loop", daemon=True).start()
+        return _loop
+
+
+def _quote_data(data):
+    # Normalize line endings to CRLF, dot-stuff and terminate the DATA payload (RFC 5321 4.5.2)
+    data = re.sub(rb'(?:\r\n|\n|\r(?!\n))', b'\r\n', data)
+    data = re.sub(rb'(?m)^\.', b'..', data)
+    if not data.endswith(b'\r\n'):
+        data += b'\r\n'
+    return data + b'.\r\n'
+
+
+class AsyncSMTPSession:
+    """
+    One SMTP session driven by asyncio streams.
+
+    Args:
+        host: SMTP server
+        port: SMTP port
+        local_hostname: Name sent with EHLO
+        timeout: Seconds to wait for a server reply (None waits forever)
+        ssl_context: SSL context for implicit TLS or STARTTLS
+        use_ssl: Connect with implicit TLS
+        use_tls: Upgrade the connection with STARTTLS
+    """
+
+    def __init__(self, host, port, local_hostname=None, timeout=None, ssl_context=None,
+                 use_ssl=False, use_tls=False):
+        self.host = host
+        self.port = port
+        self.local_hostname = local_hostname or DNS_NAME.get_fqdn()
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.use_ssl = use_ssl
+        self.use_tls = use_tls
+        self.esmtp_features = {}
+        self._reader = None
+        self._writer = None
+
+    @property
+    def pipelining(self):
+        return 'pipelining' in self.esmtp_features
+
+    async def connect(self):
+        # Network errors propagate as OSError, like smtplib's
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=self.ssl_context if self.use_ssl else None,
+                server_hostname=self.host if self.use_ssl else None,
+            ),
+            self.timeout,
+        )
+
+        code, message = await self._read_reply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, message)
+
+        await self.ehlo()
+        if self.use_tls:
+            if 'starttls' not in self.esmtp_features:
+                raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+            code, message = await self.command('STARTTLS')
+            if code != 220:
+                raise smtplib.SMTPResponseException(code, message)
+            await self._writer.start_tls(self.ssl_context, server_hostname=self.host)
+            # Capabilities are sent again over the encrypted connection
+            await self.ehlo()
+
+    async def _read_reply(self):
+        # Read a possibly multi-line reply: "250-first", "250-second", "250 last"
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip(b' \t\r\n'))
+            if line[3:4] != b'-':
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            code = -1
+        return code, b'\n'.join(lines)
+
+    async def _write(self, data):
+        if self._writer is None:
+            raise smtplib.SMTPServerDisconnected("please run connect() first")
+        self._writer.write(data)
+        await asyncio.wait_for(self._writer.drain(), self.timeout)
+
+    async def command(self, line):
+        await self._write(line.encode('ascii') + b'\r\n')
+        return await self._read_reply()
+
+    async def ehlo(self):
+        code, message = await self.command(f'EHLO {self.local_hostname}')
+        if code != 250:
+            code, message = await self.command(f'HELO {self.local_hostname}')
+            if code != 250:
+                raise smtplib.SMTPHeloError(code, message)
+            self.esmtp_features = {}
+            return
+
+        # The first line is the greeting, the others are extensions ("SIZE 35882577")
+        features = {}
+        for line in message.decode('latin-1').split('\n')[1:]:
+            keyword, _, params = line.partition(' ')
+            features[keyword.lower()] = params.strip()
+        self.esmtp_features = features
+
+    async def login(self, username, password):
+        if 'auth' not in self.esmtp_features:
+            raise smtplib.SMTPNotSupportedError("SMTP AUTH extension not supported by server.")
+        mechanisms = self.esmtp_features['auth'].upper().split()
+        if 'PLAIN' in mechanisms:
+            token = base64.b64encode(f'\0{username}\0{password}'.encode()).decode('ascii')
+            code, message = await self.command(f'AUTH PLAIN {token}')
+        elif 'LOGIN' in mechanisms:
+            code, message = await self.command('AUTH LOGIN')
+            for value in (username, password):
+                if code != 334:
+                    break
+                code, message = await self.command(base64.b64encode(value.encode()).decode('ascii'))
+        else:
+            raise smtplib.SMTPException("No suitable authentication method found.")
+
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, message)
+
+    async def sendmail(self, from_addr, recipients, data):
+        """
+        Send one message.
+
+        Returns:
+            dict: Refused recipients ({address: (code, message)}), like smtplib.SMTP.sendmail
+        """
+        commands = [f'MAIL FROM:<{from_addr}>'] + [f'RCPT TO:<{address}>' for address in recipients] + ['DATA']
+
+        if self.pipelining:
+            # One write for the whole envelope, then one reply per command, in order
+            await self._write(''.join(f'{line}\r\n' for line in commands).encode('ascii'))
+            replies = [await self._read_reply() for _ in commands]
+        else:
+            # One command at a time; DATA is only sent once a recipient was accepted (below)
+            replies = [await self.command(commands[0])]
+            if replies[0][0] == 250:
+                replies += [await self.command(line) for line in commands[1:-1]]
+
+        code, message = replies[0]
+        if code != 250:
+            await self._reset(data_pending=len(replies) == len(commands) and replies[-1][0] == 354)
+            raise smtplib.SMTPSenderRefused(code, message, from_addr)
+
+        refused = {
+            address: reply
+            for address, reply in zip(recipients, replies[1:len(recipients) + 1])
+            if reply[0] not in (250, 251)
+        }
+        data_reply = replies[len(recipients) + 1] if len(replies) > len(recipients) + 1 else None
+
+        if len(refused) == len(recipients):
+            await self._reset(data_pending=data_reply is not None and data_reply[0] == 354)
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        if data_reply is None:
+            data_reply = await self.command('DATA')
+        if data_reply[0] != 354:
+            await self._reset()
+            raise smtplib.SMTPDataError(*data_reply)
+
+        await self._write(_quote_data(data))
+        code, message = await self._read_reply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, message)
+        return refused
+
+    async def _reset(self, data_pending=False):
+        # A pipelined DATA may already have been accepted; end it with an empty message first
+        try:
+            if data_pending:
+                await self._write(b'.\r\n')
+                await self._read_reply()
+            await self.command('RSET')
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def quit(self):
+        try:
+            await self.command('QUIT')
+        finally:
+            self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class AsyncSMTPBackend(EmailBackend):
+    """
+    Django email backend that sends over an asyncio SMTP session.
+
+    Accepts the same settings and arguments as Django's SMTP backend. The
+    blocking methods (open, close, send_messages) run the session on the
+    shared event loop and block the calling thread until it is done; async
+    code can use aopen, aclose and asend_messages instead.
+    """
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+    async def _in_loop(self, coroutine):
+        # Await a session coroutine from any event loop (sessions live on the shared one)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()))
+
+    def open(self):
+        with self._lock:
+            return self._run(self._open())
+
+    def close(self):
+        with self._lock:
+            self._run(self._close())
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        with self._lock:
+            return self._run(self._send_messages(email_messages))
+
+    async def aopen(self):
+        return await self._in_loop(self._open())
+
+    async def aclose(self):
+        await self._in_loop(self._close())
+
+    async def asend_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        return await self._in_loop(self._send_messages(email_messages))
+
+    async def _open(self):
+        # Same contract as EmailBackend.open(): True if a session was opened
+        if self.connection:
+            return False
+
+        session = AsyncSMTPSession(
+            self.host,
+            self.port,
+            timeout=self.timeout,
+            ssl_context=self.ssl_context if (self.use_ssl or self.use_tls) else None,
+            use_ssl=self.use_ssl,
+            use_tls=self.use_tls,
+        )
+        try:
+            await session.connect()
+            if self.username and self.password:
+                await session.login(self.username, self.password)
+        except (OSError, smtplib.SMTPException):
+            session.close()
+            if not self.fail_silently:
+                raise
+            return None
+        self.connection = session
+        return True
+
+    async def _close(self):
+        if self.connection is None:
+            return
+        try:
+            await self.connection.quit()
+        except (ssl.SSLError, OSError, smtplib.SMTPServerDisconnected):
+            self.connection.close()
+        except smtplib.SMTPException:
+            if not self.fail_silently:
+                raise
+        finally:
+            self.connection = None
+
+    async def _send_messages(self, email_messages):
+        new_connection = await self._open()
+        if not self.connection or new_connection is None:
+            return 0
+
+        sent_count = 0
+        try:
+            for message in email_messages:
+                if await self._send(message):
+                    sent_count += 1
+        finally:
+            if new_connection:
+                await self._close()
+        return sent_count
+
+    async def _send(self, email_message):
+        if not email_message.recipients():
+            return False
+        from_email = self.prep_address(email_message.from_email)
+        recipients = [self.prep_address(address) for address in email_message.recipients()]
+        message = email_message.message(policy=email.policy.SMTP)
+        try:
+            await self.connection.sendmail(from_email, recipients, message.as_bytes())
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Dropped or timed out mid-transaction: the session is unusable,
+            # the next open() starts a new one
+            self.connection.close()
+            self.connection = None
+            raise
+        except smtplib.SMTPException:
+            if not self.fail_silently:
+                raise
+            return False
+        return True
@@ -0,0 +1,130 @@
+import hashlib
+from django.conf import settings
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# ============================================================
+# ADMIN CHANGELISTS FOR LARGE TABLES
+# ============================================================
+# The default changelist gets slow on tables with millions of rows
+# (EmailLog, BatchItem): it counts every row twice per page, searches with
+# %term% over unindexed columns and aggregates the whole table for the
+# date hierarchy. With MAILER_ADMIN_FAST_CHANGELISTS the admins below
+# instead:
+#   - estimate the row count of an unfiltered table from its primary key
+#     range (pg_class statistics on PostgreSQL) and count filtered results
+#     only up to MAILER_ADMIN_COUNT_LIMIT
+#   - search by prefix with an index range scan on indexed columns
+#   - leave large text columns out of the changelist query
+#   - cache the date hierarchy links for MAILER_ADMIN_FACET_CACHE_SECONDS
+# ============================================================
+
+
+def fast_changelists_enabled():
+    return getattr(settings, 'MAILER_ADMIN_FAST_CHANGELISTS', True)
+
+
+def estimate_table_rows(model):
+    # Cheap row count estimate of a whole table
+    connection = connections[model.objects.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table is analyzed for the first time
+        if row and row[0] >= 0:
+            return row[0]
+
+    # Both ends of the primary key index; deleted rows are counted too
+    ids = model.objects.order_by().values_list('pk', flat=True)
+    first, last = ids.order_by('pk').first(), ids.order_by('-pk').first()
+    if first is None:
+        return 0
+    return last - first + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        if not fast_changelists_enabled():
+            return super().count
+
+        limit = getattr(settings, 'MAILER_ADMIN_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model)
+            if estimate > limit:
+                return estimate
+        # Filtered results are counted up to the limit (pages past it aren't reachable)
+        return queryset.order_by()[:limit].count()
+
+
+class LargeTableChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        if fast_changelists_enabled() and self.model_admin.changelist_defer:
+            queryset = queryset.defer(*self.model_admin.changelist_defer)
+        return queryset
+
+
+class LargeTableAdminMixin:
+    """
+    ModelAdmin mixin for tables that grow without bound.
+
+    Attributes:
+        prefix_search_fields: Indexed columns searched by prefix (None keeps search_fields)
+        changelist_defer: Columns left out of the changelist query
+    """
+
+    paginator = EstimatedCountPaginator
+    change_list_template = 'admin/mailer/large_change_list.html'
+    prefix_search_fields = None
+    changelist_defer = ()
+
+    @property
+    def show_full_result_count(self):
+        # The "(N total)" link counts the whole table again
+        return not fast_changelists_enabled()
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        if not fast_changelists_enabled() or not self.prefix_search_fields:
+            return super().get_search_results(request, queryset, search_term)
+
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        # field >= term AND field < term + highest character: a range scan on the field's index
+        condition = Q()
+        for field in self.prefix_search_fields:
+            condition |= Q(**{f'{field}__gte': search_term, f'{field}__lt': search_term + '\U0010ffff'})
+        return queryset.filter(condition), False
+
+    @property
+    def search_help_text(self):
+        if fast_changelists_enabled() and self.prefix_search_fields:
+            names = [self.model._meta.get_field(field).verbose_name for field in self.prefix_search_fields]
+            return f"Search by the start of the {' or '.join(names)}"
+        return None
+
+
+def cached_date_hierarchy(cl):
+    # date_hierarchy(cl), cached per changelist query (filters, search, college restrictions)
+    seconds = getattr(settings, 'MAILER_ADMIN_FACET_CACHE_SECONDS', 300)
+    if not fast_changelists_enabled() or not seconds:
+        return date_hierarchy(cl)
+
+    query = f"{cl.queryset.query}|{sorted(cl.params.items())}"
+    key = f"mailer:date_hierarchy:{cl.opts.label_lower}:{hashlib.sha256(query.encode()).hexdigest()}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = date_hierarchy(cl)
+        cache.set(key, facets, seconds)
+    return facets
@@ -0,0 +1,130 @@
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import EmailLog
+
+# ============================================================
+# DUPLICATE SEND DETECTION
+# ============================================================
+# Every email log records the SHA-256 of the certificate it carried,
+# computed while the attachment is encoded (no extra read of the file).
+# Before a batch sends a certificate, the same file already sent to the
+# same address within EMAIL_DUPLICATE_WINDOW_HOURS counts as a duplicate,
+# as does a second copy of it within the batch itself (e.g. a re-uploaded
+# folder, or the same PDF both loose and inside a ZIP).
+#
+# EMAIL_DUPLICATE_ACTION decides what happens to it:
+#   - 'skip': not sent; logged with status 'duplicate' and the batch item
+#     marked 'skipped'. A copy whose twin in the same batch is still being
+#     sent waits for it: it is skipped once the twin is delivered, and sent
+#     if the twin fails for good.
+#   - 'flag': sent anyway; the log notes the earlier send
+#
+# Logs remember the batch item that wrote them, so an item resumed after
+# a crash that was delivered before it is counted as sent, not skipped.
+#
+# Earlier sends are looked up once per batch (one query per
+# DUPLICATE_LOOKUP_CHUNK recipients), not once per email. Batches sent at
+# the same moment by different workers don't see each other's sends.
+# ============================================================
+
+DUPLICATE_LOOKUP_CHUNK = 500
+
+# Seconds a copy waits before checking again on its twin in the same batch
+DUPLICATE_WAIT_SECONDS = 5
+
+# Markers returned by DuplicateGuard.claim()
+IN_FLIGHT = 'in_flight'  # Claimed by a copy in this batch that is still being sent
+SENT_BY_ITEM = 'sent_by_item'  # This batch item was delivered by an earlier run
+
+
+def get_duplicate_action():
+    # 'skip', 'flag', or None if duplicate detection is off
+    if not getattr(settings, 'EMAIL_DUPLICATE_WINDOW_HOURS', 72):
+        return None
+    action = getattr(settings, 'EMAIL_DUPLICATE_ACTION', 'skip')
+    if action not in ('skip', 'flag'):
+        return None
+    return action
+
+
+class DuplicateGuard:
+    """
+    Certificates already sent to each recipient of a batch.
+
+    Load the recent sends with preload(), then call claim() (thread-safe)
+    from the workers before each send.
+    """
+
+    def __init__(self, action, window_hours=None):
+        self.action = action
+        if window_hours is None:
+            window_hours = getattr(settings, 'EMAIL_DUPLICATE_WINDOW_HOURS', 72)
+        self.window = timedelta(hours=window_hours)
+        self._sent = {}
+        self._item_sends = set()
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def preload(self, emails):
+        # Successful sends within the window to any of these addresses
+        since = timezone.now() - self.window
+        emails = sorted(set(emails))
+        for start in range(0, len(emails), DUPLICATE_LOOKUP_CHUNK):
+            rows = EmailLog.objects.filter(
+                email__in=emails[start:start + DUPLICATE_LOOKUP_CHUNK],
+                status='success',
+                sent_at__gte=since,
+            ).exclude(content_hash='').order_by().values_list('email', 'content_hash', 'sent_at', 'batch_item')
+            for email, content_hash, sent_at, batch_item_id in rows:
+                key = (email, content_hash)
+                if key not in self._sent or self._sent[key] < sent_at:
+                    self._sent[key] = sent_at
+                if batch_item_id is not None:
+                    self._item_sends.add((key, batch_item_id))
+
+    def claim(self, email, content_hash, owner):
+        """
+        Reserve a certificate for one recipient.
+
+        Args:
+            email: Recipient address
+            content_hash: SHA-256 hex digest of the certificate
+            owner: Certificate file of the send (its retries claim again)
+
+        Returns:
+            None if it may be sent; otherwise when it was sent before (a
+            datetime), IN_FLIGHT if a copy in this batch is being sent, or
+            SENT_BY_ITEM if this batch item itself was sent by an earlier run
+        """
+        key = (email, content_hash)
+        batch_item = getattr(owner, 'batch_item', None)
+        with self._lock:
+            if batch_item is not None and (key, batch_item.pk) in self._item_sends:
+                return SENT_BY_ITEM
+            if key in self._sent:
+                return self._sent[key]
+            claimed_by = self._claims.setdefault(key, owner)
+            return None if claimed_by is owner else IN_FLIGHT
+
+    def confirm(self, email, content_hash, owner):
+        # The claimed send was delivered; later copies are duplicates of it
+        with self._lock:
+            if self._claims.get((email, content_hash)) is owner:
+                del self._claims[(email, content_hash)]
+            self._sent[(email, content_hash)] = timezone.now()
+
+    def release(self, email, content_hash, owner):
+        # The claimed send failed for good; a waiting copy may be sent instead
+        with self._lock:
+            if self._claims.get((email, content_hash)) is owner:
+                del self._claims[(email, content_hash)]
+
+
+def describe_duplicate(email, sent_before):
+    # Log message for a duplicate found by DuplicateGuard.claim()
+    if sent_before == IN_FLIGHT:
+        return f"Duplicate: the same certificate is also in this batch for {email}"
+    sent_at = timezone.localtime(sent_before).strftime('%Y-%m-%d %H:%M')
+    return f"Duplicate: the same certificate was already sent to {email} on {sent_at}"
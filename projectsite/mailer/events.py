@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import asyncio
+from django.conf import settings
+
+# ============================================================
+# BATCH PROGRESS EVENTS
+# ============================================================
+# The worker publishes a small JSON snapshot of every running batch
+# (counts, current file, ETA, cooldown state) to a file next to the
+# uploaded certificates, replacing it atomically. The Server-Sent Events
+# endpoint only watches that file's modification time and streams each
+# new snapshot, so watching a batch costs one database query per stream
+# instead of one per poll, however many admins are watching.
+# ============================================================
+
+# Seconds between progress snapshots written by the worker
+PUBLISH_INTERVAL = 0.5
+# Seconds between checks of the snapshot file by a stream
+WATCH_INTERVAL = 0.5
+# Comment line sent on idle streams so proxies don't drop them
+KEEPALIVE_INTERVAL = 15
+# Streams end after this many seconds; EventSource reconnects on its own
+STREAM_MAX_AGE = 600
+
+
+def get_progress_path(batch_id):
+    # Snapshot file of a batch (kept outside the batch directory, which is removed on completion)
+    upload_root = getattr(settings, 'CERTIFICATE_UPLOAD_ROOT', settings.BASE_DIR / 'certificate_uploads')
+    return os.path.join(upload_root, 'progress', f"batch_{batch_id}.json")
+
+
+def publish_batch_progress(batch_id, snapshot):
+    # Write to a temporary file and rename it so readers never see a partial snapshot
+    path = get_progress_path(batch_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temporary_path, path)
+
+
+def read_batch_progress(batch_id):
+    """
+    Read the latest snapshot of a batch.
+
+    Returns:
+        tuple: (version, snapshot dict), or (None, None) if nothing was published
+    """
+    path = get_progress_path(batch_id)
+    try:
+        version = os.stat(path).st_mtime_ns
+        with open(path) as snapshot_file:
+            return version, json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None, None
+
+
+def batch_snapshot(batch):
+    # Snapshot of a batch from its database row (final state, or before the worker starts)
+    return {
+        'status': batch.status,
+        'total': batch.total_certificates,
+        'successful': batch.successful_sends,
+        'failed': batch.failed_sends,
+        'retrying': 0,
+        'current_file': None,
+        'eta_seconds': None,
+        'cooldown_seconds': 0,
+        'completed': batch.status in ['completed', 'failed'],
+    }
+
+
+def publish_batch_state(batch):
+    try:
+        publish_batch_progress(batch.pk, batch_snapshot(batch))
+    except OSError as e:
+        # Progress events are informational; never fail the batch over them
+        print(f"[WARNING] Could not publish progress of batch {batch.pk}: {e}")
+
+
+def prune_progress_files(max_age=3600):
+    # Remove snapshots of batches that finished long ago
+    progress_dir = os.path.dirname(get_progress_path(0))
+    try:
+        entries = list(os.scandir(progress_dir))
+    except FileNotFoundError:
+        return
+    cutoff = time.time() - max_age
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# Progress of the running batch as seen by the worker, published every PUBLISH_INTERVAL seconds
+class ProgressPublisher:
+    def __init__(self, batch_obj, rate_limiter=None, retries=None, interval=PUBLISH_INTERVAL):
+        self.batch_id = batch_obj.pk
+        self.total = batch_obj.total_certificates
+        # Resumed batches start from the counts of the earlier runs
+        self.successful = batch_obj.successful_sends
+        self.failed = batch_obj.failed_sends
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.interval = interval
+        self.current_file = None
+        self._started_at = time.monotonic()
+        self._done_this_run = 0
+        self._last_publish = 0.0
+
+    def record(self, success, filename):
+        if success:
+            self.successful += 1
+        else:
+            self.failed += 1
+        self._done_this_run += 1
+        self.current_file = filename
+        self.tick()
+
+    def tick(self):
+        # Publish if the last snapshot is older than the interval; also called
+        # while nothing completes, so the cooldown counts down on the page
+        if time.monotonic() - self._last_publish >= self.interval:
+            self.publish()
+
+    def snapshot(self):
+        remaining = max(0, self.total - self.successful - self.failed)
+        elapsed = time.monotonic() - self._started_at
+        eta = None
+        if self._done_this_run and elapsed > 0:
+            eta = round(remaining / (self._done_this_run / elapsed))
+
+        cooldown_remaining = getattr(self.rate_limiter, 'cooldown_remaining', None)
+        return {
+            'status': 'processing',
+            'total': self.total,
+            'successful': self.successful,
+            'failed': self.failed,
+            'retrying': len(self.retries) if self.retries is not None else 0,
+            'current_file': self.current_file,
+            'eta_seconds': eta,
+            'cooldown_seconds': round(cooldown_remaining()) if cooldown_remaining else 0,
+            'completed': False,
+        }
+
+    def publish(self):
+        self._last_publish = time.monotonic()
+        try:
+            publish_batch_progress(self.batch_id, self.snapshot())
+        except OSError as e:
+            # Progress events are informational; never fail the batch over them
+            print(f"[WARNING] Could not publish progress of batch {self.batch_id}: {e}")
+
+
+def format_event(snapshot):
+    return f"data: {json.dumps(snapshot)}\n\n"
+
+
+async def stream_batch_events(batch_id, initial_snapshot):
+    """
+    Server-Sent Events stream of a batch's progress snapshots.
+
+    Starts with the latest snapshot (or `initial_snapshot` from the database)
+    and sends every new one until the batch is completed. The snapshot file
+    is read in a worker thread so a slow disk never blocks the event loop.
+    """
+    version, snapshot = await asyncio.to_thread(read_batch_progress, batch_id)
+    # The database row is newer when the worker has not published yet
+    if snapshot is None or initial_snapshot['completed']:
+        snapshot = initial_snapshot
+    yield format_event(snapshot)
+
+    started_at = last_sent_at = time.monotonic()
+    while not snapshot['completed'] and time.monotonic() - started_at < STREAM_MAX_AGE:
+        await asyncio.sleep(WATCH_INTERVAL)
+
+        new_version, new_snapshot = await asyncio.to_thread(read_batch_progress, batch_id)
+        if new_snapshot is not None and new_version != version:
+            version, snapshot = new_version, new_snapshot
+            yield format_event(snapshot)
+            last_sent_at = time.monotonic()
+        elif time.monotonic() - last_sent_at >= KEEPALIVE_INTERVAL:
+            yield ": keepalive\n\n"
+            last_sent_at = time.monotonic()
@@ -0,0 +1,284 @@
+import os
+import shutil
+import zipfile
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import CertificateBatch, BatchItem
+from .utils import send_certificates_batch, scan_certificate_archive
+from .spool import SpooledCertificate, ArchivedCertificate, spool_upload
+from .events import get_progress_path, publish_batch_state, prune_progress_files
+from .metrics import ACTIVE_BATCHES, sync_metrics
+
+# ============================================================
+# BACKGROUND BATCH QUEUE
+# ============================================================
+# The web view only stores the uploaded certificates and creates a
+# CertificateBatch in 'pending'. The `process_batches` management command
+# claims pending batches one at a time and sends them outside the request.
+#
+# Every certificate of a batch gets a BatchItem checkpoint. If a worker
+# stops mid-batch, `manage.py resume_batch` puts the batch back in the
+# queue and the worker only sends the items that were not sent yet. The
+# stored files are kept until the batch completes. A batch still in
+# 'processing' is only resumed once it has been silent for
+# BATCH_STALE_MINUTES, so a live worker's batch is never sent twice.
+# ============================================================
+
+
+class BatchInProgressError(RuntimeError):
+    # The batch is still being sent by a worker
+    pass
+
+
+def get_batch_upload_dir(batch):
+    # Directory where the uploaded certificates of a batch are stored
+    upload_root = getattr(settings, 'CERTIFICATE_UPLOAD_ROOT', settings.BASE_DIR / 'certificate_uploads')
+    return os.path.join(upload_root, f"batch_{batch.pk}")
+
+
+def enqueue_batch(batch, certificate_files):
+    """
+    Store uploaded certificates on disk so a worker can send them later.
+
+    Files are prefixed with their upload position so the worker sends
+    them in the same order they were uploaded. Temporary uploads are moved
+    into the batch directory without being read again.
+
+    Args:
+        batch: CertificateBatch instance (status 'pending')
+        certificate_files: List of uploaded PDFs and/or ZIP archives of PDFs
+    """
+    upload_dir = get_batch_upload_dir(batch)
+    os.makedirs(upload_dir, exist_ok=True)
+
+    for index, cert_file in enumerate(certificate_files, start=1):
+        filename = os.path.basename(cert_file.name)
+        spool_upload(cert_file, os.path.join(upload_dir, f"{index:06d}_{filename}"))
+
+    create_batch_items(batch)
+
+
+def create_batch_items(batch):
+    """
+    Create one BatchItem checkpoint per stored certificate, in send order.
+
+    ZIP archives get one item per valid entry; only the archive's file
+    listing is read.
+
+    Returns:
+        int: Number of items created
+    """
+    upload_dir = get_batch_upload_dir(batch)
+    items = []
+
+    for stored_name in sorted(os.listdir(upload_dir)):
+        path = os.path.join(upload_dir, stored_name)
+        original_name = stored_name.split('_', 1)[1]
+
+        if original_name.lower().endswith('.zip'):
+            with zipfile.ZipFile(path) as archive:
+                entries, _ = scan_certificate_archive(archive)
+            for info in entries:
+                items.append(BatchItem(
+                    batch=batch,
+                    position=len(items) + 1,
+                    certificate_filename=os.path.basename(info.filename),
+                    stored_path=path,
+                    archive_member=info.filename,
+                ))
+        else:
+            items.append(BatchItem(
+                batch=batch,
+                position=len(items) + 1,
+                certificate_filename=original_name,
+                stored_path=path,
+            ))
+
+    with transaction.atomic():
+        BatchItem.objects.bulk_create(items, batch_size=500)
+    return len(items)
+
+
+def list_batch_files(batch, archives):
+    """
+    Certificates of a batch that still have to be sent, in send order.
+
+    Files are opened lazily when sent; ZIP entries are streamed out of the
+    stored archive.
+
+    Args:
+        batch: CertificateBatch instance
+        archives: ExitStack that keeps the opened ZIP archives until the batch ends
+    """
+    # Batches queued before item checkpoints existed
+    if not batch.items.exists():
+        create_batch_items(batch)
+
+    open_archives = {}
+    certificate_files = []
+
+    for item in batch.items.filter(status__in=['pending', 'sending']).order_by('position'):
+        if item.archive_member:
+            archive = open_archives.get(item.stored_path)
+            if archive is None:
+                archive = archives.enter_context(zipfile.ZipFile(item.stored_path))
+                open_archives[item.stored_path] = archive
+            certificate_files.append(ArchivedCertificate(
+                archive, archive.getinfo(item.archive_member), batch_item=item
+            ))
+        else:
+            certificate_files.append(SpooledCertificate(
+                item.stored_path, name=item.certificate_filename, batch_item=item
+            ))
+
+    return certificate_files
+
+
+def get_batch_last_activity(batch):
+    # Last sign of life of a batch: an item checkpoint, a progress snapshot or its creation
+    activity = [batch.started_at, batch.items.aggregate(last=Max('updated_at'))['last']]
+    try:
+        # The worker publishes a snapshot at least every second while it sends
+        snapshot_mtime = os.stat(get_progress_path(batch.pk)).st_mtime
+        activity.append(datetime.fromtimestamp(snapshot_mtime, tz=dt_timezone.utc))
+    except OSError:
+        pass
+    return max(moment for moment in activity if moment is not None)
+
+
+def is_batch_stale(batch):
+    # Whether a 'processing' batch has been silent long enough for its worker to be gone
+    stale_after = timedelta(minutes=getattr(settings, 'BATCH_STALE_MINUTES', 15))
+    return get_batch_last_activity(batch) < timezone.now() - stale_after
+
+
+def requeue_batch(batch, retry_failed=False, skip_in_flight=False, force=False):
+    """
+    Put a stopped batch back in the queue so a worker resumes it.
+
+    Items already sent are never sent again. Items left in 'sending' may or
+    may not have been delivered before the worker stopped; they are resent
+    with the same Message-ID unless skip_in_flight is set.
+
+    Args:
+        batch: CertificateBatch in 'processing' (worker died) or 'failed'
+        retry_failed: Also resend items whose send failed
+        skip_in_flight: Mark 'sending' items as failed instead of resending them
+        force: Resume a 'processing' batch even if it doesn't look stale
+
+    Returns:
+        int: Number of items that will be sent
+
+    Raises:
+        BatchInProgressError: The batch is in 'processing' and was active
+            within BATCH_STALE_MINUTES
+    """
+    if batch.status == 'processing' and not force and not is_batch_stale(batch):
+        last_activity = timezone.localtime(get_batch_last_activity(batch)).strftime('%Y-%m-%d %H:%M:%S')
+        raise BatchInProgressError(
+            f"Batch {batch.pk} is still being sent (last activity {last_activity})"
+        )
+
+    with transaction.atomic():
+        if skip_in_flight:
+            batch.items.filter(status='sending').update(status='failed', updated_at=timezone.now())
+        if retry_failed:
+            batch.items.filter(status='failed').update(status='pending', updated_at=timezone.now())
+
+        batch.status = 'pending'
+        batch.completed_at = None
+        batch.save(update_fields=['status', 'completed_at'])
+
+    # Streams still showing the earlier run's final state pick up the new one
+    publish_batch_state(batch)
+    return batch.items.filter(status__in=['pending', 'sending']).count()
+
+
+def claim_next_batch():
+    """
+    Claim the oldest pending batch for this worker.
+
+    The status is flipped with a conditional UPDATE so two workers polling
+    at the same time can never claim the same batch.
+
+    Returns:
+        CertificateBatch or None if the queue is empty
+    """
+    pending_ids = CertificateBatch.objects.filter(status='pending').order_by(
+        'started_at', 'id').values_list('id', flat=True)[:10]
+
+    for batch_id in pending_ids:
+        batch = claim_batch(batch_id)
+        if batch is not None:
+            return batch
+    return None
+
+
+def claim_batch(batch_id):
+    """
+    Claim one pending batch for this worker.
+
+    Returns:
+        CertificateBatch or None if it isn't pending (e.g. another worker claimed it first)
+    """
+    claimed = CertificateBatch.objects.filter(pk=batch_id, status='pending').update(status='processing')
+    if claimed:
+        return CertificateBatch.objects.select_related('template_used').get(pk=batch_id)
+    return None
+
+
+def run_batch(batch):
+    """
+    Send every stored certificate of a claimed batch that was not sent yet.
+
+    The final state of the batch is published for progress streams.
+
+    Returns:
+        dict: Statistics from send_certificates_batch, or None if the batch failed
+    """
+    prune_progress_files()
+    ACTIVE_BATCHES.inc()
+    try:
+        return _run_batch(batch)
+    finally:
+        ACTIVE_BATCHES.dec()
+        sync_metrics()
+
+
+def _run_batch(batch):
+    if batch.template_used is None:
+        batch.status = 'failed'
+        batch.error_details = "Email template was deleted before the batch was sent."
+        batch.completed_at = timezone.now()
+        batch.save(update_fields=['status', 'error_details', 'completed_at'])
+        shutil.rmtree(get_batch_upload_dir(batch), ignore_errors=True)
+        publish_batch_state(batch)
+        return None
+
+    try:
+        with ExitStack() as archives:
+            certificate_files = list_batch_files(batch, archives)
+            results = send_certificates_batch(
+                certificate_files=certificate_files,
+                template=batch.template_used,
+                batch_obj=batch
+            )
+        batch.update_completion()
+        publish_batch_state(batch)
+        # Stored files are only removed once the batch completes; a failed
+        # batch keeps them so it can be resumed
+        shutil.rmtree(get_batch_upload_dir(batch), ignore_errors=True)
+        return results
+
+    # Catch any unexpected exceptions so the worker keeps running
+    except Exception as e:
+        batch.status = 'failed'
+        batch.error_details = str(e)
+        batch.completed_at = timezone.now()
+        batch.save(update_fields=['status', 'error_details', 'completed_at'])
+        publish_batch_state(batch)
+        return None
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from mailer.archive import archive_email_logs, get_archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Move old email logs to the archive (Archived Email Logs in the admin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            help='Archive logs older than this many days (default: EMAIL_LOG_RETENTION_DAYS)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Logs moved per transaction (default: 1000)')
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to wait between chunks, to leave the database to the worker (default: 0)'
+        )
+        parser.add_argument(
+            '--export-dir',
+            help='Also append the archived logs to one gzipped JSONL file per academic term in this directory'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the logs that would be archived')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if options['older_than'] is not None and options['older_than'] < 0:
+            raise CommandError("--older-than can't be negative")
+
+        cutoff = get_archive_cutoff(options['older_than'])
+        chunks = archive_email_logs(
+            cutoff,
+            chunk_size=options['chunk_size'],
+            export_dir=options['export_dir'],
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+        )
+        cutoff_label = timezone.localtime(cutoff).strftime('%b %d, %Y %H:%M')
+
+        if options['dry_run']:
+            self.stdout.write(f"{next(chunks)} log(s) sent before {cutoff_label} would be archived")
+            return
+
+        archived = 0
+        for moved in chunks:
+            archived += moved
+            self.stdout.write(f"  {archived} log(s) archived...")
+        self.stdout.write(self.style.SUCCESS(f"✓ Archived {archived} log(s) sent before {cutoff_label}"))
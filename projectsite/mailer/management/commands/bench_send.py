@@ -0,0 +1,379 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+from contextlib import ExitStack
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.mail import get_connection
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils import timezone
+from mailer.models import EmailTemplate, EmailConfiguration, CertificateBatch
+from mailer.jobs import get_batch_upload_dir, create_batch_items, list_batch_files
+from mailer.utils import send_certificates_batch
+from mailer.smtp_sink import SMTPSink
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is reported as null
+    resource = None
+
+
+# Email backend wrapper that records how long every SMTP send takes
+class TimedBackend:
+    backend = 'django.core.mail.backends.smtp.EmailBackend'
+    latencies = []
+    _lock = threading.Lock()
+
+    def __init__(self, fail_silently=False, **kwargs):
+        self.connection = get_connection(self.backend, fail_silently=fail_silently, **kwargs)
+
+    def open(self):
+        return self.connection.open()
+
+    def close(self):
+        return self.connection.close()
+
+    def send_messages(self, email_messages):
+        started = time.perf_counter()
+        try:
+            return self.connection.send_messages(email_messages)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.latencies.append(elapsed)
+
+
+# Counts the queries of every database connection, including the pool's threads
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, db_connection):
+        if self not in db_connection.execute_wrappers:
+            db_connection.execute_wrappers.append(self)
+            self._connections.append(db_connection)
+
+    def _connection_created(self, sender, connection, **kwargs):
+        self.install(connection)
+
+    def __enter__(self):
+        self.install(connection)
+        connection_created.connect(self._connection_created)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._connection_created)
+        for db_connection in self._connections:
+            if self in db_connection.execute_wrappers:
+                db_connection.execute_wrappers.remove(self)
+
+
+def make_pdf(size, rng):
+    # Synthetic certificate: a PDF header, random (incompressible) content and an EOF marker
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    trailer = b'\n%%EOF\n'
+    return header + rng.randbytes(max(0, size - len(header) - len(trailer))) + trailer
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1048576 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batch sending end to end against an in-process SMTP sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Number of certificates to send (default: 200)')
+        parser.add_argument('--size', type=int, default=100, help='Size of each synthetic PDF in KB (default: 100)')
+        parser.add_argument('--pool-size', type=int, default=4, help='SMTP connections (default: 4)')
+        parser.add_argument(
+            '--backend',
+            default='django.core.mail.backends.smtp.EmailBackend',
+            help='Email backend to benchmark (default: Django SMTP backend)'
+        )
+        parser.add_argument('--latency', type=float, default=0.0, help='Sink reply latency in milliseconds (default: 0)')
+        parser.add_argument('--no-pipelining', action='store_true', help="Don't advertise PIPELINING in the sink")
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of recipients the sink refuses (0-1)')
+        parser.add_argument('--error-code', type=int, default=451, help='Reply code of refused recipients (default: 451)')
+        parser.add_argument('--retry-delay', type=float, default=0.1, help='Base retry delay in seconds (default: 0.1)')
+        parser.add_argument('--rate-limit', type=int, default=0, help='Emails per minute (default: 0, unlimited)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for file contents and error injection')
+        parser.add_argument(
+            '--memory-scaling',
+            metavar='COUNTS',
+            help='Compare peak memory across batch sizes, e.g. 1000,10000 (each count runs in its own process)'
+        )
+        parser.add_argument(
+            '--max-rss-growth',
+            type=float,
+            default=40.0,
+            help='With --memory-scaling, fail if the largest batch peaks this many MB above the smallest (default: 40)'
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        if options['memory_scaling']:
+            return self.run_memory_scaling(options)
+        if options['count'] < 1:
+            raise CommandError("--count must be at least 1")
+        if not 0 <= options['error_rate'] <= 1:
+            raise CommandError("--error-rate must be between 0 and 1")
+
+        with tempfile.TemporaryDirectory(prefix='bench_send_') as work_dir:
+            # Everything runs in a throwaway database; SQLite uses a file so
+            # the pool's threads can share it
+            if connection.vendor == 'sqlite':
+                connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'bench.sqlite3')
+            if not options['json']:
+                self.stdout.write('Creating benchmark database...')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                report = self.run_benchmark(work_dir, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                EmailConfiguration.clear_cache()
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def run_benchmark(self, work_dir, options):
+        upload_root = os.path.join(work_dir, 'uploads')
+        rng = random.Random(options['seed'])
+        TimedBackend.backend = options['backend']
+        TimedBackend.latencies = []
+
+        sink = SMTPSink(
+            latency=options['latency'] / 1000,
+            pipelining=not options['no_pipelining'],
+            error_rate=options['error_rate'],
+            error_code=options['error_code'],
+            seed=options['seed'],
+        )
+        with sink, override_settings(
+            EMAIL_BACKEND=f'{__name__}.TimedBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=sink.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            CERTIFICATE_UPLOAD_ROOT=upload_root,
+            # Keep the synthetic sends out of the site's /metrics
+            MAILER_METRICS_DIR=os.path.join(work_dir, 'metrics'),
+            CERTIFICATE_TESTING_MODE=False,
+            EMAIL_RETRY_BASE_DELAY=options['retry_delay'],
+        ):
+            EmailConfiguration.clear_cache()
+            config = EmailConfiguration.get_config()
+            config.from_email = 'bench@example.com'
+            config.smtp_pool_size = options['pool_size']
+            config.rate_limit_per_minute = options['rate_limit']
+            config.save()
+
+            template = EmailTemplate.objects.create(
+                name='Benchmark',
+                college='BENCH',
+                subject='Your certificate',
+                header_message='Certificate',
+                body_content='Please find your certificate attached.'
+            )
+            batch = CertificateBatch.objects.create(
+                template_used=template,
+                total_certificates=options['count'],
+                status='processing'
+            )
+
+            # Store the certificates the way enqueue_batch does
+            upload_dir = get_batch_upload_dir(batch)
+            os.makedirs(upload_dir)
+            for index in range(1, options['count'] + 1):
+                with open(os.path.join(upload_dir, f"{index:06d}_2000-1-{index:05d}.pdf"), 'wb') as pdf_file:
+                    pdf_file.write(make_pdf(options['size'] * 1024, rng))
+            create_batch_items(batch)
+
+            if not options['json']:
+                self.stdout.write(f"Sending {options['count']} certificates of {options['size']} KB...")
+
+            with ExitStack() as archives, QueryCounter() as queries:
+                certificate_files = list_batch_files(batch, archives)
+                started = time.perf_counter()
+                results = send_certificates_batch(certificate_files, template, batch_obj=batch)
+                elapsed = time.perf_counter() - started
+
+        latencies = sorted(TimedBackend.latencies)
+        return {
+            'benchmark': 'bench_send',
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'parameters': {
+                'count': options['count'],
+                'size_kb': options['size'],
+                'pool_size': options['pool_size'],
+                'backend': options['backend'],
+                'latency_ms': options['latency'],
+                'pipelining': not options['no_pipelining'],
+                'error_rate': options['error_rate'],
+                'error_code': options['error_code'],
+                'rate_limit_per_minute': options['rate_limit'],
+                'seed': options['seed'],
+            },
+            'results': {
+                'successful': results['successful'],
+                'failed': results['failed'],
+                'retried': results['retried'],
+                'elapsed_seconds': round(elapsed, 3),
+                'emails_per_second': round(options['count'] / elapsed, 2),
+                'send_latency_ms': {
+                    'p50': round(percentile(latencies, 50) * 1000, 2),
+                    'p95': round(percentile(latencies, 95) * 1000, 2),
+                    'p99': round(percentile(latencies, 99) * 1000, 2),
+                    'max': round(latencies[-1] * 1000, 2),
+                    'mean': round(statistics.fmean(latencies) * 1000, 2),
+                } if latencies else None,
+                'db_queries': queries.count,
+                'db_queries_per_email': round(queries.count / options['count'], 3),
+                'peak_rss_mb': peak_rss_mb(),
+                'sink': {
+                    'messages': sink.message_count,
+                    'refused_recipients': sink.refused_count,
+                    'sessions': sink.session_count,
+                    'bytes': sink.bytes_received,
+                },
+            },
+        }
+
+    def run_memory_scaling(self, options):
+        # Peak RSS only ever grows within a process, so every count gets a fresh one
+        try:
+            counts = sorted({int(count) for count in options['memory_scaling'].split(',')})
+        except ValueError:
+            raise CommandError("--memory-scaling expects comma-separated counts, e.g. 1000,10000")
+        if len(counts) < 2 or counts[0] < 1:
+            raise CommandError("--memory-scaling needs at least two counts of 1 or more")
+        if resource is None:
+            raise CommandError("Peak memory can't be measured on this platform")
+
+        base_command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_send', '--json',
+            '--size', str(options['size']),
+            '--pool-size', str(options['pool_size']),
+            '--backend', options['backend'],
+            '--latency', str(options['latency']),
+            '--rate-limit', str(options['rate_limit']),
+            '--seed', str(options['seed']),
+        ]
+        if options['no_pipelining']:
+            base_command.append('--no-pipelining')
+
+        runs = []
+        for count in counts:
+            if not options['json']:
+                self.stdout.write(f"Sending {count} certificates of {options['size']} KB in a new process...")
+            completed = subprocess.run(base_command + ['--count', str(count)], capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise CommandError(f"The run with {count} certificates failed:\n{completed.stderr}")
+            results = json.loads(completed.stdout)['results']
+            runs.append({
+                'count': count,
+                'certificate_mb': round(count * options['size'] / 1024, 1),
+                'peak_rss_mb': results['peak_rss_mb'],
+                'successful': results['successful'],
+                'elapsed_seconds': results['elapsed_seconds'],
+            })
+
+        growth = runs[-1]['peak_rss_mb'] - runs[0]['peak_rss_mb']
+        report = {
+            'benchmark': 'bench_send_memory',
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'parameters': {
+                'counts': counts,
+                'size_kb': options['size'],
+                'pool_size': options['pool_size'],
+                'backend': options['backend'],
+                'seed': options['seed'],
+                'max_rss_growth_mb': options['max_rss_growth'],
+            },
+            'runs': runs,
+            'rss_growth_mb': round(growth, 1),
+            'rss_growth_kb_per_certificate': round(growth * 1024 / (counts[-1] - counts[0]), 2),
+            'passed': growth <= options['max_rss_growth'],
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for run in runs:
+                self.stdout.write(
+                    f"  {run['count']:>7} certificates ({run['certificate_mb']:>8} MB): "
+                    f"peak RSS {run['peak_rss_mb']} MB, {run['elapsed_seconds']}s"
+                )
+            summary = (
+                f"Peak RSS grew {report['rss_growth_mb']} MB "
+                f"({report['rss_growth_kb_per_certificate']} KB per certificate)"
+            )
+            if report['passed']:
+                self.stdout.write(self.style.SUCCESS(f"✓ {summary}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"✗ {summary}, above --max-rss-growth {options['max_rss_growth']} MB"))
+
+        if not report['passed']:
+            raise CommandError("Peak memory grows with the number of certificates")
+
+    def print_report(self, report):
+        results = report['results']
+        latency = results['send_latency_ms'] or {}
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {results['successful']} sent, {results['failed']} failed, {results['retried']} retried "
+            f"in {results['elapsed_seconds']}s"
+        ))
+        self.stdout.write(f"  Throughput:       {results['emails_per_second']} emails/sec")
+        self.stdout.write(
+            f"  Send latency:     p50 {latency.get('p50')} ms, p95 {latency.get('p95')} ms, "
+            f"p99 {latency.get('p99')} ms"
+        )
+        self.stdout.write(f"  DB queries/email: {results['db_queries_per_email']} ({results['db_queries']} total)")
+        self.stdout.write(f"  Peak RSS:         {results['peak_rss_mb']} MB")
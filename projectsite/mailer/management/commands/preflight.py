@@ -0,0 +1,88 @@
+import os
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from mailer.models import EmailTemplate
+from mailer.preflight import run_preflight
+
+
+class Command(BaseCommand):
+    help = 'Check a batch of certificates and estimate its sending time, without sending anything'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Certificate PDFs, ZIP archives or folders of them')
+        parser.add_argument('--template', required=True, help='ID or name of the email template')
+        parser.add_argument('--show', type=int, default=20, help='Problems listed in full (default: 20)')
+
+    def handle(self, *args, **options):
+        template = self.get_template(options['template'])
+
+        paths = []
+        for path in options['paths']:
+            if os.path.isdir(path):
+                paths.extend(sorted(
+                    os.path.join(path, name) for name in os.listdir(path)
+                    if name.lower().endswith(('.pdf', '.zip'))
+                ))
+            elif os.path.isfile(path):
+                paths.append(path)
+            else:
+                raise CommandError(f"'{path}' does not exist")
+        if not paths:
+            raise CommandError("No certificate files found")
+
+        certificate_files = [File(open(path, 'rb'), name=os.path.basename(path)) for path in paths]
+        try:
+            report = run_preflight(certificate_files, template)
+        finally:
+            for certificate_file in certificate_files:
+                certificate_file.close()
+
+        self.print_report(report, options['show'])
+
+    def get_template(self, value):
+        templates = EmailTemplate.objects.filter(pk=value) if value.isdigit() else EmailTemplate.objects.none()
+        template = templates.first() or EmailTemplate.objects.filter(name=value).first()
+        if template is None:
+            raise CommandError(f"No email template with ID or name '{value}'")
+        return template
+
+    def print_report(self, report, show):
+        if report['errors']:
+            style, mark = self.style.ERROR, '✗'
+        elif report['warnings']:
+            style, mark = self.style.WARNING, '⚠'
+        else:
+            style, mark = self.style.SUCCESS, '✓'
+        self.stdout.write(style(
+            f"{mark} {report['to_send']} of {report['certificates']} certificate(s) would be sent "
+            f"({report['errors']} problem(s) blocking a send, {report['warnings']} warning(s), "
+            f"checked in {report['elapsed_seconds']:.1f}s)"
+        ))
+
+        attachment_mb = report['attachment_bytes'] / 1048576
+        self.stdout.write(f"  Attachments:   {attachment_mb:.1f} MB encoded")
+        if report['largest_attachment']:
+            name, size = report['largest_attachment']
+            self.stdout.write(f"  Largest:       {name} ({size / 1048576:.2f} MB encoded)")
+        if report['duplicates']:
+            self.stdout.write(f"  Duplicates:    {report['duplicates']}")
+
+        rate = f"{report['rate_limit_per_minute']}/min, burst {report['rate_limit_burst']}" \
+            if report['rate_limit_per_minute'] else 'no rate limit'
+        smtp_source = 'measured' if report['smtp_seconds_measured'] else 'assumed'
+        self.stdout.write(
+            f"  Sending time:  {report['send_duration']} ({report['pool_size']} connection(s), {rate}, "
+            f"{report['smtp_seconds'] * 1000:.0f} ms per send {smtp_source})"
+        )
+        if report['queued_ahead']:
+            self.stdout.write(f"  Queued ahead:  {report['queued_ahead']} certificate(s) of other batches")
+        completion = timezone.localtime(report['expected_completion']).strftime('%b %d, %Y %H:%M')
+        self.stdout.write(f"  Expected done: {completion} if queued now")
+
+        for problem in report['problems'][:show]:
+            mark = '✗' if problem['level'] == 'error' else '⚠'
+            subject = problem['file'] or problem['email']
+            self.stdout.write(f"  {mark} {subject + ': ' if subject else ''}{problem['message']}")
+        if len(report['problems']) > show:
+            self.stdout.write(f"  ... and {len(report['problems']) - show} more problem(s)")
@@ -0,0 +1,55 @@
+import sys
+import time
+import signal
+from django.core.management.base import BaseCommand
+from mailer.jobs import claim_next_batch, run_batch
+from mailer.metrics import start_metrics_sync
+
+
+class Command(BaseCommand):
+    help = 'Worker that claims pending certificate batches and sends them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the pending batches and exit instead of polling forever'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between checks when the queue is empty (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING('Certificate batch worker started'))
+
+        # Turn SIGTERM (e.g. a worker recycle) into a normal exit so buffered
+        # email logs and batch progress are flushed by the finally blocks
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        start_metrics_sync()
+
+        try:
+            while True:
+                batch = claim_next_batch()
+
+                if batch is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f"Processing batch {batch.id} ({batch.total_certificates} certificates)...")
+                results = run_batch(batch)
+
+                if results is None:
+                    self.stdout.write(self.style.ERROR(f"✗ Batch {batch.id} failed: {batch.error_details}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"✓ Batch {batch.id} done: {results['successful']} sent, {results['failed']} failed, "
+                        f"{results['retried']} retried, {results['duplicates']} duplicates"
+                    ))
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nWorker stopped'))
@@ -0,0 +1,23 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from mailer.stats import rebuild_send_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily send statistics from the email logs and the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild, YYYY-MM-DD (default: the oldest log)')
+        parser.add_argument('--until', help='Last day to rebuild, YYYY-MM-DD (default: today)')
+
+    def handle(self, *args, **options):
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+            until = date.fromisoformat(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if since and until and since > until:
+            raise CommandError("--since must not be after --until")
+
+        rows = rebuild_send_stats(since=since, until=until)
+        self.stdout.write(self.style.SUCCESS(f"✓ Rebuilt {rows} daily statistics row(s)"))
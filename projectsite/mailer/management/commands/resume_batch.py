@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from mailer.models import CertificateBatch
+from mailer.jobs import BatchInProgressError, requeue_batch, claim_batch, run_batch
+from mailer.metrics import start_metrics_sync
+
+
+class Command(BaseCommand):
+    help = 'Resume certificate batches that stopped before all certificates were sent'
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch_ids', nargs='+', type=int, help='IDs of the batches to resume')
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also resend certificates whose send failed'
+        )
+        parser.add_argument(
+            '--skip-in-flight',
+            action='store_true',
+            help="Mark certificates that were being sent when the worker stopped as failed instead of resending them"
+        )
+        parser.add_argument(
+            '--run',
+            action='store_true',
+            help='Send the resumed batches in this process instead of leaving them to the worker'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Resume batches still in 'processing' even if their worker was active recently"
+        )
+
+    def handle(self, *args, **options):
+        resumed_ids = []
+        for batch_id in options['batch_ids']:
+            try:
+                batch = CertificateBatch.objects.get(pk=batch_id)
+            except CertificateBatch.DoesNotExist:
+                raise CommandError(f"Batch {batch_id} does not exist")
+
+            # Completed batches no longer have their stored certificates
+            if batch.status == 'completed':
+                self.stdout.write(self.style.WARNING(f"Batch {batch_id} is already completed, skipping"))
+                continue
+            if batch.status == 'pending':
+                self.stdout.write(self.style.WARNING(f"Batch {batch_id} is already queued, skipping"))
+                continue
+
+            try:
+                remaining = requeue_batch(
+                    batch,
+                    retry_failed=options['retry_failed'],
+                    skip_in_flight=options['skip_in_flight'],
+                    force=options['force']
+                )
+            except BatchInProgressError as e:
+                self.stdout.write(self.style.WARNING(f"{e}, skipping (use --force if its worker is gone)"))
+                continue
+            resumed_ids.append(batch_id)
+            self.stdout.write(self.style.SUCCESS(f"✓ Batch {batch_id} queued again: {remaining} certificate(s) left to send"))
+
+        if options['run']:
+            # Sending here makes this process a worker, whose metrics /metrics should include
+            start_metrics_sync()
+            # Only the batches resumed here; other queued batches are left to the worker
+            for batch_id in resumed_ids:
+                batch = claim_batch(batch_id)
+                if batch is None:
+                    self.stdout.write(self.style.WARNING(f"Batch {batch_id} was claimed by a worker, skipping"))
+                    continue
+                self.stdout.write(f"Processing batch {batch.id}...")
+                results = run_batch(batch)
+                if results is None:
+                    self.stdout.write(self.style.ERROR(f"✗ Batch {batch.id} failed: {batch.error_details}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"✓ Batch {batch.id} done: {results['successful']} sent, {results['failed']} failed, "
+                        f"{results['retried']} retried, {results['duplicates']} duplicates"
+                    ))
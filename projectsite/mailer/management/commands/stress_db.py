@@ -0,0 +1,181 @@
+import os
+import time
+import tempfile
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.db import connection, connections, OperationalError
+from django.test import Client
+from django.test.utils import override_settings
+from mailer.models import EmailTemplate, EmailConfiguration, EmailLog, CertificateBatch
+from mailer.utils import send_certificates_batch
+from mailer.management.commands.bench_send import percentile
+
+# Pages loaded by the reader threads while the senders write
+READER_PAGES = [
+    '/admin/mailer/emaillog/',
+    '/admin/mailer/certificatebatch/',
+    '/stats/',
+    '/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Stress the SQLite database with concurrent batch senders and page loads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=4, help='Batches sent at the same time (default: 4)')
+        parser.add_argument('--emails', type=int, default=300, help='Certificates per batch (default: 300)')
+        parser.add_argument('--readers', type=int, default=2, help='Threads loading pages meanwhile (default: 2)')
+        parser.add_argument(
+            '--baseline',
+            action='store_true',
+            help="Use SQLite's default journal, locking and transactions (without mailer/sqlite.py)"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("stress_db only applies to SQLite databases")
+        if options['senders'] < 1 or options['emails'] < 1:
+            raise CommandError("--senders and --emails must be at least 1")
+
+        database_settings = {
+            # Frequent small writes, as many as a busy worker could produce
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            'EMAIL_LOG_FLUSH_SIZE': 5,
+            'BATCH_PROGRESS_EVERY': 5,
+            'EMAIL_RETRY_MAX_ATTEMPTS': 1,
+            'CERTIFICATE_TESTING_MODE': False,
+            'ALLOWED_HOSTS': ['testserver'],
+            # The synthetic sends must not show up in the site's /metrics
+            'MAILER_METRICS_ENABLED': False,
+        }
+        options_dict = connection.settings_dict.setdefault('OPTIONS', {})
+        transaction_mode = options_dict.get('transaction_mode')
+        if options['baseline']:
+            database_settings.update(SQLITE_WAL=False, SQLITE_BUSY_TIMEOUT=None, SQLITE_SYNCHRONOUS=None)
+            options_dict.pop('transaction_mode', None)
+
+        with tempfile.TemporaryDirectory(prefix='stress_db_') as work_dir, override_settings(**database_settings):
+            # A throwaway database file shared by all threads
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'stress.sqlite3')
+            self.stdout.write('Creating stress test database...')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                report = self.run_stress(options)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                EmailConfiguration.clear_cache()
+                if transaction_mode is not None:
+                    options_dict['transaction_mode'] = transaction_mode
+
+        self.print_report(report, options)
+
+    def run_stress(self, options):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        EmailConfiguration.clear_cache()
+        config = EmailConfiguration.get_config()
+        config.from_email = 'stress@example.com'
+        config.smtp_pool_size = 2
+        config.rate_limit_per_minute = 0
+        config.save()
+        template = EmailTemplate.objects.create(
+            name='Stress', college='CS', subject='Your certificate',
+            header_message='Certificate', body_content='Please find your certificate attached.'
+        )
+        User.objects.create_superuser('stress', 'stress@example.com', 'stress')
+
+        errors = []
+        errors_lock = threading.Lock()
+        page_times = []
+        senders_done = threading.Event()
+
+        def record_error(e):
+            with errors_lock:
+                errors.append(f"{type(e).__name__}: {e}")
+
+        def sender(index):
+            try:
+                batch = CertificateBatch.objects.create(
+                    template_used=template, total_certificates=options['emails'], status='processing'
+                )
+                files = [
+                    SimpleUploadedFile(f"2000-{index}-{number:05d}.pdf", b'%PDF-1.4\n%%EOF\n')
+                    for number in range(options['emails'])
+                ]
+                send_certificates_batch(files, template, batch_obj=batch)
+                batch.update_completion()
+            except Exception as e:
+                record_error(e)
+            finally:
+                connections.close_all()
+
+        def reader():
+            client = Client(raise_request_exception=True)
+            try:
+                client.force_login(User.objects.get(username='stress'))
+                while not senders_done.is_set():
+                    for page in READER_PAGES:
+                        started = time.perf_counter()
+                        try:
+                            response = client.get(page)
+                            if response.status_code != 200:
+                                raise RuntimeError(f"{page} returned {response.status_code}")
+                        except (OperationalError, RuntimeError) as e:
+                            record_error(e)
+                        with errors_lock:
+                            page_times.append(time.perf_counter() - started)
+            except Exception as e:
+                record_error(e)
+            finally:
+                connections.close_all()
+
+        senders = [threading.Thread(target=sender, args=(index,)) for index in range(1, options['senders'] + 1)]
+        readers = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in readers + senders:
+            thread.start()
+        for thread in senders:
+            thread.join()
+        senders_done.set()
+        for thread in readers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        page_times.sort()
+        expected = options['senders'] * options['emails']
+        return {
+            'journal_mode': journal_mode,
+            'elapsed': elapsed,
+            'expected_logs': expected,
+            'logs': EmailLog.objects.count(),
+            'sent': sum(CertificateBatch.objects.values_list('successful_sends', flat=True)),
+            'page_loads': len(page_times),
+            'page_p50_ms': percentile(page_times, 50) * 1000 if page_times else None,
+            'page_p95_ms': percentile(page_times, 95) * 1000 if page_times else None,
+            'lock_errors': sum('locked' in error for error in errors),
+            'errors': errors,
+        }
+
+    def print_report(self, report, options):
+        style = self.style.SUCCESS if not report['errors'] and report['logs'] == report['expected_logs'] else self.style.ERROR
+        self.stdout.write(style(
+            f"{'✓' if style == self.style.SUCCESS else '✗'} {options['senders']} senders x {options['emails']} emails "
+            f"({report['journal_mode']} journal) in {report['elapsed']:.1f}s: "
+            f"{report['logs']}/{report['expected_logs']} logs, {report['sent']} counted as sent"
+        ))
+        if report['page_loads']:
+            self.stdout.write(
+                f"  Page loads:  {report['page_loads']} (p50 {report['page_p50_ms']:.0f} ms, "
+                f"p95 {report['page_p95_ms']:.0f} ms)"
+            )
+        self.stdout.write(f"  Lock errors: {report['lock_errors']}")
+        for error in report['errors'][:10]:
+            self.stdout.write(f"  ⚠ {error}")
+        if len(report['errors']) > 10:
+            self.stdout.write(f"  ... and {len(report['errors']) - 10} more errors")
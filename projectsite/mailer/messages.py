@@ -0,0 +1,68 @@
+import secrets
+from email.message import MIMEPart
+from email.utils import parseaddr
+from django.core.mail import EmailMessage
+from django.core.mail.utils import DNS_NAME
+
+# ============================================================
+# CERTIFICATE MESSAGE FACTORY
+# ============================================================
+# Subject, sender and the text/HTML body are the same for every email of a
+# batch; only the recipient and the attached PDF change. The factory builds
+# the shared multipart/alternative body part once and every message reuses
+# it, so per-email work is limited to the headers and the attachment.
+# ============================================================
+
+
+def _make_boundary():
+    return '===============' + secrets.token_hex(16) + '=='
+
+
+class CertificateMessageFactory:
+    """
+    Build certificate emails that share one precompiled body part.
+
+    Args:
+        rendered: RenderedEmail snapshot of the template
+        from_email: Formatted sender address ("Name <address>")
+    """
+
+    def __init__(self, rendered, from_email):
+        self.subject = rendered.subject
+        self.from_email = from_email
+        self.message_id_domain = parseaddr(from_email)[1].rpartition('@')[2] or str(DNS_NAME)
+
+        body_part = MIMEPart()
+        body_part.set_content(rendered.text_body)
+        body_part.add_alternative(rendered.html_body, subtype='html')
+        # Fixed boundary: serializing the shared part never modifies it,
+        # so pool workers can use it at the same time
+        body_part.set_boundary(_make_boundary())
+        self.body_part = body_part
+
+    def build(self, to, attachment, connection=None, idempotency_key=None):
+        """
+        Build the email of one recipient.
+
+        Args:
+            to: Recipient address
+            attachment: MIMEPart of the certificate (see mailer.spool.build_pdf_attachment)
+            connection: Optional persistent SMTP connection
+            idempotency_key: Optional BatchItem key; a resent email keeps the
+                same Message-ID so mail providers treat it as the same message
+
+        Returns:
+            EmailMessage: multipart/mixed message (shared body + certificate)
+        """
+        headers = {}
+        if idempotency_key:
+            headers['Message-ID'] = f"<{idempotency_key}.certificate@{self.message_id_domain}>"
+
+        return EmailMessage(
+            subject=self.subject,
+            from_email=self.from_email,
+            to=[to],
+            attachments=[self.body_part, attachment],
+            headers=headers,
+            connection=connection,
+        )
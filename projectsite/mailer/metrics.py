@@ -0,0 +1,460 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import bisect
+import threading
+from django.conf import settings
+
+# ============================================================
+# PROMETHEUS METRICS
+# ============================================================
+# Counters, gauges and histograms are kept in memory by every process and
+# updated from the existing instrumentation points (send results, stage
+# timers, rate limiter waits), so scraping never queries EmailLog.
+#
+# The web server and the `process_batches` workers are separate processes.
+# In multi-process mode (MAILER_METRICS_DIR set) each of them calls
+# start_metrics_sync(), and a background thread then writes its values to
+# <pid>-<id>.json in that directory every MAILER_METRICS_SYNC_INTERVAL
+# seconds; the random id keeps a reused pid from overwriting another
+# process's file. /metrics adds the files together: counters and histograms
+# of all processes, gauges only of processes that wrote recently. At exit a
+# process folds its counters and histograms into retired.json, so totals
+# never go down and the directory doesn't grow. Other processes (one-off
+# manage.py commands) never write a file.
+# ============================================================
+
+# Default histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        # [[labelvalues, value], ...] for snapshots
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [count per bucket..., count above the last bucket, sum]
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bucket] += 1
+            state[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self._values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {
+            'id': _get_process_id(),
+            'updated_at': time.time(),
+            'metrics': {name: metric.samples() for name, metric in self.metrics.items()},
+        }
+
+    def merge(self, metric, snapshots):
+        """
+        Sum the samples of one metric over several process snapshots.
+
+        Counters and histograms are summed over all snapshots, gauges over
+        the snapshots of live processes (see collect_snapshots).
+
+        Returns:
+            dict: {labelvalues tuple: value}
+        """
+        merged = {}
+        for snapshot in snapshots:
+            if metric.metric_type == 'gauge' and not snapshot.get('live', True):
+                continue
+            for labelvalues, value in snapshot['metrics'].get(metric.name, []):
+                key = tuple(labelvalues)
+                if metric.metric_type == 'histogram':
+                    current = merged.setdefault(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self, snapshots):
+        # Prometheus text exposition of one or more process snapshots
+        lines = []
+        for name, metric in self.metrics.items():
+            merged = self.merge(metric, snapshots)
+
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.metric_type}')
+            for key, value in sorted(merged.items()):
+                if metric.metric_type != 'histogram':
+                    lines.append(f'{name}{_format_labels(metric.labelnames, key)} {_format_value(value)}')
+                    continue
+
+                cumulative = 0
+                bounds = list(metric.buckets) + [float('inf')]
+                for bound, count in zip(bounds, value[:-1]):
+                    cumulative += count
+                    labels = _format_labels(metric.labelnames, key, [('le', _format_value(float(bound)))])
+                    lines.append(f'{name}_bucket{labels} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(metric.labelnames, key)} {_format_value(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(metric.labelnames, key)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+EMAILS_SENT = REGISTRY.register(Counter(
+    'mailer_emails_sent_total', 'Certificate emails sent successfully', ['college', 'template']
+))
+EMAILS_FAILED = REGISTRY.register(Counter(
+    'mailer_emails_failed_total', 'Certificate emails that failed for good', ['college', 'template']
+))
+EMAIL_RETRIES = REGISTRY.register(Counter(
+    'mailer_email_retries_total', 'Send attempts that failed transiently and were retried', ['college', 'template']
+))
+EMAIL_DUPLICATES = REGISTRY.register(Counter(
+    'mailer_email_duplicates_total', 'Certificates already sent to the same recipient (skipped or flagged)',
+    ['college', 'template']
+))
+SMTP_SEND_SECONDS = REGISTRY.register(Histogram(
+    'mailer_smtp_send_seconds', 'Duration of one SMTP send'
+))
+EMAIL_LOG_WRITE_SECONDS = REGISTRY.register(Histogram(
+    'mailer_email_log_write_seconds', 'Duration of one EmailLog write (a bulk insert during batches)'
+))
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'mailer_rate_limit_wait_seconds', 'Time a send waited for the rate limiter',
+    buckets=(0, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600)
+))
+# Counted from the database at scrape time (see render_metrics), never kept by a process
+BATCH_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'mailer_batch_queue_depth', 'Batches waiting for a worker'
+))
+ACTIVE_BATCHES = REGISTRY.register(Gauge(
+    'mailer_active_batches', 'Batches being sent right now'
+))
+
+# Stage timers (mailer.timing) that feed a histogram; SMTP sends are
+# observed by the send itself (record_smtp_send), timer or not
+STAGE_HISTOGRAMS = {
+    'log_insert': EMAIL_LOG_WRITE_SECONDS,
+}
+
+
+def metrics_enabled():
+    return getattr(settings, 'MAILER_METRICS_ENABLED', True)
+
+
+def get_metrics_dir():
+    return getattr(settings, 'MAILER_METRICS_DIR', None)
+
+
+def observe_stage(stage, seconds):
+    histogram = STAGE_HISTOGRAMS.get(stage)
+    if histogram is not None:
+        histogram.observe(seconds)
+
+
+def record_smtp_send(seconds):
+    SMTP_SEND_SECONDS.observe(seconds)
+
+
+def record_send_result(template, success, retry=False, duplicate=False):
+    # Final outcome (or scheduled retry) of one certificate email
+    labels = {
+        'college': template.college if template else '',
+        'template': template.name if template else '',
+    }
+    if duplicate:
+        EMAIL_DUPLICATES.inc(**labels)
+    if success:
+        EMAILS_SENT.inc(**labels)
+    elif retry:
+        EMAIL_RETRIES.inc(**labels)
+    elif not duplicate:
+        EMAILS_FAILED.inc(**labels)
+
+
+# ============================================================
+# MULTI-PROCESS FILES
+# ============================================================
+
+RETIRED_FILENAME = 'retired.json'
+# Seconds an exiting process waits for another one to release retired.json
+RETIRE_LOCK_WAIT = 5
+# Seconds after which the lock of retired.json is considered left behind by a killed process
+RETIRE_LOCK_TIMEOUT = 60
+
+_sync_lock = threading.Lock()
+_sync_started = False
+_process_id = None
+
+
+def _get_process_id():
+    # Unique per process; a forked child gets its own
+    global _process_id
+    if _process_id is None or not _process_id.startswith(f"{os.getpid()}-"):
+        _process_id = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+    return _process_id
+
+
+def start_metrics_sync():
+    """
+    Share this process's metrics through MAILER_METRICS_DIR.
+
+    Called by the web server (wsgi.py/asgi.py) and the batch workers. A
+    daemon thread writes the process's file every MAILER_METRICS_SYNC_INTERVAL
+    seconds, so recording a metric never touches the disk; at exit the
+    process's counters are folded into retired.json.
+    """
+    global _sync_started
+    if _sync_started:
+        return
+    _sync_started = True
+    atexit.register(_retire_process)
+    _start_sync_thread()
+
+
+def _start_sync_thread():
+    threading.Thread(target=_sync_loop, name="metrics-sync", daemon=True).start()
+
+
+def _sync_loop():
+    while _sync_started:
+        sync_metrics()
+        time.sleep(getattr(settings, 'MAILER_METRICS_SYNC_INTERVAL', 1))
+
+
+def _restart_sync_after_fork():
+    # Threads don't survive fork(); preforked web workers need their own
+    if _sync_started:
+        _start_sync_thread()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_sync_after_fork)
+
+
+def _get_snapshot_path(metrics_dir):
+    return os.path.join(metrics_dir, f"{_get_process_id()}.json")
+
+
+def _write_json(path, data):
+    # Replace the file atomically so readers never see a partial write
+    with open(f"{path}.tmp", 'w') as metrics_file:
+        json.dump(data, metrics_file)
+    os.replace(f"{path}.tmp", path)
+
+
+def sync_metrics():
+    """
+    Write this process's metrics to MAILER_METRICS_DIR (no-op in single-process
+    mode and before start_metrics_sync()).
+
+    Also serves as a heartbeat: gauges of processes that have not synced for
+    MAILER_METRICS_GAUGE_TTL seconds are left out of /metrics.
+    """
+    metrics_dir = get_metrics_dir()
+    if not metrics_dir or not metrics_enabled():
+        return
+
+    with _sync_lock:
+        if not _sync_started:
+            return
+        path = _get_snapshot_path(metrics_dir)
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            _write_json(path, REGISTRY.snapshot())
+        except OSError as e:
+            # Metrics must never break sending
+            print(f"[WARNING] Could not write metrics to {path}: {e}")
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _acquire_retire_lock(lock_path):
+    # Exclusive lock file; taken over once it is older than RETIRE_LOCK_TIMEOUT
+    deadline = time.monotonic() + RETIRE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > RETIRE_LOCK_TIMEOUT:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.05)
+    return False
+
+
+def _retire_process():
+    """
+    At exit: fold this process's counters and histograms into retired.json and
+    remove its file, so totals never go down and the directory doesn't grow.
+
+    If retired.json stays locked, the file is kept with the final values; it
+    still counts toward /metrics. Files of killed processes are kept the same way.
+    """
+    global _sync_started
+    metrics_dir = get_metrics_dir()
+    with _sync_lock:
+        # Stops the sync thread from writing the file again
+        _sync_started = False
+    if not metrics_dir or not metrics_enabled():
+        return
+
+    path = _get_snapshot_path(metrics_dir)
+    lock_path = os.path.join(metrics_dir, 'retired.lock')
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        if not _acquire_retire_lock(lock_path):
+            _write_json(path, REGISTRY.snapshot())
+            return
+        try:
+            retired_path = os.path.join(metrics_dir, RETIRED_FILENAME)
+            snapshots = [_read_snapshot(retired_path) or {'metrics': {}}, REGISTRY.snapshot()]
+            _write_json(retired_path, {
+                'id': 'retired',
+                'updated_at': time.time(),
+                'metrics': {
+                    name: [[list(key), value] for key, value in REGISTRY.merge(metric, snapshots).items()]
+                    for name, metric in REGISTRY.metrics.items()
+                    if metric.metric_type != 'gauge'
+                },
+            })
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            os.remove(lock_path)
+    except OSError as e:
+        print(f"[WARNING] Could not retire metrics in {metrics_dir}: {e}")
+
+
+def collect_snapshots():
+    # Snapshots of every process (just this one in single-process mode)
+    metrics_dir = get_metrics_dir()
+    if not metrics_dir:
+        return [REGISTRY.snapshot()]
+
+    sync_metrics()
+    gauge_ttl = getattr(settings, 'MAILER_METRICS_GAUGE_TTL', 60)
+    now = time.time()
+    try:
+        filenames = sorted(name for name in os.listdir(metrics_dir) if name.endswith('.json'))
+    except FileNotFoundError:
+        filenames = []
+
+    snapshots = []
+    for filename in filenames:
+        snapshot = _read_snapshot(os.path.join(metrics_dir, filename))
+        if snapshot is not None:
+            snapshot['live'] = filename != RETIRED_FILENAME and now - snapshot.get('updated_at', 0) <= gauge_ttl
+            snapshots.append(snapshot)
+    if not _sync_started:
+        # This process doesn't write a file; add its values directly
+        snapshots.append(REGISTRY.snapshot())
+    return snapshots
+
+
+def render_metrics(scrape_values=None):
+    """
+    Prometheus text exposition of the metrics of every process.
+
+    Args:
+        scrape_values: {gauge: value} of gauges read at scrape time (e.g. from
+            the database) instead of being kept by the processes
+    """
+    snapshots = collect_snapshots()
+    if scrape_values:
+        snapshots.append({
+            'live': True,
+            'metrics': {gauge.name: [[[], value]] for gauge, value in scrape_values.items()},
+        })
+    return REGISTRY.render(snapshots)
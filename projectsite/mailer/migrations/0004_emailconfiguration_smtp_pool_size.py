@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "mailer",
+            "0003_alter_emailtemplate_college_alter_emailtemplate_name_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailconfiguration",
+            name="smtp_pool_size",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Number of parallel SMTP connections used for batch sending",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0004_emailconfiguration_smtp_pool_size"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailconfiguration",
+            name="rate_limit_burst",
+            field=models.PositiveIntegerField(
+                default=80,
+                help_text="Emails that may be sent back to back before the rate limit applies",
+            ),
+        ),
+        migrations.AddField(
+            model_name="emailconfiguration",
+            name="rate_limit_per_minute",
+            field=models.PositiveIntegerField(
+                default=48,
+                help_text="Sustained emails per minute for the sender account (0 = unlimited)",
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:08
+
+import django.db.models.deletion
+import mailer.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0005_emailconfiguration_rate_limits"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BatchItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "position",
+                    models.PositiveIntegerField(
+                        help_text="Send order within the batch"
+                    ),
+                ),
+                ("certificate_filename", models.CharField(max_length=255)),
+                (
+                    "stored_path",
+                    models.CharField(
+                        help_text="Stored certificate (or ZIP archive) on disk",
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "archive_member",
+                    models.CharField(
+                        blank=True,
+                        help_text="Entry name inside the ZIP archive",
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "idempotency_key",
+                    models.CharField(
+                        default=mailer.models._new_idempotency_key,
+                        help_text="Stable key of this send (used as the email Message-ID)",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("sending", "Sending"),
+                            ("sent", "Sent"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="mailer.certificatebatch",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["batch", "position"],
+                "indexes": [
+                    models.Index(
+                        fields=["batch", "status"],
+                        name="mailer_batc_batch_i_e65bea_idx",
+                    )
+                ],
+                "unique_together": {("batch", "position")},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0006_batchitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emaillog",
+            name="attempt",
+            field=models.PositiveSmallIntegerField(
+                default=1, help_text="Send attempt this entry records (1 = first try)"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="emaillog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("success", "Success"),
+                    ("retrying", "Retrying"),
+                    ("failed", "Failed"),
+                ],
+                db_index=True,
+                max_length=10,
+            ),
+        ),
+    ]
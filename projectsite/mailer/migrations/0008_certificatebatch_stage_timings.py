@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0007_emaillog_attempt"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="certificatebatch",
+            name="stage_timings",
+            field=models.JSONField(
+                blank=True,
+                help_text="Per-stage timing histograms of the last run (see mailer.timing)",
+                null=True,
+            ),
+        ),
+    ]
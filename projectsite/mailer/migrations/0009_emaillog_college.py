@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:23
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_college(apps, schema_editor):
+    # Copy the college of each log's template in one UPDATE; logs whose
+    # template was already deleted stay blank
+    EmailLog = apps.get_model("mailer", "EmailLog")
+    EmailTemplate = apps.get_model("mailer", "EmailTemplate")
+    EmailLog.objects.filter(template_used__isnull=False).update(
+        college=Subquery(
+            EmailTemplate.objects.filter(pk=OuterRef("template_used")).values(
+                "college"
+            )[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0008_certificatebatch_stage_timings"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emaillog",
+            name="college",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("CS", "College of Sciences"),
+                    ("CBA", "College of Business and Accountancy"),
+                    ("CAH", "College of Arts and Humanities"),
+                ],
+                default="",
+                help_text="College of the template used",
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(backfill_college, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="emaillog",
+            index=models.Index(
+                fields=["college", "-sent_at"], name="mailer_emai_college_0c0610_idx"
+            ),
+        ),
+    ]
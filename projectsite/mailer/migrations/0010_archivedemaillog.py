@@ -0,0 +1,79 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0009_emaillog_college"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedEmailLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("student_id", models.CharField(db_index=True, max_length=50)),
+                ("email", models.EmailField(max_length=254)),
+                ("certificate_filename", models.CharField(max_length=255)),
+                ("template_name", models.CharField(blank=True, max_length=200)),
+                (
+                    "college",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("CS", "College of Sciences"),
+                            ("CBA", "College of Business and Accountancy"),
+                            ("CAH", "College of Arts and Humanities"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("success", "Success"),
+                            ("retrying", "Retrying"),
+                            ("failed", "Failed"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("error_message", models.TextField(blank=True)),
+                ("attempt", models.PositiveSmallIntegerField(default=1)),
+                ("sent_at", models.DateTimeField()),
+                (
+                    "term",
+                    models.CharField(
+                        db_index=True,
+                        help_text="Academic term the email was sent in",
+                        max_length=40,
+                    ),
+                ),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Archived Email Log",
+                "ordering": ["-sent_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["term", "-sent_at"], name="mailer_arch_term_d1ce49_idx"
+                    ),
+                    models.Index(
+                        fields=["college", "-sent_at"],
+                        name="mailer_arch_college_a679b0_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0010_archivedemaillog"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="archivedemaillog",
+            name="email",
+            field=models.EmailField(db_index=True, max_length=254),
+        ),
+        migrations.AlterField(
+            model_name="emaillog",
+            name="email",
+            field=models.EmailField(db_index=True, max_length=254),
+        ),
+    ]
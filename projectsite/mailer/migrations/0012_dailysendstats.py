@@ -0,0 +1,127 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:29
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    # Totals of the logs written so far (their SMTP time wasn't recorded)
+    DailySendStats = apps.get_model("mailer", "DailySendStats")
+    sources = [
+        (apps.get_model("mailer", "EmailLog"), "template_used__name"),
+        (apps.get_model("mailer", "ArchivedEmailLog"), "template_name"),
+    ]
+    totals = {}
+    for model, template_field in sources:
+        rows = (
+            model.objects.annotate(day=TruncDate("sent_at"), template=F(template_field))
+            .values("day", "college", "template", "status")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        for row in rows:
+            key = (row["day"], row["college"], row["template"] or "", row["status"])
+            totals[key] = totals.get(key, 0) + row["count"]
+
+    DailySendStats.objects.bulk_create(
+        [
+            DailySendStats(
+                day=day,
+                college=college,
+                template_name=template_name,
+                status=status,
+                count=count,
+            )
+            for (day, college, template_name, status), count in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0011_email_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedemaillog",
+            name="smtp_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="smtp_seconds",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time the SMTP send took (empty if it wasn't reached)",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="DailySendStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "college",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("CS", "College of Sciences"),
+                            ("CBA", "College of Business and Accountancy"),
+                            ("CAH", "College of Arts and Humanities"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("template_name", models.CharField(blank=True, max_length=200)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("success", "Success"),
+                            ("retrying", "Retrying"),
+                            ("failed", "Failed"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "smtp_count",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Sends whose SMTP time was measured"
+                    ),
+                ),
+                (
+                    "smtp_seconds",
+                    models.FloatField(
+                        default=0.0, help_text="Total SMTP time of those sends"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Daily Send Statistics",
+                "verbose_name_plural": "Daily Send Statistics",
+                "ordering": ["-day"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "college", "template_name", "status"),
+                        name="unique_daily_send_stats",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
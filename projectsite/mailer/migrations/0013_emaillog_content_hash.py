@@ -0,0 +1,89 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0012_dailysendstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedemaillog",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="SHA-256 of the certificate file (empty if it couldn't be read)",
+                max_length=64,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="archivedemaillog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("success", "Success"),
+                    ("retrying", "Retrying"),
+                    ("failed", "Failed"),
+                    ("duplicate", "Duplicate"),
+                ],
+                max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="batchitem",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("sending", "Sending"),
+                    ("sent", "Sent"),
+                    ("failed", "Failed"),
+                    ("skipped", "Skipped (duplicate)"),
+                ],
+                default="pending",
+                max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="dailysendstats",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("success", "Success"),
+                    ("retrying", "Retrying"),
+                    ("failed", "Failed"),
+                    ("duplicate", "Duplicate"),
+                ],
+                max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="emaillog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("success", "Success"),
+                    ("retrying", "Retrying"),
+                    ("failed", "Failed"),
+                    ("duplicate", "Duplicate"),
+                ],
+                db_index=True,
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emaillog",
+            index=models.Index(
+                fields=["email", "content_hash"], name="mailer_emai_email_db096f_idx"
+            ),
+        ),
+    ]
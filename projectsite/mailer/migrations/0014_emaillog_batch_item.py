@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0013_emaillog_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emaillog",
+            name="batch_item",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Batch checkpoint this email was sent for (empty for single sends)",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="email_logs",
+                to="mailer.batchitem",
+            ),
+        ),
+    ]
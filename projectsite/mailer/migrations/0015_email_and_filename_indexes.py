@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0014_emaillog_batch_item"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="batchitem",
+            name="certificate_filename",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="emaillog",
+            name="email",
+            field=models.EmailField(max_length=254),
+        ),
+    ]
@@ -1,7 +1,9 @@
+import time
+import uuid
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -91,8 +93,26 @@ class EmailConfiguration(models.Model):
         help_text="SMTP server host"
     )
     smtp_port = models.IntegerField(default=587, help_text="SMTP server port")
+    smtp_pool_size = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Number of parallel SMTP connections used for batch sending"
+    )
+
+    # Sending limits of the sender account (token bucket, see mailer.ratelimit)
+    rate_limit_per_minute = models.PositiveIntegerField(
+        default=48,
+        help_text="Sustained emails per minute for the sender account (0 = unlimited)"
+    )
+    rate_limit_burst = models.PositiveIntegerField(
+        default=80,
+        help_text="Emails that may be sent back to back before the rate limit applies"
+    )
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Process-local cache of the singleton (see get_config)
+    _cached_config = None
+    _cache_checked_at = 0.0
+
     class Meta:
         verbose_name = "Email Configuration"
         verbose_name_plural = "Email Configuration"
@@ -107,19 +127,51 @@ class EmailConfiguration(models.Model):
 
     @classmethod
     def get_config(cls):
-        # Get or create the singleton configuration
+        # Get or create the singleton configuration.
+        # The instance is cached per process; changes saved by another process
+        # (e.g. the admin while a worker is sending) are picked up by re-checking
+        # updated_at at most once every EMAIL_CONFIG_CACHE_TTL seconds.
+        now = time.monotonic()
+        cached = cls._cached_config
+
+        if cached is not None:
+            if now - cls._cache_checked_at < getattr(settings, 'EMAIL_CONFIG_CACHE_TTL', 30):
+                return cached
+            current_version = cls.objects.filter(pk=1).values_list('updated_at', flat=True).first()
+            if current_version == cached.updated_at:
+                cls._cache_checked_at = now
+                return cached
+
         config, _ = cls.objects.get_or_create(pk=1)
+        cls._cached_config = config
+        cls._cache_checked_at = now
         return config
 
+    @classmethod
+    def clear_cache(cls):
+        # Drop the cached singleton so the next get_config() reloads it
+        cls._cached_config = None
+        cls._cache_checked_at = 0.0
+
+
+# Invalidate the cached configuration when it is changed or removed
+@receiver(post_save, sender=EmailConfiguration)
+@receiver(post_delete, sender=EmailConfiguration)
+def clear_email_configuration_cache(sender, **kwargs):
+    EmailConfiguration.clear_cache()
+
 
 # Log of all certificate emails sent
 class EmailLog(models.Model):
     STATUS_CHOICES = [
         ('success', 'Success'),
+        ('retrying', 'Retrying'),
         ('failed', 'Failed'),
+        ('duplicate', 'Duplicate'),
     ]
 
     student_id = models.CharField(max_length=50, db_index=True)
+    # Searched through the (email, content_hash) index below
     email = models.EmailField()
     certificate_filename = models.CharField(max_length=255)
     template_used = models.ForeignKey(
@@ -128,20 +180,102 @@ class EmailLog(models.Model):
         null=True,
         related_name='email_logs'
     )
+    # Copied from the template, so college views don't need a join and
+    # keep the log after the template is deleted
+    college = models.CharField(
+        max_length=10,
+        choices=settings.COLLEGE_CHOICES,
+        blank=True,
+        default='',
+        help_text="College of the template used"
+    )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, db_index=True)
     error_message = models.TextField(blank=True, null=True)
+    attempt = models.PositiveSmallIntegerField(default=1, help_text="Send attempt this entry records (1 = first try)")
+    smtp_seconds = models.FloatField(null=True, blank=True, help_text="Time the SMTP send took (empty if it wasn't reached)")
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="SHA-256 of the certificate file (empty if it couldn't be read)"
+    )
+    batch_item = models.ForeignKey(
+        'BatchItem',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='email_logs',
+        help_text="Batch checkpoint this email was sent for (empty for single sends)"
+    )
     sent_at = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['-sent_at']
         indexes = [
             models.Index(fields=['-sent_at', 'status']),
+            # Recent logs of a college (send page)
+            models.Index(fields=['college', '-sent_at']),
+            # Same certificate already sent to this recipient (mailer.dedup)
+            models.Index(fields=['email', 'content_hash']),
         ]
 
     def __str__(self):
         return f"{self.student_id} - {self.status}"
 
 
+# Email logs moved out of EmailLog by `manage.py archive_logs`, labelled by
+# academic term. No foreign key, so templates can be deleted freely.
+class ArchivedEmailLog(models.Model):
+    student_id = models.CharField(max_length=50, db_index=True)
+    email = models.EmailField(db_index=True)
+    certificate_filename = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=200, blank=True)
+    college = models.CharField(max_length=10, choices=settings.COLLEGE_CHOICES, blank=True)
+    status = models.CharField(max_length=10, choices=EmailLog.STATUS_CHOICES)
+    error_message = models.TextField(blank=True)
+    attempt = models.PositiveSmallIntegerField(default=1)
+    smtp_seconds = models.FloatField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    sent_at = models.DateTimeField()
+    term = models.CharField(max_length=40, db_index=True, help_text="Academic term the email was sent in")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-sent_at']
+        verbose_name = "Archived Email Log"
+        indexes = [
+            models.Index(fields=['term', '-sent_at']),
+            models.Index(fields=['college', '-sent_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.status} ({self.term})"
+
+
+# Daily totals of the email logs per college, template and status, updated
+# as logs are written (mailer.stats). Includes archived logs. Keyed by the
+# template's name when the logs were counted (archived logs keep no id).
+class DailySendStats(models.Model):
+    day = models.DateField()
+    college = models.CharField(max_length=10, choices=settings.COLLEGE_CHOICES, blank=True)
+    template_name = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=10, choices=EmailLog.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    smtp_count = models.PositiveIntegerField(default=0, help_text="Sends whose SMTP time was measured")
+    smtp_seconds = models.FloatField(default=0.0, help_text="Total SMTP time of those sends")
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = "Daily Send Statistics"
+        verbose_name_plural = "Daily Send Statistics"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'college', 'template_name', 'status'], name='unique_daily_send_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.college} {self.template_name} - {self.status}: {self.count}"
+
+
 # Track batches of certificate sending operations
 class CertificateBatch(models.Model):
     STATUS_CHOICES = [
@@ -159,6 +293,11 @@ class CertificateBatch(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     error_details = models.TextField(blank=True, null=True)
+    stage_timings = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Per-stage timing histograms of the last run (see mailer.timing)"
+    )
 
     class Meta:
         ordering = ['-started_at']
@@ -171,4 +310,43 @@ class CertificateBatch(models.Model):
         # Update batch completion status
         self.completed_at = timezone.now()
         self.status = 'failed' if self.failed_sends > 0 and self.successful_sends == 0 else 'completed'
-        self.save()
\ No newline at end of file
+        self.save(update_fields=['successful_sends', 'failed_sends', 'status', 'completed_at'])
+
+
+def _new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+# Per-certificate checkpoint of a CertificateBatch (lets a stopped batch resume)
+class BatchItem(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped (duplicate)'),
+    ]
+
+    batch = models.ForeignKey(CertificateBatch, on_delete=models.CASCADE, related_name='items')
+    position = models.PositiveIntegerField(help_text="Send order within the batch")
+    certificate_filename = models.CharField(max_length=255, db_index=True)
+    stored_path = models.CharField(max_length=500, help_text="Stored certificate (or ZIP archive) on disk")
+    archive_member = models.CharField(max_length=500, blank=True, help_text="Entry name inside the ZIP archive")
+    idempotency_key = models.CharField(
+        max_length=64,
+        unique=True,
+        default=_new_idempotency_key,
+        help_text="Stable key of this send (used as the email Message-ID)"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['batch', 'position']
+        unique_together = [['batch', 'position']]
+        indexes = [
+            models.Index(fields=['batch', 'status']),
+        ]
+
+    def __str__(self):
+        return f"Batch {self.batch_id} #{self.position} - {self.certificate_filename} ({self.status})"
\ No newline at end of file
@@ -0,0 +1,226 @@
+import queue
+import smtplib
+import threading
+from django.core.mail import get_connection
+from django.db import connections
+from .metrics import RATE_LIMIT_WAIT_SECONDS
+
+# ============================================================
+# SMTP CONNECTION POOL
+# ============================================================
+# Batch sending is bounded by the SMTP round trip of a single connection.
+# The pool keeps K persistent connections open, each driven by its own
+# worker thread, so K messages are in flight at the same time. The pool
+# size comes from EmailConfiguration.smtp_pool_size.
+# ============================================================
+
+
+# Persistent SMTP connection that reconnects on its own when the server drops it.
+# Every send first takes a token from the shared rate limiter (if any).
+class ReconnectingConnection:
+    def __init__(self, backend, rate_limiter=None):
+        self.backend = backend
+        self.rate_limiter = rate_limiter
+
+    def __deepcopy__(self, memo):
+        # Messages keep a reference to their connection and the locmem test
+        # backend deep-copies sent messages; a live connection is never copied
+        return self
+
+    def open(self):
+        return self.backend.open()
+
+    def close(self):
+        self.backend.close()
+
+    def reconnect(self):
+        self.backend.close()
+        self.backend.open()
+
+    def send_messages(self, email_messages):
+        if self.rate_limiter is None:
+            return self._send_messages(email_messages)
+
+        RATE_LIMIT_WAIT_SECONDS.observe(self.rate_limiter.acquire())
+        try:
+            sent = self._send_messages(email_messages)
+        except Exception as e:
+            self.rate_limiter.on_error(e)
+            raise
+        self.rate_limiter.on_success()
+        return sent
+
+    def _send_messages(self, email_messages):
+        try:
+            return self.backend.send_messages(email_messages)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Idle connections are dropped by the server; retry once on a fresh one
+            self.reconnect()
+            return self.backend.send_messages(email_messages)
+
+
+class SMTPConnectionPool:
+    """
+    Run a send function over many items using `size` SMTP connections.
+
+    An optional `prepare` step (e.g. reading and encoding the attachment)
+    runs in a read-ahead thread, a few items ahead of the senders, so that
+    work overlaps with the network round trips of the connections.
+
+    Items put in an optional RetryQueue (see mailer.retry) while results are
+    being consumed are fed to the connections again once they are due.
+
+    Args:
+        size: Number of parallel connections (and worker threads)
+        connection_factory: Callable returning a new email backend instance
+        rate_limiter: Optional limiter shared by all connections (see mailer.ratelimit)
+        prefetch: Number of prepared items kept ready per connection
+    """
+
+    def __init__(self, size=1, connection_factory=None, rate_limiter=None, prefetch=2):
+        self.size = max(1, size)
+        self.connection_factory = connection_factory or get_connection
+        self.rate_limiter = rate_limiter
+        self.prefetch = max(1, prefetch)
+
+    def imap_unordered(self, func, items, prepare=None, retries=None, on_idle=None):
+        """
+        Call func(prepare(item), connection) for every item.
+
+        `on_idle` is called in the calling thread every second no result
+        arrives (e.g. while the connections wait out a throttling pause).
+
+        Yields:
+            tuple: (index, result) in completion order, where index is the
+            position of the item in `items`. A retried item yields one
+            result per attempt, under the same index.
+        """
+        items = list(items)
+        if not items:
+            return
+
+        tasks = queue.Queue(maxsize=self.size * self.prefetch)
+        results = queue.Queue()
+        open_errors = []
+        stop = threading.Event()
+        worker_count = min(self.size, len(items))
+
+        feeder = threading.Thread(
+            target=self._feed,
+            args=(items, prepare, retries, tasks, worker_count, stop),
+            name="smtp-pool-feeder",
+            daemon=True,
+        )
+        workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(func, tasks, results, open_errors, stop),
+                name=f"smtp-pool-{number}",
+                daemon=True,
+            )
+            for number in range(worker_count)
+        ]
+        feeder.start()
+        for worker in workers:
+            worker.start()
+
+        try:
+            received = 0
+            # Retries scheduled by the caller while handling a result add to the expected count
+            while received < len(items) + (retries.scheduled if retries is not None else 0):
+                try:
+                    index, result = results.get(timeout=1)
+                except queue.Empty:
+                    if any(worker.is_alive() for worker in workers) or not results.empty():
+                        if on_idle is not None:
+                            on_idle()
+                        continue
+                    # Every worker is gone: no connection could be opened
+                    if open_errors:
+                        raise open_errors[0]
+                    raise RuntimeError("SMTP connection pool stopped before all items were sent")
+
+                if isinstance(result, BaseException):
+                    raise result
+                received += 1
+                yield index, result
+
+        finally:
+            stop.set()
+            if retries is not None:
+                retries.close()
+            feeder.join()
+            for worker in workers:
+                worker.join()
+
+    @staticmethod
+    def _put(tasks, task, stop):
+        # Blocking put that gives up once the pool is stopped
+        while not stop.is_set():
+            try:
+                tasks.put(task, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, items, prepare, retries, tasks, worker_count, stop):
+        def feed(index, item):
+            if prepare is not None:
+                try:
+                    item = prepare(item)
+                except Exception as e:
+                    item = e
+            return self._put(tasks, (index, item), stop)
+
+        try:
+            for index, item in enumerate(items):
+                # Due retries go ahead of the remaining first attempts
+                for retry in (retries.pop_due() if retries is not None else []):
+                    if not feed(*retry):
+                        return
+                if not feed(index, item):
+                    return
+
+            # Keep feeding retries until the caller has every final result
+            while retries is not None and not retries.closed and not stop.is_set():
+                retry = retries.get(timeout=0.5)
+                if retry is not None and not feed(*retry):
+                    return
+        finally:
+            # One end marker per worker
+            for _ in range(worker_count):
+                self._put(tasks, None, stop)
+            connections.close_all()
+
+    def _worker(self, func, tasks, results, open_errors, stop):
+        connection = ReconnectingConnection(self.connection_factory(), rate_limiter=self.rate_limiter)
+        try:
+            try:
+                connection.open()
+            except Exception as e:
+                open_errors.append(e)
+                return
+
+            while not stop.is_set():
+                try:
+                    task = tasks.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if task is None:
+                    return
+
+                index, item = task
+                try:
+                    if isinstance(item, BaseException):
+                        raise item
+                    results.put((index, func(item, connection)))
+                except Exception as e:
+                    # Unexpected errors are re-raised in the calling thread
+                    results.put((index, e))
+                    return
+
+        finally:
+            connection.close()
+            # Database connections are per thread; don't leak them
+            connections.close_all()
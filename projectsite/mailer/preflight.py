@@ -0,0 +1,284 @@
+import time
+import heapq
+import hashlib
+import zipfile
+from contextlib import ExitStack
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import EmailConfiguration, EmailLog, BatchItem, DailySendStats
+from .ratelimit import AdaptiveRateLimiter, NoRateLimiter
+from .spool import ArchivedCertificate, build_pdf_attachment
+from .dedup import DUPLICATE_LOOKUP_CHUNK, DuplicateGuard, get_duplicate_action, describe_duplicate
+from .utils import validate_certificate_filename, scan_certificate_archive, render_certificate_email
+
+# ============================================================
+# BATCH PREFLIGHT (DRY RUN)
+# ============================================================
+# Runs a batch through the send pipeline without the SMTP step: filenames
+# are validated and resolved to addresses, every certificate is read and
+# encoded once (measuring its attachment size and hashing it for the
+# duplicate check), and recipients whose last email failed are reported.
+#
+# The sending time is simulated on a virtual clock with the configured
+# SMTP pool size and rate limiter, so thousands of sends are "timed" in
+# milliseconds. Each send takes the mean SMTP time of the last
+# PREFLIGHT_HISTORY_DAYS (PREFLIGHT_SMTP_SECONDS if nothing was sent yet),
+# and certificates still queued in other batches are sent first.
+# Throttling pauses only start when the server asks for them, so the
+# estimate assumes none; retries are not simulated either.
+# ============================================================
+
+# base64 of '%PDF-' (every PDF starts with it)
+PDF_MAGIC_BASE64 = 'JVBERi0'
+
+
+# Time source for rate limiters that only moves when the simulation moves it
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # Senders wait in parallel; the simulation adds each wait to its own sender
+        pass
+
+
+def format_duration(seconds):
+    # "2h 05m", "12m 30s" or "45s"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+def simulate_send_time(count, pool_size, per_minute, burst, smtp_seconds):
+    """
+    Seconds an SMTP pool needs to send `count` emails, on a virtual clock.
+
+    Args:
+        count: Number of emails
+        pool_size: Parallel SMTP connections
+        per_minute: Sustained emails per minute (0 disables rate limiting)
+        burst: Emails sent back to back before pacing starts
+        smtp_seconds: Duration of one SMTP send
+
+    Returns:
+        float: Seconds from the first send until the last one finishes
+    """
+    clock = VirtualClock()
+    limiter = NoRateLimiter()
+    if per_minute:
+        limiter_class = import_string(
+            getattr(settings, 'EMAIL_RATE_LIMITER', 'mailer.ratelimit.AdaptiveRateLimiter')
+        )
+        try:
+            limiter = limiter_class(rate=per_minute / 60, burst=burst, clock=clock.time, sleep=clock.sleep)
+        except TypeError:
+            # Limiter without an injectable clock; simulate the default one
+            limiter = AdaptiveRateLimiter(rate=per_minute / 60, burst=burst, clock=clock.time, sleep=clock.sleep)
+
+    # Time each connection becomes free; the earliest one takes the next email
+    free_at = [0.0] * max(1, pool_size)
+    finished = 0.0
+    for _ in range(count):
+        started = heapq.heappop(free_at)
+        clock.now = started
+        done = started + limiter.acquire() + smtp_seconds
+        limiter.on_success()
+        heapq.heappush(free_at, done)
+        finished = max(finished, done)
+    return finished
+
+
+def estimate_smtp_seconds(days=None):
+    # Mean SMTP time of recent successful sends (None if there are none)
+    if days is None:
+        days = getattr(settings, 'PREFLIGHT_HISTORY_DAYS', 30)
+    totals = DailySendStats.objects.filter(
+        day__gte=timezone.localdate() - timedelta(days=days),
+        status='success',
+    ).aggregate(count=Sum('smtp_count'), seconds=Sum('smtp_seconds'))
+    if not totals['count']:
+        return None
+    return totals['seconds'] / totals['count']
+
+
+def iter_certificates(certificate_files, problems):
+    # Certificates of the uploaded files, with the entries of ZIP archives
+    # expanded (archives stay open until the iteration ends)
+    with ExitStack() as stack:
+        for certificate_file in certificate_files:
+            if not certificate_file.name.lower().endswith('.zip'):
+                yield certificate_file
+                continue
+            try:
+                archive = stack.enter_context(zipfile.ZipFile(certificate_file))
+            except zipfile.BadZipFile:
+                problems.append(_problem('error', certificate_file.name, None, "Not a valid ZIP archive"))
+                continue
+            entries, archive_errors = scan_certificate_archive(archive)
+            for error in archive_errors:
+                problems.append(_problem('error', certificate_file.name, None, error))
+            for info in entries:
+                yield ArchivedCertificate(archive, info)
+
+
+def _problem(level, filename, email, message):
+    # 'error': the certificate won't be sent; 'warning': it will, but check it
+    return {'level': level, 'file': filename, 'email': email, 'message': message}
+
+
+def _find_recent_failures(emails, since):
+    # Addresses whose most recent email since `since` failed for good: {email: error}
+    emails = sorted(set(emails))
+    failures = {}
+    for start in range(0, len(emails), DUPLICATE_LOOKUP_CHUNK):
+        rows = EmailLog.objects.filter(
+            email__in=emails[start:start + DUPLICATE_LOOKUP_CHUNK],
+            status__in=['success', 'failed'],
+            sent_at__gte=since,
+        ).order_by('sent_at').values_list('email', 'status', 'error_message')
+        last_status = {}
+        for email, status, error_message in rows:
+            last_status[email] = (status, error_message)
+        failures.update({
+            email: error_message for email, (status, error_message) in last_status.items() if status == 'failed'
+        })
+    return failures
+
+
+def run_preflight(certificate_files, template):
+    """
+    Check a batch and estimate its sending time without sending anything.
+
+    Args:
+        certificate_files: Uploaded PDFs and ZIP archives (as given to enqueue_batch),
+            or File objects of single certificates
+        template: EmailTemplate instance
+
+    Returns:
+        dict: Report with the certificates that would be sent, their sizes,
+        the problems found and the estimated sending time
+    """
+    started = time.perf_counter()
+    problems = []
+    report = {
+        'certificates': 0,
+        'to_send': 0,
+        'duplicates': 0,
+        'attachment_bytes': 0,
+        'largest_attachment': None,
+        'problems': problems,
+    }
+
+    # Settings the send itself would fail on
+    config = EmailConfiguration.get_config()
+    if not config.from_email:
+        problems.append(_problem('error', None, None, "No sender address is configured"))
+    try:
+        render_certificate_email(template)
+    except Exception as e:
+        problems.append(_problem('error', None, None, f"Template '{template.name}' can't be rendered: {e}"))
+
+    max_size = getattr(settings, 'CERTIFICATE_MAX_FILE_SIZE', 10485760)
+    duplicate_action = get_duplicate_action()
+    duplicate_guard = DuplicateGuard(duplicate_action) if duplicate_action else None
+    certificates = []
+
+    # Validate, resolve and encode every certificate (one read each)
+    for certificate_file in iter_certificates(certificate_files, problems):
+        report['certificates'] += 1
+        name = certificate_file.name
+        is_valid, student_id, email = validate_certificate_filename(name)
+        if not is_valid:
+            problems.append(_problem('error', name, None, "Invalid filename format"))
+            continue
+        try:
+            validate_email(email)
+        except ValidationError:
+            problems.append(_problem('error', name, email, f"'{email}' is not a valid email address"))
+            continue
+        size = getattr(certificate_file, 'size', None)
+        if size is not None and size > max_size:
+            problems.append(_problem('error', name, email, f"Larger than {max_size // 1048576}MB"))
+            continue
+
+        digest = hashlib.sha256()
+        try:
+            attachment = build_pdf_attachment(certificate_file, digest=digest)
+        except Exception as e:
+            problems.append(_problem('error', name, email, f"Can't be read: {e}"))
+            continue
+        payload = attachment.get_payload()
+        if not payload:
+            problems.append(_problem('error', name, email, "The file is empty"))
+            continue
+        if not payload.startswith(PDF_MAGIC_BASE64):
+            problems.append(_problem('warning', name, email, "The file doesn't look like a PDF"))
+        certificates.append((certificate_file, email, digest.hexdigest(), len(payload)))
+
+    # Duplicates are found with the preloaded recent sends, as in a batch
+    if duplicate_guard:
+        duplicate_guard.preload(email for _, email, _, _ in certificates)
+    recipients = set()
+    for certificate_file, email, content_hash, encoded_size in certificates:
+        if duplicate_guard:
+            sent_before = duplicate_guard.claim(email, content_hash, certificate_file)
+            if sent_before is not None:
+                report['duplicates'] += 1
+                message = describe_duplicate(email, sent_before)
+                if duplicate_guard.action == 'skip':
+                    problems.append(_problem('error', certificate_file.name, email, f"{message} (will be skipped)"))
+                    continue
+                problems.append(_problem('warning', certificate_file.name, email, f"{message} (will be sent again)"))
+        if email in recipients:
+            problems.append(_problem('warning', certificate_file.name, email, "Also gets another certificate"))
+        recipients.add(email)
+        report['to_send'] += 1
+        report['attachment_bytes'] += encoded_size
+        if report['largest_attachment'] is None or encoded_size > report['largest_attachment'][1]:
+            report['largest_attachment'] = (certificate_file.name, encoded_size)
+
+    # Recipients whose last email bounced or was refused
+    history_since = timezone.now() - timedelta(days=getattr(settings, 'PREFLIGHT_HISTORY_DAYS', 30))
+    for email, error_message in sorted(_find_recent_failures(recipients, history_since).items()):
+        problems.append(_problem('warning', None, email, f"The last email to {email} failed: {error_message}"))
+
+    # Sending time on a virtual clock, after the certificates queued before this batch
+    smtp_seconds = estimate_smtp_seconds()
+    report['smtp_seconds_measured'] = smtp_seconds is not None
+    if smtp_seconds is None:
+        smtp_seconds = getattr(settings, 'PREFLIGHT_SMTP_SECONDS', 1.0)
+    queued = BatchItem.objects.filter(
+        batch__status__in=['pending', 'processing'],
+        status__in=['pending', 'sending'],
+    ).count()
+    pacing = (config.smtp_pool_size, config.rate_limit_per_minute, config.rate_limit_burst, smtp_seconds)
+    queue_seconds = simulate_send_time(queued, *pacing)
+    total_seconds = simulate_send_time(queued + report['to_send'], *pacing)
+
+    report.update({
+        'errors': sum(problem['level'] == 'error' for problem in problems),
+        'warnings': sum(problem['level'] == 'warning' for problem in problems),
+        'queued_ahead': queued,
+        'smtp_seconds': smtp_seconds,
+        'pool_size': config.smtp_pool_size,
+        'rate_limit_per_minute': config.rate_limit_per_minute,
+        'rate_limit_burst': config.rate_limit_burst,
+        'send_seconds': total_seconds - queue_seconds,
+        'send_duration': format_duration(total_seconds - queue_seconds),
+        'expected_completion': timezone.now() + timedelta(seconds=total_seconds),
+        'elapsed_seconds': time.perf_counter() - started,
+    })
+    return report
@@ -0,0 +1,183 @@
+import time
+import smtplib
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# ============================================================
+# RATE LIMITING
+# ============================================================
+# Sending is paced by a token bucket per sender account instead of a fixed
+# 80-email / 100-second cooldown: a sender may burst up to `burst` emails,
+# then continues at `rate` emails per second. The limiter only sleeps when
+# the bucket is empty. When the server answers with a throttling response
+# (421/450/451/452/454) the rate is halved and sending pauses with
+# exponential backoff; successful sends slowly restore the configured rate.
+#
+# The limiter class is pluggable via settings.EMAIL_RATE_LIMITER. A limiter
+# implements acquire() -> seconds waited, on_success(), on_error(exc) and
+# cooldown_remaining() -> seconds left in a throttling pause.
+# ============================================================
+
+# SMTP reply codes that mean "slow down / try later"
+THROTTLE_CODES = {421, 450, 451, 452, 454}
+
+
+def smtp_error_code(exc):
+    # Extract the SMTP reply code from an smtplib exception (None if it has none)
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        return codes[0] if codes else None
+    return getattr(exc, 'smtp_code', None)
+
+
+def is_throttle_error(exc):
+    return smtp_error_code(exc) in THROTTLE_CODES
+
+
+# Thread-safe token bucket
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def acquire(self):
+        # Take one token, sleeping only if the bucket is empty.
+        # Tokens are reserved under the lock and the sleep happens outside it,
+        # so concurrent senders queue up fairly behind each other.
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+# Token bucket that backs off when the server throttles
+class AdaptiveRateLimiter:
+    def __init__(self, rate, burst, min_rate=None, backoff=None, max_backoff=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.base_rate = float(rate)
+        self.min_rate = min_rate or self.base_rate / 16
+        self.backoff = backoff or getattr(settings, 'EMAIL_THROTTLE_BACKOFF', 30)
+        self.max_backoff = max_backoff or getattr(settings, 'EMAIL_THROTTLE_MAX_BACKOFF', 600)
+        self.clock = clock
+        self.sleep = sleep
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        waited = 0.0
+
+        # Backoff pause requested by a throttling response
+        with self._lock:
+            pause = self._paused_until - self.clock()
+        if pause > 0:
+            self.sleep(pause)
+            waited += pause
+
+        return waited + self.bucket.acquire()
+
+    def cooldown_remaining(self):
+        with self._lock:
+            return max(0.0, self._paused_until - self.clock())
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_throttles = 0
+            if self.bucket.rate < self.base_rate:
+                self.bucket.set_rate(min(self.base_rate, self.bucket.rate + self.base_rate * 0.05))
+
+    def on_error(self, exc):
+        # Returns True if the error was a throttling response
+        code = smtp_error_code(exc)
+        if code not in THROTTLE_CODES:
+            return False
+
+        with self._lock:
+            self._consecutive_throttles += 1
+            pause = min(self.max_backoff, self.backoff * 2 ** (self._consecutive_throttles - 1))
+            self._paused_until = max(self._paused_until, self.clock() + pause)
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+
+        print(f"[INFO] Server throttled sending ({code}) - pausing {pause:.0f} seconds, "
+              f"rate lowered to {self.bucket.rate * 60:.1f} emails/min")
+        return True
+
+
+# Limiter that never waits (rate limit disabled)
+class NoRateLimiter:
+    rate = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def acquire(self):
+        return 0.0
+
+    def cooldown_remaining(self):
+        return 0.0
+
+    def on_success(self):
+        pass
+
+    def on_error(self, exc):
+        return is_throttle_error(exc)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(account, per_minute, burst):
+    """
+    Get the process-wide rate limiter of a sender account.
+
+    Batches sending from the same account share one limiter, so running
+    batches back to back (or concurrently) cannot exceed its budget.
+
+    Args:
+        account: Sender account (SMTP user or from address)
+        per_minute: Sustained emails per minute (0 disables rate limiting)
+        burst: Emails that may be sent back to back before pacing starts
+    """
+    if not per_minute:
+        return NoRateLimiter()
+
+    limiter_class = import_string(
+        getattr(settings, 'EMAIL_RATE_LIMITER', 'mailer.ratelimit.AdaptiveRateLimiter')
+    )
+    key = (account, per_minute, burst)
+
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            # Drop limiters of an outdated configuration for this account
+            for stale_key in [k for k in _rate_limiters if k[0] == account]:
+                del _rate_limiters[stale_key]
+            limiter = limiter_class(rate=per_minute / 60, burst=burst)
+            _rate_limiters[key] = limiter
+        return limiter
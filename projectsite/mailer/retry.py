@@ -0,0 +1,115 @@
+import heapq
+import random
+import smtplib
+import threading
+import time
+from django.conf import settings
+from .ratelimit import smtp_error_code
+
+# ============================================================
+# RETRYING TRANSIENT SEND FAILURES
+# ============================================================
+# A failed send is either transient (timeouts, dropped connections, 4xx
+# replies such as greylisting) or permanent (5xx replies, invalid files).
+# Transient failures are put in a RetryQueue with jittered exponential
+# backoff and sent again by the same SMTP pool once their delay is over,
+# while the rest of the batch keeps going. Every attempt is logged; an
+# attempt that will be retried is logged as 'retrying', the last one as
+# 'success' or 'failed'.
+# ============================================================
+
+# Network errors without an SMTP reply code that are worth retrying
+TRANSIENT_EXCEPTIONS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def is_transient_error(exc):
+    # 4xx replies are temporary by definition (RFC 5321), 5xx are permanent
+    code = smtp_error_code(exc)
+    if code is not None:
+        return 400 <= code < 500
+    return isinstance(exc, TRANSIENT_EXCEPTIONS)
+
+
+class RetryPolicy:
+    """
+    Decide whether and when a failed send is attempted again.
+
+    Args:
+        max_attempts: Total attempts per certificate, including the first one
+        base_delay: Delay in seconds before the first retry, doubled on each retry
+        max_delay: Upper bound of the delay in seconds
+    """
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None):
+        self.max_attempts = max_attempts or getattr(settings, 'EMAIL_RETRY_MAX_ATTEMPTS', 3)
+        self.base_delay = base_delay if base_delay is not None else getattr(settings, 'EMAIL_RETRY_BASE_DELAY', 10)
+        self.max_delay = max_delay if max_delay is not None else getattr(settings, 'EMAIL_RETRY_MAX_DELAY', 300)
+
+    def should_retry(self, exc, attempt):
+        return attempt < self.max_attempts and is_transient_error(exc)
+
+    def delay(self, attempt):
+        # Exponential backoff with jitter: retries of certificates that failed
+        # together (e.g. greylisted at once) are spread out instead of
+        # hitting the server again at the same moment
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+
+# Thread-safe queue of items that become available once their delay is over
+class RetryQueue:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.scheduled = 0
+        self._heap = []
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def schedule(self, index, item, delay):
+        with self._condition:
+            self.scheduled += 1
+            # The counter keeps the heap from ever comparing the items
+            heapq.heappush(self._heap, (self.clock() + delay, self.scheduled, index, item))
+            self._condition.notify_all()
+
+    def pop_due(self):
+        # All items whose delay is over, without waiting
+        due = []
+        with self._condition:
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, index, item = heapq.heappop(self._heap)
+                due.append((index, item))
+        return due
+
+    def get(self, timeout):
+        # Wait up to `timeout` seconds for the next due item (None if there is none)
+        deadline = self.clock() + timeout
+        with self._condition:
+            while not self._closed:
+                now = self.clock()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, index, item = heapq.heappop(self._heap)
+                    return index, item
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                self._condition.wait(wait)
+        return None
+
+    def close(self):
+        # No more items will be scheduled; pending ones are dropped
+        with self._condition:
+            self._closed = True
+            self._heap.clear()
+            self._condition.notify_all()
@@ -0,0 +1,137 @@
+import re
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# ============================================================
+# EMAIL LOG FULL-TEXT SEARCH
+# ============================================================
+# On SQLite, an FTS5 index (mailer_emaillog_fts) covers the student ID,
+# email, filename and error message of every EmailLog and is kept in sync
+# by triggers, so bulk inserts and archival deletes are covered too. It is
+# created after `migrate` rather than by a migration: SQLite drops the
+# triggers whenever a migration rebuilds the EmailLog table.
+#
+# Searches match whole words and word prefixes ("2000-1-01" finds every ID
+# starting with it, "timed out" every error containing both words) through
+# the index instead of scanning the table with LIKE. Other databases, or
+# SQLite builds without FTS5, fall back to a case-insensitive substring
+# search over the same columns.
+# ============================================================
+
+FTS_TABLE = 'mailer_emaillog_fts'
+SEARCH_FIELDS = ['student_id', 'email', 'certificate_filename', 'error_message']
+
+_fts_tables = {}
+
+# External-content index and its triggers; every statement is idempotent
+FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        student_id, email, certificate_filename, error_message,
+        content='mailer_emaillog', content_rowid='id'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON mailer_emaillog BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, student_id, email, certificate_filename, error_message)
+        VALUES (new.id, new.student_id, new.email, new.certificate_filename, new.error_message);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON mailer_emaillog BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, student_id, email, certificate_filename, error_message)
+        VALUES ('delete', old.id, old.student_id, old.email, old.certificate_filename, old.error_message);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON mailer_emaillog BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, student_id, email, certificate_filename, error_message)
+        VALUES ('delete', old.id, old.student_id, old.email, old.certificate_filename, old.error_message);
+        INSERT INTO {FTS_TABLE}(rowid, student_id, email, certificate_filename, error_message)
+        VALUES (new.id, new.student_id, new.email, new.certificate_filename, new.error_message);
+    END
+    """,
+]
+FTS_OBJECTS = {FTS_TABLE, f'{FTS_TABLE}_insert', f'{FTS_TABLE}_delete', f'{FTS_TABLE}_update'}
+
+
+def ensure_fts_index(using='default', **kwargs):
+    """
+    Create the FTS5 index and its triggers if any of them is missing (post_migrate handler).
+
+    A (re)created index is rebuilt from the EmailLog table.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or 'mailer_emaillog' not in connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE %s", [f'{FTS_TABLE}%'])
+        if FTS_OBJECTS <= {name for (name,) in cursor.fetchall()}:
+            return
+        cursor.execute("PRAGMA compile_options")
+        if 'ENABLE_FTS5' not in {option for (option,) in cursor.fetchall()}:
+            print("[WARNING] SQLite was built without FTS5; email log search won't be indexed")
+            return
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+        # Index the logs written while the triggers were missing
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_tables.pop(using, None)
+
+
+def fts_available(using='default'):
+    # True if the FTS5 index exists on this database (looked up once per database)
+    if using not in _fts_tables:
+        connection = connections[using]
+        _fts_tables[using] = (
+            connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_tables[using]
+
+
+def build_fts_query(search_term):
+    """
+    FTS5 query matching every word of the search term as a prefix.
+
+    Args:
+        search_term: Text typed by the user
+
+    Returns:
+        str: MATCH expression, or None if the term has nothing searchable
+    """
+    # Each word becomes a quoted phrase, so punctuation ("2000-1-0001",
+    # "a@b.com") is matched literally instead of parsed as FTS5 syntax
+    phrases = [
+        '"' + word.replace('"', '""') + '"*'
+        for word in search_term.split()
+        if re.search(r'\w', word)
+    ]
+    return ' AND '.join(phrases) or None
+
+
+def search_email_logs(queryset, search_term):
+    """
+    Filter EmailLog rows by a search term, through the FTS5 index when available.
+
+    Args:
+        queryset: EmailLog queryset
+        search_term: Text typed by the user
+
+    Returns:
+        QuerySet: Matching rows
+    """
+    fts_query = build_fts_query(search_term)
+    if fts_query and fts_available(queryset.db):
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [fts_query]
+        ))
+
+    condition = Q()
+    for word in search_term.split():
+        word_condition = Q()
+        for field in SEARCH_FIELDS:
+            word_condition |= Q(**{f'{field}__icontains': word})
+        condition &= word_condition
+    return queryset.filter(condition)
@@ -0,0 +1,176 @@
+import random
+import asyncio
+import threading
+
+# ============================================================
+# LOCAL SMTP SINK
+# ============================================================
+# A minimal asyncio SMTP server that accepts every message and discards
+# it (or keeps it, for inspection). It runs in-process on its own event
+# loop thread, so the real SMTP backends can be exercised and benchmarked
+# without a mail server. It advertises PIPELINING and can simulate network
+# latency by delaying its replies without stalling the session, which is
+# how a pipelined client saves round trips on a real connection, and can
+# refuse a share of the recipients or drop connections to exercise error
+# handling.
+# ============================================================
+
+MAX_MESSAGE_SIZE = 52428800
+
+
+class SMTPSink:
+    """
+    In-process SMTP server that swallows mail.
+
+    Args:
+        host: Address to listen on
+        port: Port to listen on (0 picks a free port)
+        latency: Seconds each reply is delayed (simulated round trip)
+        pipelining: Advertise ESMTP PIPELINING
+        keep_messages: Keep (mail_from, recipients, data) of every message in `messages`
+        error_rate: Share of recipients refused (0.0 - 1.0)
+        error_code: Reply code of refused recipients (4xx transient, 5xx permanent)
+        error_limit: Refuse at most this many recipients (None for no limit)
+        drop_every: Close the connection after every N messages (0 never), as servers
+            that limit the messages per session do
+        seed: Seed of the error injection, for repeatable runs
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, pipelining=True, keep_messages=False,
+                 error_rate=0.0, error_code=451, error_limit=None, drop_every=0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.pipelining = pipelining
+        self.keep_messages = keep_messages
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.error_limit = error_limit
+        self.drop_every = drop_every
+        self.messages = []
+        self.message_count = 0
+        self.recipient_count = 0
+        self.refused_count = 0
+        self.bytes_received = 0
+        self.session_count = 0
+        self._random = random.Random(seed)
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        # Start listening on a background event loop; returns the port
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="smtp-sink", daemon=True)
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            # The whole DATA payload is read at once; allow messages up to the advertised SIZE
+            asyncio.start_server(self._handle_session, self.host, self.port, limit=MAX_MESSAGE_SIZE),
+            self._loop
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    def stop(self):
+        if self._server is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._server = None
+
+    async def _handle_session(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self.session_count += 1
+
+        def reply(line):
+            # Delayed replies keep their order; later commands are read meanwhile
+            data = line.encode('ascii') + b'\r\n'
+            if self.latency:
+                loop.call_later(self.latency, writer.write, data)
+            else:
+                writer.write(data)
+
+        reply('220 localhost ESMTP certificate mailer sink')
+        mail_from, recipients = None, []
+        session_messages = 0
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode('latin-1').rstrip('\r\n').partition(' ')
+                command = command.upper()
+
+                if command == 'EHLO':
+                    extensions = ['8BITMIME', f'SIZE {MAX_MESSAGE_SIZE}', 'AUTH PLAIN LOGIN']
+                    if self.pipelining:
+                        extensions.append('PIPELINING')
+                    reply('250-localhost')
+                    for extension in extensions[:-1]:
+                        reply(f'250-{extension}')
+                    reply(f'250 {extensions[-1]}')
+                elif command == 'HELO':
+                    reply('250 localhost')
+                elif command == 'AUTH':
+                    reply('235 Authentication successful')
+                elif command == 'MAIL':
+                    mail_from, recipients = argument.partition(':')[2].strip('<> '), []
+                    reply('250 OK')
+                elif command == 'RCPT':
+                    refusing = self.error_limit is None or self.refused_count < self.error_limit
+                    if refusing and self.error_rate and self._random.random() < self.error_rate:
+                        self.refused_count += 1
+                        reply(f'{self.error_code} Recipient refused by the sink')
+                        continue
+                    recipients.append(argument.partition(':')[2].strip('<> '))
+                    reply('250 OK')
+                elif command == 'DATA':
+                    if not recipients:
+                        reply('554 No valid recipients')
+                        continue
+                    reply('354 End data with <CR><LF>.<CR><LF>')
+                    data = await reader.readuntil(b'\r\n.\r\n')
+                    self.message_count += 1
+                    self.recipient_count += len(recipients)
+                    self.bytes_received += len(data)
+                    if self.keep_messages:
+                        self.messages.append((mail_from, recipients, data[:-5].replace(b'\r\n..', b'\r\n.')))
+                    mail_from, recipients = None, []
+                    reply('250 OK: queued')
+                    session_messages += 1
+                    if self.drop_every and session_messages % self.drop_every == 0:
+                        # Hang up without a 221, as a dropped connection
+                        break
+                elif command == 'RSET':
+                    mail_from, recipients = None, []
+                    reply('250 OK')
+                elif command == 'NOOP':
+                    reply('250 OK')
+                elif command == 'QUIT':
+                    reply('221 Bye')
+                    break
+                else:
+                    reply('502 Command not implemented')
+
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
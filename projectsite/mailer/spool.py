@@ -0,0 +1,147 @@
+import os
+import base64
+from email.message import MIMEPart
+from django.core.files.move import file_move_safe
+
+# ============================================================
+# DISK SPOOL AND STREAMING ATTACHMENTS
+# ============================================================
+# Certificates are spooled to disk when they are uploaded and are only
+# opened while their email is being built, so memory use does not grow
+# with the number of certificates in a batch. Attachments are read and
+# base64-encoded in chunks instead of reading the whole PDF at once.
+# Certificates uploaded as a ZIP archive are streamed out of the stored
+# archive one entry at a time; the archive is never extracted as a whole.
+# ============================================================
+
+# 57 raw bytes encode to exactly one 76-character base64 line
+BASE64_LINE_BYTES = 57
+STREAM_CHUNK_SIZE = BASE64_LINE_BYTES * 1024
+
+
+# A certificate stored on disk (opened only while it is being read)
+class SpooledCertificate:
+    def __init__(self, path, name=None, batch_item=None):
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.batch_item = batch_item
+
+    def __repr__(self):
+        return f"<SpooledCertificate: {self.name}>"
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def chunks(self, chunk_size=STREAM_CHUNK_SIZE):
+        with open(self.path, 'rb') as spooled_file:
+            while True:
+                data = spooled_file.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+    def read(self):
+        # Compatibility with file objects; prefer chunks()
+        with open(self.path, 'rb') as spooled_file:
+            return spooled_file.read()
+
+    def close(self):
+        # Nothing is held open between reads
+        pass
+
+
+# A certificate inside a stored ZIP archive (decompressed chunk by chunk when sent).
+# The ZipFile is shared by all entries; zipfile supports reading entries from
+# several threads at once.
+class ArchivedCertificate:
+    def __init__(self, archive, info, name=None, batch_item=None):
+        self.archive = archive
+        self.info = info
+        self.name = name or os.path.basename(info.filename)
+        self.batch_item = batch_item
+
+    def __repr__(self):
+        return f"<ArchivedCertificate: {self.name}>"
+
+    @property
+    def size(self):
+        return self.info.file_size
+
+    def chunks(self, chunk_size=STREAM_CHUNK_SIZE):
+        with self.archive.open(self.info) as entry:
+            while True:
+                data = entry.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+    def read(self):
+        # Compatibility with file objects; prefer chunks()
+        return self.archive.read(self.info)
+
+    def close(self):
+        # The archive is closed by whoever opened it
+        pass
+
+
+def spool_upload(uploaded_file, destination):
+    """
+    Store an uploaded file at `destination`.
+
+    Uploads already spooled by Django's TemporaryFileUploadHandler are moved
+    into place without copying; in-memory uploads are written in chunks.
+    """
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        file_move_safe(uploaded_file.temporary_file_path(), destination, allow_overwrite=True)
+    else:
+        with open(destination, 'wb') as spooled_file:
+            for chunk in uploaded_file.chunks():
+                spooled_file.write(chunk)
+
+
+def iter_base64_lines(chunks):
+    # Base64-encode a stream of byte chunks into 76-character lines
+    remainder = b''
+    for chunk in chunks:
+        data = remainder + chunk
+        cut = len(data) - len(data) % BASE64_LINE_BYTES
+        remainder = data[cut:]
+        if cut:
+            yield base64.encodebytes(data[:cut]).decode('ascii')
+    if remainder:
+        yield base64.encodebytes(remainder).decode('ascii')
+
+
+def iter_digested(chunks, digest):
+    # Pass chunks through unchanged, adding each one to a hashlib digest
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def build_pdf_attachment(certificate_file, digest=None):
+    """
+    Build the MIME part of a certificate, encoding the file chunk by chunk.
+
+    Args:
+        certificate_file: SpooledCertificate, UploadedFile or File object
+        digest: Optional hashlib object updated with the file content in
+            the same pass (no second read of the file)
+
+    Returns:
+        MIMEPart: application/pdf attachment with a base64 payload
+    """
+    if hasattr(certificate_file, 'chunks'):
+        chunks = certificate_file.chunks(STREAM_CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: certificate_file.read(STREAM_CHUNK_SIZE), b'')
+    if digest is not None:
+        chunks = iter_digested(chunks, digest)
+
+    attachment = MIMEPart()
+    attachment['Content-Type'] = 'application/pdf'
+    attachment['Content-Transfer-Encoding'] = 'base64'
+    attachment.add_header('Content-Disposition', 'attachment', filename=os.path.basename(certificate_file.name))
+    attachment.set_payload(''.join(iter_base64_lines(chunks)))
+    return attachment
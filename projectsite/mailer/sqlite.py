@@ -0,0 +1,39 @@
+from django.conf import settings
+
+# ============================================================
+# SQLITE CONNECTION SETTINGS
+# ============================================================
+# The web server and the `process_batches` workers write to the same SQLite
+# file. Every new SQLite connection is set up so they don't trip over each
+# other:
+#   - journal_mode=WAL: readers no longer block the writer (and vice versa),
+#     so page loads continue while a batch is writing its logs
+#   - busy_timeout: a writer waits up to SQLITE_BUSY_TIMEOUT ms for the
+#     write lock instead of failing with "database is locked"
+#   - synchronous=NORMAL: one fsync per checkpoint instead of per commit;
+#     with WAL a power loss can lose the last commits but never corrupts
+#     the database
+# Transactions also start with BEGIN IMMEDIATE (`transaction_mode` in
+# DATABASES), so a transaction that reads before it writes waits for the
+# write lock up front instead of failing when it tries to upgrade.
+# ============================================================
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    # connection_created handler
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = []
+    if getattr(settings, 'SQLITE_WAL', True):
+        pragmas.append('PRAGMA journal_mode=WAL')
+    busy_timeout = getattr(settings, 'SQLITE_BUSY_TIMEOUT', 20000)
+    if busy_timeout is not None:
+        pragmas.append(f'PRAGMA busy_timeout={int(busy_timeout)}')
+    synchronous = getattr(settings, 'SQLITE_SYNCHRONOUS', 'NORMAL')
+    if synchronous:
+        pragmas.append(f'PRAGMA synchronous={synchronous}')
+
+    with connection.cursor() as cursor:
+        for pragma in pragmas:
+            cursor.execute(pragma)
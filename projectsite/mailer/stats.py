@@ -0,0 +1,147 @@
+from datetime import date
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import EmailLog, ArchivedEmailLog, DailySendStats
+from .archive import get_academic_terms
+
+# ============================================================
+# DAILY SEND STATISTICS
+# ============================================================
+# DailySendStats holds one row per (day, college, template, status) with
+# the number of email logs and their total SMTP time. Every EmailLog
+# write adds to it in the same transaction (one UPDATE per touched row,
+# not per email, when a batch flushes its log buffer), so reports read a
+# few hundred rows per year instead of aggregating the log table.
+# `manage.py rebuild_send_stats` recomputes it from the email logs and
+# the archive.
+#
+# Rows are keyed by the template's name, not its id: archived logs only
+# keep the name. New logs are counted under the name the template has
+# when they are sent, so renaming a template starts a new series and the
+# earlier rows keep the old name. A rebuild can only see the current name
+# of the logs still in EmailLog (and the name stored at archive time for
+# archived ones), so it moves their counts to the template's new name.
+# ============================================================
+
+
+class SendStatsDelta:
+    """
+    Changes to DailySendStats collected from new email logs.
+
+    Add logs with add(), then write all changes with apply().
+    """
+
+    def __init__(self):
+        self._totals = {}
+
+    def __bool__(self):
+        return bool(self._totals)
+
+    def add(self, log):
+        key = (
+            timezone.localdate(log.sent_at),
+            log.college,
+            log.template_used.name if log.template_used else '',
+            log.status,
+        )
+        totals = self._totals.setdefault(key, [0, 0, 0.0])
+        totals[0] += 1
+        if log.smtp_seconds is not None:
+            totals[1] += 1
+            totals[2] += log.smtp_seconds
+
+    def apply(self):
+        # Increment existing rows, create missing ones (an upsert that adds)
+        for (day, college, template_name, status), (count, smtp_count, smtp_seconds) in self._totals.items():
+            key = {'day': day, 'college': college, 'template_name': template_name, 'status': status}
+            increments = {
+                'count': F('count') + count,
+                'smtp_count': F('smtp_count') + smtp_count,
+                'smtp_seconds': F('smtp_seconds') + smtp_seconds,
+            }
+            if DailySendStats.objects.filter(**key).update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    DailySendStats.objects.create(
+                        count=count, smtp_count=smtp_count, smtp_seconds=smtp_seconds, **key
+                    )
+            except IntegrityError:
+                # Created by another process in the meantime
+                DailySendStats.objects.filter(**key).update(**increments)
+        self._totals = {}
+
+
+def record_send_stats(logs):
+    # Add new email logs to the daily statistics
+    delta = SendStatsDelta()
+    for log in logs:
+        delta.add(log)
+    delta.apply()
+
+
+def rebuild_send_stats(since=None, until=None):
+    """
+    Recompute DailySendStats from EmailLog and ArchivedEmailLog.
+
+    Live logs are grouped by their template's current name and archived
+    logs by the name stored when they were archived.
+
+    Args:
+        since: First day to rebuild (None: from the oldest log)
+        until: Last day to rebuild (None: up to today)
+
+    Returns:
+        int: Number of statistics rows written
+    """
+    sources = [
+        (EmailLog.objects.all(), 'template_used__name'),
+        (ArchivedEmailLog.objects.all(), 'template_name'),
+    ]
+    stats = DailySendStats.objects.all()
+    if since:
+        stats = stats.filter(day__gte=since)
+        sources = [(logs.filter(sent_at__date__gte=since), field) for logs, field in sources]
+    if until:
+        stats = stats.filter(day__lte=until)
+        sources = [(logs.filter(sent_at__date__lte=until), field) for logs, field in sources]
+
+    # Logs written while rebuilding would be counted twice or not at all;
+    # run it while no batch is being sent
+    totals = {}
+    with transaction.atomic():
+        for logs, template_field in sources:
+            rows = logs.annotate(
+                day=TruncDate('sent_at'),
+                template=F(template_field),
+            ).values('day', 'college', 'template', 'status').annotate(
+                count=Count('id'),
+                smtp_count=Count('smtp_seconds'),
+                smtp_seconds=Sum('smtp_seconds'),
+            ).order_by()
+            for row in rows:
+                key = (row['day'], row['college'], row['template'] or '', row['status'])
+                current = totals.setdefault(key, [0, 0, 0.0])
+                current[0] += row['count']
+                current[1] += row['smtp_count']
+                current[2] += row['smtp_seconds'] or 0.0
+
+        stats.delete()
+        DailySendStats.objects.bulk_create([
+            DailySendStats(
+                day=day, college=college, template_name=template_name, status=status,
+                count=count, smtp_count=smtp_count, smtp_seconds=smtp_seconds
+            )
+            for (day, college, template_name, status), (count, smtp_count, smtp_seconds) in totals.items()
+        ], batch_size=500)
+    return len(totals)
+
+
+def get_academic_year_start(today=None):
+    # First day of the current academic year (first month of ACADEMIC_TERMS)
+    today = today or timezone.localdate()
+    first_month = get_academic_terms()[0][0]
+    year = today.year if today.month >= first_month else today.year - 1
+    return date(year, first_month, 1)
@@ -0,0 +1,17 @@
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+from django import template
+from mailer.changelists import cached_date_hierarchy
+
+register = template.Library()
+
+
+@register.tag(name='cached_date_hierarchy')
+def cached_date_hierarchy_tag(parser, token):
+    # Same output as admin's {% date_hierarchy cl %}, cached (see mailer.changelists)
+    return InclusionAdminNode(
+        parser,
+        token,
+        func=cached_date_hierarchy,
+        template_name='date_hierarchy.html',
+        takes_context=False,
+    )
@@ -1,3 +1,1671 @@
-from django.test import TestCase
+import os
+import base64
+import asyncio
+import hashlib
+import json
+import signal
+import shutil
+import smtplib
+import threading
+import time
+import gzip
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.models.query import QuerySet
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from mailer import metrics, ratelimit, utils
+from mailer.changelists import EstimatedCountPaginator
+from mailer.archive import archive_email_logs, get_academic_term
+from mailer.models import (
+    EmailTemplate, EmailConfiguration, CertificateBatch, BatchItem, EmailLog, ArchivedEmailLog, DailySendStats
+)
+from mailer.backends import AsyncSMTPBackend, AsyncSMTPSession
+from mailer.events import (
+    batch_snapshot, get_progress_path, publish_batch_progress, read_batch_progress, stream_batch_events
+)
+from mailer.jobs import BatchInProgressError, enqueue_batch, claim_next_batch, run_batch, requeue_batch
+from mailer.search import FTS_TABLE, build_fts_query, ensure_fts_index, fts_available, search_email_logs
+from mailer.retry import RetryPolicy, RetryQueue
+from mailer.ratelimit import AdaptiveRateLimiter, NoRateLimiter, TokenBucket, get_rate_limiter
+from mailer.utils import scan_certificate_archive, send_certificate_email, send_certificates_batch, render_certificate_email, EmailLogBuffer, BatchProgress, RenderedEmail
+from mailer.messages import CertificateMessageFactory
+from mailer.smtp_sink import SMTPSink
+from mailer.timing import BUCKET_BOUNDS_MS, NULL_TIMER, StageTimer, get_stage_timer
+from mailer.stats import SendStatsDelta, rebuild_send_stats
+from mailer.preflight import run_preflight, simulate_send_time
+from mailer.spool import (
+    STREAM_CHUNK_SIZE, ArchivedCertificate, SpooledCertificate, build_pdf_attachment, iter_base64_lines, spool_upload
+)
 
-# Create your tests here.
+
+def make_certificate(student_id, content=None):
+    # Uploaded PDF named the way students' certificates are
+    return SimpleUploadedFile(f'{student_id}.pdf', content or b'%PDF-1.4\n' + student_id.encode() + b'\n%%EOF\n')
+
+
+# Batches sent through the real SMTP backend to an in-process sink.
+# The pool's threads use their own database connections, hence TransactionTestCase.
+class SinkTestCase(TransactionTestCase):
+    sink_options = {}
+    pool_size = 2
+    rate_limit_per_minute = 0
+
+    def setUp(self):
+        work_dir = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+
+        self.sink = SMTPSink(keep_messages=True, seed=0, **self.sink_options)
+        self.sink.start()
+        self.addCleanup(self.sink.stop)
+
+        settings_override = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.sink.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            CERTIFICATE_UPLOAD_ROOT=os.path.join(work_dir, 'uploads'),
+            CERTIFICATE_TESTING_MODE=False,
+            MAILER_METRICS_DIR=os.path.join(work_dir, 'metrics'),
+            EMAIL_RETRY_BASE_DELAY=0.1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Worker commands would keep syncing metrics (and retire them at exit) after the test
+        for command in ('process_batches', 'resume_batch'):
+            patcher = mock.patch(f'mailer.management.commands.{command}.start_metrics_sync')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Rate limiters are process-wide; every test starts without a pause
+        ratelimit._rate_limiters.clear()
+        self.addCleanup(ratelimit._rate_limiters.clear)
+        EmailConfiguration.clear_cache()
+        self.addCleanup(EmailConfiguration.clear_cache)
+
+        config = EmailConfiguration.get_config()
+        config.from_email = 'certificates@example.com'
+        config.smtp_pool_size = self.pool_size
+        config.rate_limit_per_minute = self.rate_limit_per_minute
+        config.save()
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Your certificate',
+            header_message='Certificate', body_content='Please find your certificate attached.'
+        )
+
+    def send_batch(self, certificate_files):
+        # Queue a batch and send it the way the worker does
+        batch = CertificateBatch.objects.create(template_used=self.template, total_certificates=len(certificate_files))
+        enqueue_batch(batch, certificate_files)
+        run_batch(claim_next_batch())
+        batch.refresh_from_db()
+        return batch
+
+    def sent_recipients(self):
+        # Recipients of every message the sink accepted, in arrival order
+        return [recipient for _, recipients, _ in self.sink.messages for recipient in recipients]
+
+
+class PoolTests(SinkTestCase):
+    pool_size = 3
+
+    def test_batch_is_sent_over_pool_connections(self):
+        batch = self.send_batch([make_certificate(f'2000-1-{number:04d}') for number in range(6)])
+
+        self.assertEqual((batch.status, batch.successful_sends, batch.failed_sends), ('completed', 6, 0))
+        self.assertCountEqual(
+            self.sent_recipients(), [f'20001{number:04d}@psu.palawan.edu.ph' for number in range(6)]
+        )
+        # One persistent session per connection
+        self.assertEqual(self.sink.session_count, 3)
+
+    def test_errors_are_reported_in_file_order(self):
+        certificate_files = [
+            make_certificate('2000-1-0001'),
+            SimpleUploadedFile('notes.txt', b'not a certificate'),
+            make_certificate('2000-1-0002'),
+            SimpleUploadedFile('photo.jpg', b'not a certificate'),
+        ]
+        results = send_certificates_batch(certificate_files, self.template)
+
+        self.assertEqual((results['successful'], results['failed']), (2, 2))
+        self.assertEqual([error['student_id'] for error in results['errors']], ['notes.txt', 'photo.jpg'])
+
+
+class PoolReconnectTests(SinkTestCase):
+    # Every session is dropped after two messages
+    sink_options = {'drop_every': 2}
+    pool_size = 2
+
+    def test_dropped_connections_are_reopened(self):
+        batch = self.send_batch([make_certificate(f'2000-1-{number:04d}') for number in range(8)])
+
+        self.assertEqual((batch.status, batch.successful_sends), ('completed', 8))
+        self.assertEqual(self.sink.message_count, 8)
+        self.assertGreater(self.sink.session_count, 2)
+        # Reconnecting is part of the send, not a retried attempt
+        self.assertFalse(EmailLog.objects.exclude(status='success').exists())
+
+
+class QueueTests(SinkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # process_batches installs its own SIGTERM handler
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_upload_is_queued_and_sent_by_the_worker(self):
+        response = self.client.post(reverse('send_certificates'), {
+            'template': self.template.pk,
+            'certificates': [make_certificate('2000-1-0001'), make_certificate('2000-1-0002')],
+        })
+
+        # The request only queues the batch
+        self.assertEqual(response.status_code, 302)
+        batch = CertificateBatch.objects.get()
+        self.assertEqual((batch.status, batch.total_certificates), ('pending', 2))
+        self.assertEqual(self.sink.message_count, 0)
+
+        call_command('process_batches', '--once', stdout=StringIO())
+
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.successful_sends), ('completed', 2))
+        self.assertCountEqual(
+            self.sent_recipients(), ['200010001@psu.palawan.edu.ph', '200010002@psu.palawan.edu.ph']
+        )
+
+    def test_worker_exits_when_the_queue_is_empty(self):
+        output = StringIO()
+        call_command('process_batches', '--once', stdout=output)
+
+        self.assertNotIn('Processing batch', output.getvalue())
+
+
+class RenderCacheTests(TestCase):
+
+    def setUp(self):
+        utils._rendered_email_cache.clear()
+        self.addCleanup(utils._rendered_email_cache.clear)
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Your certificate',
+            header_message='Certificate', body_content='Please find your certificate attached.'
+        )
+
+    def test_template_is_rendered_once(self):
+        with mock.patch('mailer.utils.render_to_string', wraps=utils.render_to_string) as render:
+            first = render_certificate_email(self.template)
+            second = render_certificate_email(EmailTemplate.objects.get(pk=self.template.pk))
+
+        self.assertIs(first, second)
+        self.assertEqual(render.call_count, 1)
+
+    def test_saved_changes_are_rendered(self):
+        render_certificate_email(self.template)
+        self.template.body_content = 'Congratulations on finishing the course.'
+        self.template.save()
+
+        rendered = render_certificate_email(self.template)
+
+        self.assertIn('Congratulations on finishing the course.', rendered.text_body)
+        self.assertIn('Congratulations on finishing the course.', rendered.html_body)
+
+    def test_unsaved_template_is_not_cached(self):
+        template = EmailTemplate(name='Draft', college='CS', subject='Draft', header_message='Draft', body_content='')
+        render_certificate_email(template)
+
+        self.assertEqual(len(utils._rendered_email_cache), 0)
+
+    @override_settings(EMAIL_RENDER_CACHE_SIZE=2)
+    def test_least_recently_used_template_is_evicted(self):
+        templates = [self.template] + [
+            EmailTemplate.objects.create(name=f'Test {number}', college='CS', subject='Subject',
+                                         header_message='Header', body_content='Body')
+            for number in range(2)
+        ]
+        for template in templates:
+            render_certificate_email(template)
+
+        self.assertEqual(
+            list(utils._rendered_email_cache),
+            [(template.pk, template.updated_at, template.college) for template in templates[1:]]
+        )
+
+
+class EmailConfigurationCacheTests(TestCase):
+
+    def setUp(self):
+        EmailConfiguration.clear_cache()
+        self.addCleanup(EmailConfiguration.clear_cache)
+        EmailConfiguration.get_config()
+
+    def change_in_another_process(self, **fields):
+        # Queryset updates send no signals, like a save made by another process
+        EmailConfiguration.objects.filter(pk=1).update(updated_at=timezone.now(), **fields)
+
+    def test_config_is_cached_within_the_ttl(self):
+        self.change_in_another_process(from_name='Registrar')
+
+        with self.assertNumQueries(0):
+            config = EmailConfiguration.get_config()
+        self.assertNotEqual(config.from_name, 'Registrar')
+
+    @override_settings(EMAIL_CONFIG_CACHE_TTL=0)
+    def test_unchanged_config_is_revalidated_with_one_query(self):
+        cached = EmailConfiguration.get_config()
+
+        with self.assertNumQueries(1):
+            self.assertIs(EmailConfiguration.get_config(), cached)
+
+    @override_settings(EMAIL_CONFIG_CACHE_TTL=0)
+    def test_changes_from_another_process_are_picked_up_after_the_ttl(self):
+        self.change_in_another_process(from_name='Registrar')
+
+        self.assertEqual(EmailConfiguration.get_config().from_name, 'Registrar')
+
+    def test_saving_clears_the_cache(self):
+        config = EmailConfiguration.objects.get(pk=1)
+        config.from_name = 'Registrar'
+        config.save()
+
+        self.assertEqual(EmailConfiguration.get_config().from_name, 'Registrar')
+
+
+class EmailLogBufferTests(TestCase):
+
+    def setUp(self):
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Your certificate',
+            header_message='Certificate', body_content='Please find your certificate attached.'
+        )
+
+    def add_log(self, log_buffer, student_id='2000-1-0001'):
+        log_buffer.add(
+            student_id=student_id, email=f"{student_id.replace('-', '')}@psu.palawan.edu.ph",
+            certificate_filename=f'{student_id}.pdf', template_used=self.template,
+            college='CS', status='success',
+        )
+
+    def test_rows_are_written_together_when_the_buffer_is_full(self):
+        log_buffer = EmailLogBuffer(flush_size=3, flush_interval=3600)
+        self.addCleanup(log_buffer.close)
+        self.add_log(log_buffer, '2000-1-0001')
+        self.add_log(log_buffer, '2000-1-0002')
+        self.assertEqual(EmailLog.objects.count(), 0)
+
+        self.add_log(log_buffer, '2000-1-0003')
+
+        self.assertEqual(EmailLog.objects.count(), 3)
+        self.assertEqual(len(log_buffer), 0)
+
+    def test_close_writes_the_remaining_rows(self):
+        with EmailLogBuffer(flush_size=50, flush_interval=3600) as log_buffer:
+            self.add_log(log_buffer)
+            self.assertEqual(EmailLog.objects.count(), 0)
+
+        self.assertEqual(EmailLog.objects.count(), 1)
+        self.assertNotIn(log_buffer, utils._active_log_buffers)
+
+    def test_rows_are_kept_when_a_flush_fails(self):
+        log_buffer = EmailLogBuffer(auto_flush=False)
+        self.addCleanup(log_buffer.close)
+        self.add_log(log_buffer)
+
+        with mock.patch.object(EmailLog.objects, 'bulk_create', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                log_buffer.flush()
+        self.assertEqual(len(log_buffer), 1)
+
+        log_buffer.flush()
+        self.assertEqual(EmailLog.objects.count(), 1)
+
+    def test_open_buffers_are_flushed_at_exit(self):
+        log_buffer = EmailLogBuffer(auto_flush=False)
+        self.add_log(log_buffer)
+
+        utils._flush_log_buffers_at_exit()
+
+        self.assertEqual(EmailLog.objects.count(), 1)
+        self.assertNotIn(log_buffer, utils._active_log_buffers)
+
+
+class BatchProgressTests(TestCase):
+
+    def setUp(self):
+        self.batch = CertificateBatch.objects.create(total_certificates=10, status='processing')
+
+    def saved_counts(self):
+        self.batch.refresh_from_db()
+        return self.batch.successful_sends, self.batch.failed_sends
+
+    def test_counters_are_written_every_few_emails(self):
+        progress = BatchProgress(self.batch, every=3, interval=3600)
+        progress.record(True)
+        progress.record(False)
+        self.assertEqual(self.saved_counts(), (0, 0))
+
+        progress.record(True)
+        self.assertEqual(self.saved_counts(), (2, 1))
+
+    def test_increments_leave_other_fields_alone(self):
+        progress = BatchProgress(self.batch, every=1, interval=3600)
+        # Changed elsewhere while the batch is sending
+        CertificateBatch.objects.filter(pk=self.batch.pk).update(error_details='Cancelled by admin')
+
+        progress.record(True)
+
+        self.assertEqual(self.saved_counts(), (1, 0))
+        self.assertEqual(self.batch.error_details, 'Cancelled by admin')
+
+    def test_finish_writes_exact_totals(self):
+        progress = BatchProgress(self.batch, every=3, interval=3600)
+        progress.record(True)
+
+        progress.finish(successful=7, failed=3)
+
+        self.assertEqual(self.saved_counts(), (7, 3))
+
+    def test_finish_counts_item_checkpoints(self):
+        items = [
+            BatchItem.objects.create(batch=self.batch, position=position, certificate_filename=f'{position}.pdf')
+            for position in range(3)
+        ]
+        progress = BatchProgress(self.batch, every=50, interval=3600)
+        progress.record(True, items[0])
+        progress.record(False, items[1])
+        progress.record(False, items[2], skipped=True)
+
+        progress.finish(successful=0, failed=0)
+
+        self.assertEqual(self.saved_counts(), (1, 2))
+        self.assertEqual(
+            list(self.batch.items.values_list('status', flat=True)), ['sent', 'failed', 'skipped']
+        )
+
+    def test_logs_are_rolled_back_with_their_checkpoints(self):
+        item = BatchItem.objects.create(batch=self.batch, position=1, certificate_filename='2000-1-0001.pdf')
+        log_buffer = EmailLogBuffer(flush_size=100, auto_flush=False)
+        self.addCleanup(log_buffer.close)
+        progress = BatchProgress(self.batch, log_buffer=log_buffer, every=50, interval=3600)
+        log_buffer.add(student_id='2000-1-0001', email='20001@example.com',
+                       certificate_filename='2000-1-0001.pdf', status='success')
+        progress.record(True, item)
+
+        with mock.patch.object(CertificateBatch.objects, 'filter', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                progress.flush()
+        self.assertEqual(EmailLog.objects.count(), 0)
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'pending')
+
+        # The next flush writes the log together with its checkpoint
+        progress.flush()
+
+        self.assertEqual(EmailLog.objects.count(), 1)
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'sent')
+        self.assertEqual(self.saved_counts(), (1, 0))
+
+def throttle_error():
+    return smtplib.SMTPRecipientsRefused({'a@example.com': (421, b'Too many connections')})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class BackoffTests(SimpleTestCase):
+    def make_limiter(self, clock):
+        return AdaptiveRateLimiter(rate=10, burst=10, backoff=30, max_backoff=100, clock=clock.time, sleep=clock.sleep)
+
+    def test_throttling_pauses_with_doubling_backoff(self):
+        clock = FakeClock()
+        limiter = self.make_limiter(clock)
+
+        self.assertTrue(limiter.on_error(throttle_error()))
+        self.assertEqual(limiter.cooldown_remaining(), 30)
+        self.assertEqual(limiter.rate, 5)
+        clock.now = 30
+        limiter.on_error(throttle_error())
+        self.assertEqual(limiter.cooldown_remaining(), 60)
+        clock.now = 90
+        limiter.on_error(throttle_error())
+        # Capped at max_backoff
+        self.assertEqual(limiter.cooldown_remaining(), 100)
+
+        # The next send waits out the pause
+        self.assertEqual(limiter.acquire(), 100)
+        self.assertEqual(limiter.cooldown_remaining(), 0)
+
+    def test_success_resets_the_backoff(self):
+        clock = FakeClock()
+        limiter = self.make_limiter(clock)
+        limiter.on_error(throttle_error())
+        clock.now = 30
+        limiter.on_success()
+        limiter.on_error(throttle_error())
+        self.assertEqual(limiter.cooldown_remaining(), 30)
+
+    def test_other_errors_do_not_pause(self):
+        limiter = self.make_limiter(FakeClock())
+        refused = smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'No such user')})
+        self.assertFalse(limiter.on_error(refused))
+        self.assertEqual(limiter.cooldown_remaining(), 0)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_is_sent_back_to_back_then_paced(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock.time, sleep=clock.sleep)
+
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0, 0, 0])
+        self.assertEqual(bucket.acquire(), 0.5)
+        self.assertEqual(clock.now, 0.5)
+
+    def test_idle_time_refills_up_to_the_burst(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, burst=2, clock=clock.time, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        clock.now = 60
+
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0, 0, 1])
+
+    def test_limiter_is_shared_per_sender_account(self):
+        ratelimit._rate_limiters.clear()
+        self.addCleanup(ratelimit._rate_limiters.clear)
+
+        limiter = get_rate_limiter('certificates@example.com', 48, 80)
+        self.assertIs(get_rate_limiter('certificates@example.com', 48, 80), limiter)
+        # A changed configuration replaces the account's limiter
+        self.assertIsNot(get_rate_limiter('certificates@example.com', 60, 80), limiter)
+        self.assertEqual(len(ratelimit._rate_limiters), 1)
+        self.assertIsInstance(get_rate_limiter('certificates@example.com', 0, 80), NoRateLimiter)
+
+
+class SpoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        # Spans several read chunks and ends mid base64 line
+        self.content = os.urandom(STREAM_CHUNK_SIZE * 2 + 1000)
+
+    def test_chunked_encoding_matches_whole_file_encoding(self):
+        chunks = [self.content[:100], self.content[100:5000], self.content[5000:]]
+
+        self.assertEqual(''.join(iter_base64_lines(chunks)), base64.encodebytes(self.content).decode('ascii'))
+
+    def test_spooled_certificate_is_attached_and_hashed_in_one_pass(self):
+        path = os.path.join(self.work_dir, '2000-1-0001.pdf')
+        with open(path, 'wb') as certificate:
+            certificate.write(self.content)
+        digest = hashlib.sha256()
+
+        attachment = build_pdf_attachment(SpooledCertificate(path), digest=digest)
+
+        self.assertEqual(attachment.get_content_type(), 'application/pdf')
+        self.assertEqual(attachment.get_filename(), '2000-1-0001.pdf')
+        self.assertEqual(attachment.get_payload(decode=True), self.content)
+        self.assertEqual(digest.hexdigest(), hashlib.sha256(self.content).hexdigest())
+
+    def test_archive_entry_is_streamed(self):
+        path = os.path.join(self.work_dir, 'certificates.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('cs/2000-1-0001.pdf', self.content)
+
+        with zipfile.ZipFile(path) as archive:
+            certificate = ArchivedCertificate(archive, archive.getinfo('cs/2000-1-0001.pdf'))
+            self.assertEqual(certificate.name, '2000-1-0001.pdf')
+            self.assertEqual(certificate.size, len(self.content))
+            self.assertEqual(build_pdf_attachment(certificate).get_payload(decode=True), self.content)
+
+    def test_temporary_upload_is_moved_not_copied(self):
+        upload = TemporaryUploadedFile('2000-1-0001.pdf', 'application/pdf', len(self.content), None)
+        upload.write(self.content)
+        upload.flush()
+        temporary_path = upload.temporary_file_path()
+        destination = os.path.join(self.work_dir, 'stored.pdf')
+
+        spool_upload(upload, destination)
+        # Like the request does at the end of the upload
+        upload.close()
+
+        self.assertFalse(os.path.exists(temporary_path))
+        with open(destination, 'rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_memory_upload_is_written_to_disk(self):
+        destination = os.path.join(self.work_dir, 'stored.pdf')
+
+        spool_upload(SimpleUploadedFile('2000-1-0001.pdf', self.content), destination)
+
+        self.assertEqual(SpooledCertificate(destination).read(), self.content)
+
+
+def make_archive(entries):
+    # In-memory ZIP upload of {entry name: content}
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in entries.items():
+            archive.writestr(name, content)
+    return SimpleUploadedFile('certificates.zip', buffer.getvalue(), content_type='application/zip')
+
+
+@override_settings(CERTIFICATE_TESTING_MODE=False, CERTIFICATE_MAX_FILE_SIZE=1024)
+class CertificateArchiveTests(TestCase):
+
+    def scan(self, entries):
+        with zipfile.ZipFile(make_archive(entries)) as archive:
+            valid, errors = scan_certificate_archive(archive)
+        return [info.filename for info in valid], errors
+
+    def test_certificates_in_folders_are_accepted(self):
+        valid, errors = self.scan({
+            '2000-1-0001.pdf': b'%PDF-1.4',
+            'cs/2000-1-0002.pdf': b'%PDF-1.4',
+            '__MACOSX/cs/._2000-1-0002.pdf': b'metadata',
+            'cs/.DS_Store': b'metadata',
+        })
+
+        self.assertEqual(valid, ['2000-1-0001.pdf', 'cs/2000-1-0002.pdf'])
+        self.assertEqual(errors, [])
+
+    def test_non_pdf_and_nested_archives_are_rejected(self):
+        valid, errors = self.scan({
+            '2000-1-0001.pdf': b'%PDF-1.4',
+            'list.xlsx': b'spreadsheet',
+            'more.zip': make_archive({'2000-1-0002.pdf': b'%PDF-1.4'}).read(),
+        })
+
+        self.assertEqual(valid, ['2000-1-0001.pdf'])
+        self.assertEqual(errors, [
+            "'list.xlsx' in the ZIP archive is not a PDF file.",
+            "'more.zip' in the ZIP archive is not a PDF file.",
+        ])
+
+    def test_oversized_entries_are_rejected(self):
+        valid, errors = self.scan({'2000-1-0001.pdf': b'%PDF-1.4', '2000-1-0002.pdf': b'x' * 2048})
+
+        self.assertEqual(valid, ['2000-1-0001.pdf'])
+        self.assertEqual(len(errors), 1)
+        self.assertIn("'2000-1-0002.pdf'", errors[0])
+
+    def test_uploaded_archive_is_queued_one_item_per_certificate(self):
+        upload_root = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, upload_root, ignore_errors=True)
+        template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Your certificate', header_message='Certificate', body_content=''
+        )
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        with override_settings(CERTIFICATE_UPLOAD_ROOT=upload_root):
+            self.client.post(reverse('send_certificates'), {
+                'template': template.pk,
+                'certificates': [make_archive({'2000-1-0001.pdf': b'%PDF-1.4', 'cs/2000-1-0002.pdf': b'%PDF-1.4'})],
+            })
+
+        batch = CertificateBatch.objects.get()
+        self.assertEqual(batch.total_certificates, 2)
+        self.assertEqual(
+            list(batch.items.values_list('certificate_filename', 'archive_member')),
+            [('2000-1-0001.pdf', '2000-1-0001.pdf'), ('2000-1-0002.pdf', 'cs/2000-1-0002.pdf')]
+        )
+
+
+class CertificateMessageFactoryTests(SimpleTestCase):
+
+    def setUp(self):
+        rendered = RenderedEmail('Your certificate', 'Certificate\n\nCongratulations.', '<p>Congratulations.</p>')
+        self.factory = CertificateMessageFactory(rendered, 'Registrar <certificates@example.com>')
+
+    def attachment(self, student_id):
+        return build_pdf_attachment(make_certificate(student_id))
+
+    def test_message_has_the_shared_body_and_its_own_certificate(self):
+        message = self.factory.build('200010001@psu.palawan.edu.ph', self.attachment('2000-1-0001')).message()
+
+        self.assertEqual(message.get_content_type(), 'multipart/mixed')
+        self.assertEqual(message['To'], '200010001@psu.palawan.edu.ph')
+        self.assertEqual(message['Subject'], 'Your certificate')
+        body, certificate = message.get_payload()
+        self.assertEqual(
+            [part.get_content_type() for part in body.get_payload()], ['text/plain', 'text/html']
+        )
+        self.assertEqual(certificate.get_filename(), '2000-1-0001.pdf')
+
+    def test_messages_share_one_unchanged_body_part(self):
+        first = self.factory.build('200010001@psu.palawan.edu.ph', self.attachment('2000-1-0001'))
+        second = self.factory.build('200010002@psu.palawan.edu.ph', self.attachment('2000-1-0002'))
+        body_before = self.factory.body_part.as_bytes()
+
+        first.message().as_bytes()
+        second.message().as_bytes()
+
+        self.assertIs(first.attachments[0], second.attachments[0])
+        self.assertEqual(self.factory.body_part.as_bytes(), body_before)
+
+    def test_message_id_is_derived_from_the_idempotency_key(self):
+        message = self.factory.build('200010001@psu.palawan.edu.ph', self.attachment('2000-1-0001'),
+                                     idempotency_key='0123abcd')
+
+        self.assertEqual(message.message()['Message-ID'], '<0123abcd.certificate@example.com>')
+
+
+class ResumeTests(SinkTestCase):
+    def crash_batch(self, certificate_files, delivered):
+        """
+        Send a batch, then put it back in the state a worker killed mid-batch leaves:
+        still 'processing', the first `delivered` items left in 'sending' (their logs
+        were written, their checkpoint wasn't) and the rest never sent.
+        """
+        with mock.patch('mailer.jobs.shutil.rmtree'):
+            batch = self.send_batch(certificate_files)
+        items = list(batch.items.order_by('position'))
+        BatchItem.objects.filter(pk__in=[item.pk for item in items[:delivered]]).update(status='sending')
+        BatchItem.objects.filter(pk__in=[item.pk for item in items[delivered:]]).update(status='pending')
+        EmailLog.objects.filter(batch_item__in=items[delivered:]).delete()
+        CertificateBatch.objects.filter(pk=batch.pk).update(
+            status='processing', successful_sends=delivered, completed_at=None
+        )
+        self.sink.messages = self.sink.messages[:delivered]
+        batch.refresh_from_db()
+        return batch
+
+    def make_stale(self, batch):
+        # No checkpoint or progress snapshot for an hour: its worker is gone
+        long_ago = timezone.now() - timedelta(hours=1)
+        CertificateBatch.objects.filter(pk=batch.pk).update(started_at=long_ago)
+        batch.items.update(updated_at=long_ago)
+        progress_path = get_progress_path(batch.pk)
+        if os.path.exists(progress_path):
+            os.utime(progress_path, (long_ago.timestamp(), long_ago.timestamp()))
+        batch.refresh_from_db()
+
+    def test_resume_sends_only_what_was_not_delivered(self):
+        batch = self.crash_batch([make_certificate(f'2000-1-{number:04d}') for number in range(4)], delivered=2)
+        self.make_stale(batch)
+
+        call_command('resume_batch', str(batch.pk), '--run', stdout=StringIO())
+
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.successful_sends, batch.failed_sends), ('completed', 4, 0))
+        self.assertEqual(list(batch.items.values_list('status', flat=True)), ['sent'] * 4)
+        # Each certificate reached the server exactly once
+        self.assertCountEqual(
+            self.sent_recipients(), [f'20001{number:04d}@psu.palawan.edu.ph' for number in range(4)]
+        )
+        self.assertFalse(EmailLog.objects.filter(status='duplicate').exists())
+
+    def test_batch_of_a_live_worker_is_not_requeued(self):
+        batch = self.crash_batch([make_certificate('2000-1-0001')], delivered=1)
+
+        with self.assertRaises(BatchInProgressError):
+            requeue_batch(batch)
+        self.assertEqual(CertificateBatch.objects.get(pk=batch.pk).status, 'processing')
+
+        requeue_batch(batch, force=True)
+        self.assertEqual(CertificateBatch.objects.get(pk=batch.pk).status, 'pending')
+
+
+class RetrySchedulingTests(SimpleTestCase):
+    def test_transient_errors_are_retried_until_the_last_attempt(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=10, max_delay=300)
+        self.assertTrue(policy.should_retry(throttle_error(), 1))
+        self.assertTrue(policy.should_retry(smtplib.SMTPServerDisconnected(), 2))
+        self.assertFalse(policy.should_retry(throttle_error(), 3))
+        permanent = smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'No such user')})
+        self.assertFalse(policy.should_retry(permanent, 1))
+
+    def test_delay_doubles_with_jitter_up_to_the_maximum(self):
+        policy = RetryPolicy(max_attempts=10, base_delay=10, max_delay=60)
+        for attempt, delay in [(1, 10), (2, 20), (3, 40), (4, 60), (8, 60)]:
+            self.assertTrue(delay / 2 <= policy.delay(attempt) <= delay)
+
+    def test_queue_releases_items_when_due(self):
+        clock = FakeClock()
+        retries = RetryQueue(clock=clock.time)
+        retries.schedule(0, 'late', 20)
+        retries.schedule(1, 'early', 10)
+
+        self.assertEqual(retries.pop_due(), [])
+        clock.now = 10
+        self.assertEqual(retries.pop_due(), [(1, 'early')])
+        clock.now = 25
+        self.assertEqual(retries.pop_due(), [(0, 'late')])
+        self.assertEqual((len(retries), retries.scheduled), (0, 2))
+
+
+@override_settings(EMAIL_THROTTLE_BACKOFF=2)
+class ThrottleTests(SinkTestCase):
+    # The first recipient is refused with 421, which pauses the rate limiter
+    sink_options = {'error_rate': 1.0, 'error_code': 421, 'error_limit': 1}
+    pool_size = 1
+    rate_limit_per_minute = 600
+
+    def test_cooldown_is_published_while_throttled(self):
+        snapshots = []
+        with mock.patch('mailer.events.publish_batch_progress', lambda batch_id, snapshot: snapshots.append(snapshot)):
+            batch = self.send_batch([make_certificate('2000-1-0001'), make_certificate('2000-1-0002')])
+
+        self.assertEqual((batch.status, batch.successful_sends), ('completed', 2))
+        cooldowns = [snapshot['cooldown_seconds'] for snapshot in snapshots]
+        self.assertTrue(any(cooldown > 0 for cooldown in cooldowns), cooldowns)
+
+    def test_throttled_send_is_retried_after_the_pause(self):
+        batch = self.send_batch([make_certificate('2000-1-0001')])
+
+        self.assertEqual((batch.status, batch.successful_sends), ('completed', 1))
+        logs = EmailLog.objects.filter(student_id='2000-1-0001').order_by('attempt')
+        self.assertEqual([(log.attempt, log.status) for log in logs], [(1, 'retrying'), (2, 'success')])
+        self.assertEqual((self.sink.refused_count, self.sink.message_count), (1, 1))
+
+
+@mock.patch('mailer.events.WATCH_INTERVAL', 0.01)
+class ProgressStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        upload_root = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, upload_root, ignore_errors=True)
+        settings_override = override_settings(CERTIFICATE_UPLOAD_ROOT=upload_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.batch = CertificateBatch(pk=1, total_certificates=2, status='processing')
+
+    def collect(self, read_progress):
+        # Run the stream to its end, letting `read_progress` stand in for the snapshot reader
+        async def consume():
+            loop_thread = threading.get_ident()
+            events_sent = [event async for event in stream_batch_events(1, batch_snapshot(self.batch))]
+            return loop_thread, events_sent
+
+        with mock.patch('mailer.events.read_batch_progress', read_progress):
+            return asyncio.run(consume())
+
+    def test_new_snapshots_are_streamed_until_the_batch_completes(self):
+        snapshots = iter([
+            {'status': 'processing', 'successful': 1, 'completed': False},
+            {'status': 'completed', 'successful': 2, 'completed': True},
+        ])
+
+        def read_progress(batch_id):
+            publish_batch_progress(batch_id, next(snapshots, {'completed': True}))
+            return read_batch_progress(batch_id)
+
+        _, events_sent = self.collect(read_progress)
+
+        self.assertEqual([event.count('"completed": true') for event in events_sent], [0, 1])
+        self.assertIn('"successful": 2', events_sent[-1])
+
+    def test_snapshot_file_is_read_off_the_event_loop(self):
+        reader_threads = []
+
+        def read_progress(batch_id):
+            reader_threads.append(threading.get_ident())
+            return None, {'completed': True}
+
+        loop_thread, _ = self.collect(read_progress)
+
+        self.assertTrue(reader_threads)
+        self.assertNotIn(loop_thread, reader_threads)
+
+
+class AsyncSMTPBackendTests(SimpleTestCase):
+
+    def start_sink(self, **options):
+        sink = SMTPSink(keep_messages=True, seed=0, **options)
+        sink.start()
+        self.addCleanup(sink.stop)
+        return sink
+
+    def make_backend(self, sink, username='', password=''):
+        return AsyncSMTPBackend(host='127.0.0.1', port=sink.port, username=username, password=password,
+                                use_tls=False, use_ssl=False, timeout=5)
+
+    def send(self, sink, recipients, username='', password=''):
+        # Send one message, recording every write the session makes
+        writes = []
+        original_write = AsyncSMTPSession._write
+
+        async def recording_write(session, data):
+            writes.append(data)
+            await original_write(session, data)
+
+        backend = self.make_backend(sink, username, password)
+        message = EmailMessage('Your certificate', 'Certificate', 'certificates@example.com', recipients,
+                               connection=backend)
+        with mock.patch.object(AsyncSMTPSession, '_write', recording_write):
+            sent = message.send()
+        return sent, writes
+
+    def test_envelope_is_pipelined_when_advertised(self):
+        sink = self.start_sink(pipelining=True)
+
+        sent, writes = self.send(sink, ['a@example.com', 'b@example.com'])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(sink.messages[0][1], ['a@example.com', 'b@example.com'])
+        self.assertIn(
+            b'MAIL FROM:<certificates@example.com>\r\nRCPT TO:<a@example.com>\r\nRCPT TO:<b@example.com>\r\nDATA\r\n',
+            writes
+        )
+
+    def test_envelope_is_sent_command_by_command_without_pipelining(self):
+        sink = self.start_sink(pipelining=False)
+
+        sent, writes = self.send(sink, ['a@example.com', 'b@example.com'])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(sink.messages[0][1], ['a@example.com', 'b@example.com'])
+        self.assertIn(b'MAIL FROM:<certificates@example.com>\r\n', writes)
+        self.assertIn(b'DATA\r\n', writes)
+
+    def test_pipelined_partial_refusal_still_delivers(self):
+        sink = self.start_sink(pipelining=True, error_rate=1.0, error_code=550, error_limit=1)
+
+        sent, _ = self.send(sink, ['a@example.com', 'b@example.com'])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(sink.messages[0][1], ['b@example.com'])
+
+    def test_refused_message_raises_and_session_stays_usable(self):
+        sink = self.start_sink(pipelining=True, error_rate=1.0, error_code=550, error_limit=1)
+        backend = self.make_backend(sink)
+        backend.open()
+        self.addCleanup(backend.close)
+
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            backend.send_messages([EmailMessage('Subject', 'Body', 'certificates@example.com', ['a@example.com'])])
+        self.assertEqual(
+            backend.send_messages([EmailMessage('Subject', 'Body', 'certificates@example.com', ['b@example.com'])]), 1
+        )
+
+    def test_login_uses_an_advertised_mechanism(self):
+        sink = self.start_sink()
+
+        sent, writes = self.send(sink, ['a@example.com'], username='mailer', password='secret')
+
+        self.assertEqual(sent, 1)
+        self.assertTrue(any(data.startswith(b'AUTH PLAIN ') for data in writes))
+
+    def test_login_requires_the_auth_extension(self):
+        session = AsyncSMTPSession('127.0.0.1', 25)
+        session.esmtp_features = {'pipelining': ''}
+
+        with self.assertRaises(smtplib.SMTPNotSupportedError):
+            asyncio.run(session.login('mailer', 'secret'))
+
+
+class StageTimerTests(SimpleTestCase):
+
+    def test_durations_are_bucketed_per_stage_in_pipeline_order(self):
+        timer = StageTimer()
+        timer.record('smtp_send', 0.150)
+        timer.record('smtp_send', 0.050)
+        timer.record('validate', 0.0005)
+
+        timings = timer.as_dict()
+
+        self.assertEqual(list(timings['stages']), ['validate', 'smtp_send'])
+        smtp_send = timings['stages']['smtp_send']
+        self.assertEqual((smtp_send['count'], smtp_send['mean_ms'], smtp_send['max_ms']), (2, 100.0, 150.0))
+        self.assertEqual(smtp_send['buckets'][BUCKET_BOUNDS_MS.index(50)], 1)
+        self.assertEqual(smtp_send['buckets'][BUCKET_BOUNDS_MS.index(200)], 1)
+        self.assertEqual(sum(smtp_send['buckets']), 2)
+
+    def test_stage_context_records_its_duration(self):
+        timer = StageTimer()
+        with timer.stage('render'):
+            pass
+
+        self.assertEqual(timer.as_dict()['stages']['render']['count'], 1)
+
+    @override_settings(EMAIL_STAGE_TIMING=False, MAILER_METRICS_ENABLED=False)
+    def test_timing_is_a_no_op_when_disabled(self):
+        self.assertIs(get_stage_timer(), NULL_TIMER)
+        self.assertIsNone(NULL_TIMER.as_dict())
+
+
+class StageTimingTests(SinkTestCase):
+
+    def test_batch_stores_the_stage_histograms(self):
+        batch = self.send_batch([make_certificate('2000-1-0001'), make_certificate('2000-1-0002')])
+
+        stages = batch.stage_timings['stages']
+        for stage in ['validate', 'attachment', 'mime', 'smtp_send']:
+            self.assertEqual(stages[stage]['count'], 2, stage)
+        self.assertGreaterEqual(stages['log_insert']['count'], 1)
+        self.assertGreaterEqual(stages['batch_save']['count'], 1)
+
+
+# Single-process mode: nothing is read from or written to a metrics directory
+@override_settings(MAILER_METRICS_DIR=None)
+class MetricsViewTests(TestCase):
+
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), headers=headers)
+
+    def test_metrics_are_hidden_by_default(self):
+        self.assertEqual(self.scrape().status_code, 404)
+
+        self.client.force_login(User.objects.create_user('clerk', 'clerk@example.com', 'password'))
+        self.assertEqual(self.scrape().status_code, 404)
+
+    def test_staff_users_can_read_the_metrics(self):
+        self.client.force_login(User.objects.create_user('admin', 'admin@example.com', 'password', is_staff=True))
+
+        response = self.scrape()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    @override_settings(MAILER_METRICS_TOKEN='scrape-token')
+    def test_scrapers_need_the_bearer_token(self):
+        self.assertEqual(self.scrape(Authorization='Bearer scrape-token').status_code, 200)
+
+        response = self.scrape(Authorization='Bearer wrong-token')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    @override_settings(MAILER_METRICS_ENABLED=False)
+    def test_disabled_metrics_are_not_served(self):
+        self.client.force_login(User.objects.create_user('admin', 'admin@example.com', 'password', is_staff=True))
+
+        self.assertEqual(self.scrape().status_code, 404)
+
+
+def histogram_count(histogram):
+    # Observations of an unlabelled histogram in this process
+    return sum(sum(state[:-1]) for _, state in histogram.samples())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', CERTIFICATE_TESTING_MODE=False)
+class SMTPLatencyMetricTests(TestCase):
+
+    def setUp(self):
+        EmailConfiguration.clear_cache()
+        self.addCleanup(EmailConfiguration.clear_cache)
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Your certificate', header_message='Certificate', body_content=''
+        )
+
+    def test_single_send_without_a_timer_is_observed(self):
+        before = histogram_count(metrics.SMTP_SEND_SECONDS)
+
+        result = send_certificate_email(make_certificate('2000-1-0001'), self.template)
+
+        self.assertTrue(result.success)
+        self.assertEqual(histogram_count(metrics.SMTP_SEND_SECONDS), before + 1)
+        self.assertIsNotNone(EmailLog.objects.get().smtp_seconds)
+
+    def test_failed_send_is_observed(self):
+        before = histogram_count(metrics.SMTP_SEND_SECONDS)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=smtplib.SMTPServerDisconnected('Connection unexpectedly closed')):
+            result = send_certificate_email(make_certificate('2000-1-0001'), self.template)
+
+        self.assertFalse(result.success)
+        self.assertEqual(histogram_count(metrics.SMTP_SEND_SECONDS), before + 1)
+
+    def test_stage_timer_does_not_observe_the_send_again(self):
+        before = histogram_count(metrics.SMTP_SEND_SECONDS)
+
+        send_certificate_email(make_certificate('2000-1-0001'), self.template, timer=StageTimer())
+
+        self.assertEqual(histogram_count(metrics.SMTP_SEND_SECONDS), before + 1)
+
+
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+        self.sent = self.registry.register(metrics.Counter('sent_total', 'Emails sent', ['college']))
+        self.active = self.registry.register(metrics.Gauge('active_batches', 'Batches being sent'))
+        self.latency = self.registry.register(metrics.Histogram('send_seconds', 'Send duration', buckets=(0.1, 1)))
+
+        self.metrics_dir = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        for patcher in [mock.patch.object(metrics, 'REGISTRY', self.registry),
+                        mock.patch.object(metrics, '_sync_started', False)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        settings_override = override_settings(MAILER_METRICS_DIR=self.metrics_dir, MAILER_METRICS_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_snapshot(self, filename, sent=0, active=0, age=0):
+        # File of another process that last synced `age` seconds ago
+        with open(os.path.join(self.metrics_dir, filename), 'w') as metrics_file:
+            json.dump({
+                'id': filename,
+                'updated_at': time.time() - age,
+                'metrics': {'sent_total': [[['CS'], sent]], 'active_batches': [[[], active]]},
+            }, metrics_file)
+
+    def test_exposition_format(self):
+        self.sent.inc(college='CS "main"')
+        self.active.set(2)
+        self.latency.observe(0.05)
+        self.latency.observe(0.5)
+        self.latency.observe(3)
+
+        self.assertEqual(self.registry.render([self.registry.snapshot()]), '\n'.join([
+            '# HELP sent_total Emails sent',
+            '# TYPE sent_total counter',
+            'sent_total{college="CS \\"main\\""} 1',
+            '# HELP active_batches Batches being sent',
+            '# TYPE active_batches gauge',
+            'active_batches 2',
+            '# HELP send_seconds Send duration',
+            '# TYPE send_seconds histogram',
+            'send_seconds_bucket{le="0.1"} 1',
+            'send_seconds_bucket{le="1"} 2',
+            'send_seconds_bucket{le="+Inf"} 3',
+            'send_seconds_sum 3.55',
+            'send_seconds_count 3',
+        ]) + '\n')
+
+    def test_processes_are_added_up_and_silent_gauges_dropped(self):
+        self.sent.inc(college='CS')
+        self.write_snapshot('1-web.json', sent=2, active=1)
+        self.write_snapshot('2-worker.json', sent=4, active=3, age=3600)
+        self.write_snapshot(metrics.RETIRED_FILENAME, sent=10)
+
+        exposition = metrics.render_metrics()
+
+        self.assertIn('sent_total{college="CS"} 17\n', exposition)
+        # This process (0) and the web server (1); the worker stopped syncing
+        self.assertIn('active_batches 1\n', exposition)
+
+    def test_exiting_processes_are_folded_into_retired_totals(self):
+        self.write_snapshot(metrics.RETIRED_FILENAME, sent=10)
+        metrics._sync_started = True
+        self.sent.inc(3, college='CS')
+        metrics.sync_metrics()
+        snapshot_path = metrics._get_snapshot_path(self.metrics_dir)
+        self.assertTrue(os.path.exists(snapshot_path))
+
+        metrics._retire_process()
+
+        self.assertFalse(os.path.exists(snapshot_path))
+        self.assertEqual(sorted(os.listdir(self.metrics_dir)), [metrics.RETIRED_FILENAME])
+        self.sent._values.clear()
+        self.assertIn('sent_total{college="CS"} 13\n', metrics.render_metrics())
+
+    @mock.patch('mailer.metrics.RETIRE_LOCK_WAIT', 0.1)
+    def test_final_values_are_kept_when_retired_totals_are_locked(self):
+        open(os.path.join(self.metrics_dir, 'retired.lock'), 'w').close()
+        metrics._sync_started = True
+        self.sent.inc(3, college='CS')
+
+        metrics._retire_process()
+
+        self.assertTrue(os.path.exists(metrics._get_snapshot_path(self.metrics_dir)))
+        self.sent._values.clear()
+        self.assertIn('sent_total{college="CS"} 3\n', metrics.render_metrics())
+
+    def test_recording_does_not_write_files(self):
+        metrics._sync_started = True
+        self.sent.inc(college='CS')
+        self.latency.observe(0.5)
+
+        self.assertEqual(os.listdir(self.metrics_dir), [])
+
+
+class CollegeBackfillMigrationTests(TransactionTestCase):
+    migrate_from = [('mailer', '0008_certificatebatch_stage_timings')]
+    migrate_to = [('mailer', '0009_emaillog_college')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        # Back to the current schema (and its search triggers) for the other tests
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        ensure_fts_index()
+
+    def test_logs_get_the_college_of_their_template(self):
+        apps = self.migrate(self.migrate_from)
+        EmailTemplate = apps.get_model('mailer', 'EmailTemplate')
+        EmailLog = apps.get_model('mailer', 'EmailLog')
+        templates = {
+            college: EmailTemplate.objects.create(
+                name='Test', college=college, subject='Subject', header_message='Header', body_content='Body'
+            )
+            for college in ('CS', 'CBA')
+        }
+        for student_id, template in [('2000-1-0001', templates['CS']), ('2000-1-0002', templates['CBA']),
+                                     ('2000-1-0003', None)]:
+            EmailLog.objects.create(student_id=student_id, email=f'{student_id}@example.com',
+                                    certificate_filename=f'{student_id}.pdf', template_used=template,
+                                    status='success')
+
+        apps = self.migrate(self.migrate_to)
+
+        self.assertEqual(
+            dict(apps.get_model('mailer', 'EmailLog').objects.values_list('student_id', 'college')),
+            {'2000-1-0001': 'CS', '2000-1-0002': 'CBA', '2000-1-0003': ''}
+        )
+
+
+class CollegeLogTests(TestCase):
+
+    def test_users_see_the_recent_logs_of_their_college(self):
+        user = User.objects.create_user('clerk', 'clerk@example.com', 'password')
+        user.profile.college = 'CBA'
+        user.profile.save()
+        template = EmailTemplate.objects.create(
+            name='Test', college='CBA', subject='Subject', header_message='Header', body_content='Body'
+        )
+        for student_id, college, template_used in [('2000-1-0001', 'CBA', template), ('2000-1-0002', 'CS', None),
+                                                   ('2000-1-0003', 'CBA', None)]:
+            EmailLog.objects.create(student_id=student_id, email=f'{student_id}@example.com',
+                                    certificate_filename=f'{student_id}.pdf', template_used=template_used,
+                                    college=college, status='success')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('send_certificates'))
+
+        # Logs of deleted templates keep their college
+        self.assertCountEqual(
+            [log.student_id for log in response.context['recent_logs']], ['2000-1-0001', '2000-1-0003']
+        )
+
+
+class AcademicTermTests(SimpleTestCase):
+
+    def term(self, year, month, day=15):
+        return get_academic_term(timezone.make_aware(datetime(year, month, day, 12)))
+
+    def test_terms_follow_the_academic_year(self):
+        self.assertEqual(self.term(2025, 8, 1), 'AY 2025-2026 1st Semester')
+        self.assertEqual(self.term(2025, 12), 'AY 2025-2026 1st Semester')
+        self.assertEqual(self.term(2026, 1), 'AY 2025-2026 2nd Semester')
+        self.assertEqual(self.term(2026, 6), 'AY 2025-2026 Midyear')
+        self.assertEqual(self.term(2026, 7, 31), 'AY 2025-2026 Midyear')
+
+    @override_settings(ACADEMIC_TERMS=[(6, '1st Trimester'), (10, '2nd Trimester'), (2, '3rd Trimester')])
+    def test_terms_come_from_the_settings(self):
+        self.assertEqual(self.term(2026, 3), 'AY 2025-2026 3rd Trimester')
+        self.assertEqual(self.term(2026, 6), 'AY 2026-2027 1st Trimester')
+
+
+class ArchiveTests(TransactionTestCase):
+
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, self.export_dir, ignore_errors=True)
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Subject', header_message='Header', body_content='Body'
+        )
+        # Five logs of the 1st semester of AY 2024-2025 and one recent log
+        for number, sent_at in enumerate([datetime(2024, 9, day, 12) for day in range(1, 6)] + [None]):
+            log = EmailLog.objects.create(
+                student_id=f'2000-1-{number:04d}', email=f'20001{number:04d}@psu.palawan.edu.ph',
+                certificate_filename=f'2000-1-{number:04d}.pdf', template_used=self.template,
+                college='CS', status='success',
+            )
+            if sent_at:
+                EmailLog.objects.filter(pk=log.pk).update(sent_at=timezone.make_aware(sent_at))
+        self.cutoff = timezone.make_aware(datetime(2025, 1, 1))
+
+    def exported_student_ids(self):
+        path = os.path.join(self.export_dir, 'AY_2024-2025_1st_Semester.jsonl.gz')
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, 'rt', encoding='utf-8') as export_file:
+            return [json.loads(line)['student_id'] for line in export_file]
+
+    def test_old_logs_are_moved_in_chunks(self):
+        moved = list(archive_email_logs(self.cutoff, chunk_size=2, export_dir=self.export_dir))
+
+        self.assertEqual(moved, [2, 2, 1])
+        self.assertEqual(list(EmailLog.objects.values_list('student_id', flat=True)), ['2000-1-0005'])
+        archived = ArchivedEmailLog.objects.order_by('sent_at')
+        self.assertEqual(
+            list(archived.values_list('student_id', 'template_name', 'term'))[0],
+            ('2000-1-0000', 'Test', 'AY 2024-2025 1st Semester')
+        )
+        self.assertEqual(archived.count(), 5)
+        self.assertEqual(self.exported_student_ids(), [f'2000-1-{number:04d}' for number in range(5)])
+
+    def test_dry_run_only_counts(self):
+        self.assertEqual(list(archive_email_logs(self.cutoff, dry_run=True)), [5])
+        self.assertEqual(ArchivedEmailLog.objects.count(), 0)
+
+    def test_rolled_back_chunk_is_not_exported(self):
+        with mock.patch.object(QuerySet, 'delete', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                list(archive_email_logs(self.cutoff, chunk_size=2, export_dir=self.export_dir))
+        self.assertEqual(self.exported_student_ids(), [])
+        self.assertEqual(ArchivedEmailLog.objects.count(), 0)
+
+        list(archive_email_logs(self.cutoff, chunk_size=2, export_dir=self.export_dir))
+
+        # Every log exported exactly once
+        self.assertEqual(self.exported_student_ids(), [f'2000-1-{number:04d}' for number in range(5)])
+
+
+@override_settings(MAILER_ADMIN_FAST_CHANGELISTS=True, MAILER_ADMIN_COUNT_LIMIT=3)
+class LargeTableChangeListTests(TestCase):
+
+    def setUp(self):
+        self.batch = CertificateBatch.objects.create(total_certificates=5)
+        for position, student_id in enumerate(['2000-1-0001', '2000-1-0002', '2000-2-0003', '2001-1-0004',
+                                               '2001-1-0005'], start=1):
+            BatchItem.objects.create(batch=self.batch, position=position, certificate_filename=f'{student_id}.pdf')
+            email = f"{student_id.replace('-', '')}@psu.palawan.edu.ph"
+            EmailLog.objects.create(student_id=student_id, email=email, certificate_filename=f'{student_id}.pdf',
+                                    status='success')
+            ArchivedEmailLog.objects.create(student_id=student_id, email=email, certificate_filename=f'{student_id}.pdf',
+                                            status='success', sent_at=timezone.now(), term='AY 2025-2026 1st Semester')
+
+    def search(self, model, term):
+        model_admin = admin_site._registry[model]
+        queryset, may_have_duplicates = model_admin.get_search_results(None, model.objects.all(), term)
+        self.assertFalse(may_have_duplicates)
+        return queryset
+
+    def test_unfiltered_table_count_is_estimated_from_the_key_range(self):
+        EmailLog.objects.filter(student_id='2000-1-0002').delete()
+
+        with self.assertNumQueries(2):
+            count = EstimatedCountPaginator(EmailLog.objects.all(), 100).count
+
+        # Deleted rows inside the key range are still counted
+        self.assertEqual(count, 5)
+
+    def test_filtered_count_stops_at_the_limit(self):
+        self.assertEqual(EstimatedCountPaginator(EmailLog.objects.filter(status='success'), 100).count, 3)
+        self.assertEqual(EstimatedCountPaginator(EmailLog.objects.filter(student_id__startswith='2001'), 100).count, 2)
+
+    def test_search_matches_the_start_of_indexed_columns(self):
+        # Email logs themselves are searched through the full-text index on SQLite
+        def student_ids(term):
+            return sorted(self.search(ArchivedEmailLog, term).values_list('student_id', flat=True))
+
+        self.assertEqual(student_ids('2000-1'), ['2000-1-0001', '2000-1-0002'])
+        self.assertEqual(student_ids('200110004@'), ['2001-1-0004'])
+        # Only the start is matched, not any substring
+        self.assertEqual(student_ids('0004'), [])
+
+    def test_batch_items_are_searchable_by_filename_and_key(self):
+        item = BatchItem.objects.get(position=3)
+
+        self.assertEqual(list(self.search(BatchItem, '2000-2')), [item])
+        self.assertEqual(list(self.search(BatchItem, item.idempotency_key[:12])), [item])
+
+    def test_changelists_render(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        for url in ['admin:mailer_emaillog_changelist', 'admin:mailer_batchitem_changelist',
+                    'admin:mailer_certificatebatch_changelist']:
+            response = self.client.get(reverse(url), {'q': '2000'})
+            self.assertEqual(response.status_code, 200, url)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        if not fts_available():
+            self.skipTest("SQLite without FTS5")
+
+    def indexed_rowids(self, term):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [f'"{term}"*'])
+            return [rowid for (rowid,) in cursor.fetchall()]
+
+    def search(self, term):
+        return list(search_email_logs(EmailLog.objects.all(), term).values_list('pk', flat=True))
+
+    def test_insert_update_and_delete_keep_the_index_in_sync(self):
+        log = EmailLog.objects.create(
+            student_id='2000-1-0001', email='200010001@psu.palawan.edu.ph',
+            certificate_filename='2000-1-0001.pdf', status='failed', error_message='Connection timed out'
+        )
+        self.assertEqual(self.indexed_rowids('timed'), [log.pk])
+        self.assertEqual(self.search('2000-1-00'), [log.pk])
+
+        EmailLog.objects.filter(pk=log.pk).update(error_message='Mailbox full')
+        self.assertEqual(self.indexed_rowids('timed'), [])
+        self.assertEqual(self.search('mailbox'), [log.pk])
+
+        # Bulk inserts (as the batch log buffer writes them) are indexed too
+        EmailLog.objects.bulk_create([
+            EmailLog(student_id='2000-1-0002', email='200010002@psu.palawan.edu.ph',
+                     certificate_filename='2000-1-0002.pdf', status='success'),
+        ])
+        self.assertEqual(len(self.search('2000-1-0002')), 1)
+
+        log.delete()
+        self.assertEqual(self.indexed_rowids('mailbox'), [])
+        self.assertEqual(self.search('2000-1-0001'), [])
+
+    def test_every_word_must_match(self):
+        timed_out = EmailLog.objects.create(
+            student_id='2000-1-0001', email='200010001@psu.palawan.edu.ph',
+            certificate_filename='2000-1-0001.pdf', status='failed', error_message='Connection timed out'
+        )
+        EmailLog.objects.create(
+            student_id='2000-1-0002', email='200010002@psu.palawan.edu.ph',
+            certificate_filename='2000-1-0002.pdf', status='failed', error_message='Connection refused'
+        )
+
+        self.assertEqual(self.search('connection timed'), [timed_out.pk])
+        self.assertEqual(len(self.search('connection')), 2)
+
+    def test_missing_triggers_are_recreated_and_the_index_rebuilt(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {FTS_TABLE}_insert")
+        log = EmailLog.objects.create(
+            student_id='2000-1-0001', email='200010001@psu.palawan.edu.ph',
+            certificate_filename='2000-1-0001.pdf', status='success'
+        )
+        self.assertEqual(self.search('2000-1-0001'), [])
+
+        ensure_fts_index()
+
+        self.assertEqual(self.search('2000-1-0001'), [log.pk])
+
+    def test_lookup_returns_the_logs_of_the_users_college(self):
+        user = User.objects.create_user('clerk', 'clerk@example.com', 'password')
+        user.profile.college = 'CS'
+        user.profile.save()
+        for student_id, college in [('2000-1-0001', 'CS'), ('2000-1-0002', 'CBA')]:
+            EmailLog.objects.create(student_id=student_id, email=f'{student_id}@example.com',
+                                    certificate_filename=f'{student_id}.pdf', college=college, status='success')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('email_log_lookup'), {'q': '2000-1'})
+
+        self.assertEqual([result['student_id'] for result in response.json()['results']], ['2000-1-0001'])
+        self.assertEqual(self.client.get(reverse('email_log_lookup')).status_code, 400)
+
+
+class FullTextQueryTests(SimpleTestCase):
+
+    def test_words_are_quoted_prefix_phrases(self):
+        self.assertEqual(build_fts_query('2000-1-00 timed'), '"2000-1-00"* AND "timed"*')
+        self.assertEqual(build_fts_query('say "hi"'), '"say"* AND """hi"""*')
+
+    def test_punctuation_only_terms_are_not_searched(self):
+        self.assertIsNone(build_fts_query('- * ()'))
+
+
+
+class SendStatsTests(TestCase):
+
+    def setUp(self):
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Subject', header_message='Header', body_content='Body'
+        )
+        self.sent_at = timezone.make_aware(datetime(2024, 9, 2, 12))
+
+    def create_logs(self, count, status='success', smtp_seconds=0.5):
+        return [
+            EmailLog.objects.create(
+                student_id=f'2000-1-{number:04d}', email=f'20001{number:04d}@example.com',
+                certificate_filename=f'2000-1-{number:04d}.pdf', template_used=self.template,
+                college='CS', status=status, smtp_seconds=smtp_seconds,
+            )
+            for number in range(count)
+        ]
+
+    def record(self, logs):
+        delta = SendStatsDelta()
+        for log in logs:
+            log.sent_at = self.sent_at
+            delta.add(log)
+        delta.apply()
+
+    def stats(self):
+        return sorted(DailySendStats.objects.values_list(
+            'day', 'college', 'template_name', 'status', 'count', 'smtp_count', 'smtp_seconds'
+        ))
+
+    def test_delta_adds_to_existing_rows(self):
+        self.record(self.create_logs(2))
+        self.record(self.create_logs(3) + self.create_logs(1, status='failed', smtp_seconds=None))
+
+        day = self.sent_at.date()
+        self.assertEqual(self.stats(), [
+            (day, 'CS', 'Test', 'failed', 1, 0, 0.0),
+            (day, 'CS', 'Test', 'success', 5, 5, 2.5),
+        ])
+
+    def test_rebuild_matches_the_recorded_totals(self):
+        logs = self.create_logs(4) + self.create_logs(1, status='failed', smtp_seconds=None)
+        EmailLog.objects.update(sent_at=self.sent_at)
+        self.record(logs)
+        # Archived logs are counted under their stored name
+        ArchivedEmailLog.objects.create(
+            student_id='1999-1-0001', email='19991@example.com', certificate_filename='1999-1-0001.pdf',
+            template_name='Test', college='CS', status='success', smtp_seconds=0.5, sent_at=self.sent_at,
+            term='AY 2024-2025 1st Semester',
+        )
+        # ...and were counted when they were sent, as a live log
+        self.record([EmailLog(template_used=self.template, college='CS', status='success', smtp_seconds=0.5)])
+        recorded = self.stats()
+
+        self.assertEqual(rebuild_send_stats(), 2)
+        self.assertEqual(self.stats(), recorded)
+
+    def test_renamed_template_starts_a_new_series(self):
+        self.record(self.create_logs(2))
+        self.template.name = 'Renamed'
+        self.template.save()
+        self.record(self.create_logs(1))
+
+        day = self.sent_at.date()
+        self.assertEqual(self.stats(), [
+            (day, 'CS', 'Renamed', 'success', 1, 1, 0.5),
+            (day, 'CS', 'Test', 'success', 2, 2, 1.0),
+        ])
+
+        # A rebuild counts the live logs under the current name
+        EmailLog.objects.update(sent_at=self.sent_at)
+        rebuild_send_stats()
+        self.assertEqual(self.stats(), [(day, 'CS', 'Renamed', 'success', 3, 3, 1.5)])
+
+
+class SQLitePragmaTests(SimpleTestCase):
+
+    def open_connection(self):
+        # A new file database: WAL needs a file, not the in-memory test database
+        directory = tempfile.mkdtemp(prefix='mailer_tests_')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'db.sqlite3'))
+        wrapper = SQLiteDatabaseWrapper(settings_dict, alias='pragma_test')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connections_use_wal(self):
+        wrapper = self.open_connection()
+
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 20000)
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+
+    @override_settings(SQLITE_WAL=False, SQLITE_BUSY_TIMEOUT=500, SQLITE_SYNCHRONOUS='FULL')
+    def test_pragmas_follow_the_settings(self):
+        wrapper = self.open_connection()
+
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 500)
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)
+
+
+class DuplicateTests(SinkTestCase):
+    def test_certificate_sent_before_is_skipped(self):
+        self.send_batch([make_certificate('2000-1-0001')])
+        batch = self.send_batch([make_certificate('2000-1-0001'), make_certificate('2000-1-0002')])
+
+        self.assertEqual((batch.successful_sends, batch.failed_sends), (1, 1))
+        self.assertEqual(batch.items.get(certificate_filename='2000-1-0001.pdf').status, 'skipped')
+        self.assertTrue(EmailLog.objects.filter(student_id='2000-1-0001', status='duplicate').exists())
+        self.assertEqual(self.sink.message_count, 2)
+
+    def test_corrected_certificate_is_sent(self):
+        self.send_batch([make_certificate('2000-1-0001')])
+        batch = self.send_batch([make_certificate('2000-1-0001', b'%PDF-1.4 corrected')])
+
+        self.assertEqual(batch.successful_sends, 1)
+        self.assertEqual(self.sink.message_count, 2)
+
+    @mock.patch('mailer.utils.DUPLICATE_WAIT_SECONDS', 0.1)
+    def test_copy_in_the_same_batch_is_skipped_once_delivered(self):
+        batch = self.send_batch([make_certificate('2000-1-0001'), make_certificate('2000-1-0001')])
+
+        self.assertCountEqual(batch.items.values_list('status', flat=True), ['sent', 'skipped'])
+        self.assertEqual(self.sink.message_count, 1)
+
+
+class DuplicateReleaseTests(SinkTestCase):
+    # The first recipient is refused for good, after the copy started waiting for it
+    sink_options = {'error_rate': 1.0, 'error_code': 550, 'error_limit': 1, 'latency': 0.1}
+
+    @mock.patch('mailer.utils.DUPLICATE_WAIT_SECONDS', 0.1)
+    def test_copy_is_sent_when_its_twin_fails(self):
+        batch = self.send_batch([make_certificate('2000-1-0001'), make_certificate('2000-1-0001')])
+
+        self.assertCountEqual(batch.items.values_list('status', flat=True), ['failed', 'sent'])
+        self.assertEqual((batch.successful_sends, batch.failed_sends), (1, 1))
+        self.assertEqual(self.sent_recipients(), ['200010001@psu.palawan.edu.ph'])
+
+
+class DuplicateWaitTests(SinkTestCase):
+    # Slow replies keep the first copy in flight while the second one waits
+    sink_options = {'latency': 0.2}
+
+    @mock.patch('mailer.utils.DUPLICATE_WAIT_SECONDS', 0.05)
+    def test_waiting_copy_is_not_read_again(self):
+        with mock.patch('mailer.utils.prepare_certificate', wraps=utils.prepare_certificate) as prepare, \
+                mock.patch('mailer.utils.build_pdf_attachment', wraps=utils.build_pdf_attachment) as build:
+            batch = self.send_batch([make_certificate('2000-1-0001'), make_certificate('2000-1-0001')])
+
+        self.assertCountEqual(batch.items.values_list('status', flat=True), ['sent', 'skipped'])
+        # Checked again several times, but each copy was only read once
+        self.assertGreater(prepare.call_count, 2)
+        self.assertEqual(build.call_count, 2)
+
+
+class SimulateSendTimeTests(SimpleTestCase):
+
+    def test_pool_sends_in_parallel_without_a_rate_limit(self):
+        self.assertEqual(simulate_send_time(10, pool_size=2, per_minute=0, burst=1, smtp_seconds=1.0), 5.0)
+
+    def test_rate_limit_paces_the_sends_after_the_burst(self):
+        # One send per second once the burst is used up
+        self.assertAlmostEqual(simulate_send_time(5, pool_size=4, per_minute=60, burst=1, smtp_seconds=0.1), 4.1)
+        self.assertAlmostEqual(simulate_send_time(5, pool_size=4, per_minute=60, burst=3, smtp_seconds=0.1), 2.1)
+        # Slower than the rate limit: the SMTP time decides
+        self.assertEqual(simulate_send_time(6, pool_size=1, per_minute=60, burst=1, smtp_seconds=2.0), 12.0)
+
+    def test_large_batches_are_simulated_without_waiting(self):
+        started = time.perf_counter()
+
+        seconds = simulate_send_time(10000, pool_size=5, per_minute=120, burst=10, smtp_seconds=1.0)
+
+        self.assertAlmostEqual(seconds, 4996.0)
+        self.assertLess(time.perf_counter() - started, 5)
+
+
+@override_settings(CERTIFICATE_TESTING_MODE=False, PREFLIGHT_SMTP_SECONDS=1.0)
+class PreflightTests(TestCase):
+
+    def setUp(self):
+        EmailConfiguration.clear_cache()
+        self.addCleanup(EmailConfiguration.clear_cache)
+        config = EmailConfiguration.get_config()
+        config.from_email = 'certificates@example.com'
+        config.smtp_pool_size = 2
+        config.rate_limit_per_minute = 0
+        config.save()
+        self.template = EmailTemplate.objects.create(
+            name='Test', college='CS', subject='Subject', header_message='Header', body_content='Body'
+        )
+
+    def messages(self, report):
+        return [(problem['level'], problem['file'], problem['message']) for problem in report['problems']]
+
+    def test_problems_are_reported_without_sending(self):
+        sent = make_certificate('2000-1-0004')
+        EmailLog.objects.create(
+            student_id='2000-1-0004', email='200010004@psu.palawan.edu.ph', certificate_filename='2000-1-0004.pdf',
+            status='success', content_hash=hashlib.sha256(sent.read()).hexdigest(),
+        )
+        sent.seek(0)
+        EmailLog.objects.create(
+            student_id='2000-1-0001', email='200010001@psu.palawan.edu.ph', certificate_filename='2000-1-0001.pdf',
+            status='failed', error_message='550 Mailbox unavailable',
+        )
+
+        report = run_preflight([
+            make_certificate('2000-1-0001'),
+            make_certificate('2000-1-0002', b'not a pdf'),
+            SimpleUploadedFile('certificate.txt', b'%PDF-1.4'),
+            sent,
+            make_archive({'2000-1-0003.pdf': b'%PDF-1.4 3', '2000-1-0001.pdf': b'%PDF-1.4 corrected'}),
+        ], self.template)
+
+        self.assertEqual((report['certificates'], report['to_send']), (6, 4))
+        self.assertEqual(report['duplicates'], 1)
+        self.assertEqual((report['errors'], report['warnings']), (2, 3))
+        messages = self.messages(report)
+        self.assertIn(('error', 'certificate.txt', 'Invalid filename format'), messages)
+        self.assertIn(('warning', '2000-1-0002.pdf', "The file doesn't look like a PDF"), messages)
+        self.assertIn(('warning', '2000-1-0001.pdf', 'Also gets another certificate'), messages)
+        self.assertTrue(any(level == 'error' and file == '2000-1-0004.pdf' and message.endswith('(will be skipped)')
+                            for level, file, message in messages))
+        self.assertTrue(any(level == 'warning' and '550 Mailbox unavailable' in message
+                            for level, _, message in messages))
+        self.assertFalse(EmailLog.objects.exclude(student_id__in=['2000-1-0001', '2000-1-0004']).exists())
+
+    def test_estimate_uses_the_measured_smtp_time_and_the_queue(self):
+        DailySendStats.objects.create(day=timezone.localdate(), status='success', count=4, smtp_count=4,
+                                      smtp_seconds=8.0)
+        queued = CertificateBatch.objects.create(template_used=self.template, total_certificates=1, status='pending')
+        BatchItem.objects.create(batch=queued, position=1, certificate_filename='2000-1-0009.pdf')
+
+        report = run_preflight([make_certificate(f'2000-1-000{number}') for number in range(1, 4)], self.template)
+
+        self.assertTrue(report['smtp_seconds_measured'])
+        self.assertEqual(report['smtp_seconds'], 2.0)
+        self.assertEqual(report['queued_ahead'], 1)
+        # Four 2s sends on two connections, the first of them queued before this batch
+        self.assertEqual(report['send_seconds'], 2.0)
+        self.assertEqual(report['send_duration'], '2s')
@@ -0,0 +1,129 @@
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+from django.conf import settings
+from .metrics import metrics_enabled, observe_stage
+
+# ============================================================
+# SEND PIPELINE STAGE TIMING
+# ============================================================
+# Every stage of sending a certificate (filename validation, configuration
+# lookup, template rendering, attachment encoding, MIME assembly, the SMTP
+# send, the EmailLog insert and the batch progress save) is timed with the
+# monotonic clock and aggregated into a histogram per stage. The histograms
+# of a batch are stored on CertificateBatch.stage_timings and shown in the
+# admin. The EmailLog write timings also feed the Prometheus histogram
+# (mailer.metrics). With EMAIL_STAGE_TIMING and MAILER_METRICS_ENABLED
+# both False every timer is a shared no-op.
+# ============================================================
+
+# Stages in pipeline order
+STAGES = [
+    ('validate', 'Filename validation'),
+    ('config', 'Configuration lookup'),
+    ('render', 'Template rendering'),
+    ('duplicate_check', 'Duplicate lookup'),
+    ('attachment', 'Attachment encoding'),
+    ('mime', 'MIME assembly'),
+    ('smtp_send', 'SMTP send'),
+    ('log_insert', 'EmailLog insert'),
+    ('batch_save', 'Batch save'),
+]
+
+# Upper bounds (milliseconds) of the histogram buckets; the last bucket is unbounded
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+_NO_OP = nullcontext()
+
+
+class _StageClock:
+    __slots__ = ('timer', 'stage', 'started_at')
+
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timer.record(self.stage, time.perf_counter() - self.started_at)
+
+
+# Thread-safe per-stage histograms of one batch
+class StageTimer:
+    enabled = True
+
+    def __init__(self, store=True):
+        # store: keep the histograms on the batch (False: only feed the metrics)
+        self.store = store
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        # Context manager timing one run of a stage
+        return _StageClock(self, name)
+
+    def record(self, name, seconds):
+        observe_stage(name, seconds)
+        milliseconds = seconds * 1000
+        bucket = bisect.bisect_left(BUCKET_BOUNDS_MS, milliseconds)
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'buckets': [0] * (len(BUCKET_BOUNDS_MS) + 1),
+                }
+            stats['count'] += 1
+            stats['total_ms'] += milliseconds
+            stats['max_ms'] = max(stats['max_ms'], milliseconds)
+            stats['buckets'][bucket] += 1
+
+    def as_dict(self):
+        # JSON-ready histograms, in pipeline order
+        with self._lock:
+            order = [name for name, _ in STAGES if name in self._stages]
+            order += sorted(name for name in self._stages if name not in order)
+            return {
+                'bucket_bounds_ms': BUCKET_BOUNDS_MS,
+                'stages': {
+                    name: {
+                        'count': self._stages[name]['count'],
+                        'total_ms': round(self._stages[name]['total_ms'], 3),
+                        'mean_ms': round(self._stages[name]['total_ms'] / self._stages[name]['count'], 3),
+                        'max_ms': round(self._stages[name]['max_ms'], 3),
+                        'buckets': list(self._stages[name]['buckets']),
+                    }
+                    for name in order
+                },
+            }
+
+
+# Timer used when stage timing is disabled
+class NullStageTimer:
+    enabled = False
+    store = False
+
+    def stage(self, name):
+        return _NO_OP
+
+    def record(self, name, seconds):
+        pass
+
+    def as_dict(self):
+        return None
+
+
+NULL_TIMER = NullStageTimer()
+
+
+def get_stage_timer():
+    # New timer for a batch (the shared no-op timer when timing and metrics are disabled)
+    store = getattr(settings, 'EMAIL_STAGE_TIMING', True)
+    if store or metrics_enabled():
+        return StageTimer(store=store)
+    return NULL_TIMER
@@ -12,6 +12,16 @@ urlpatterns = [
     
     # Progress tracking endpoint (AJAX)
     path('progress/<int:batch_id>/', views.get_batch_progress, name='batch_progress'),
+    path('progress/<int:batch_id>/stream/', views.stream_batch_progress, name='batch_progress_stream'),
+    
+    # Sending statistics
+    path('stats/', views.send_stats_view, name='send_stats'),
+    
+    # Email log search (JSON)
+    path('logs/lookup/', views.lookup_email_logs, name='email_log_lookup'),
+    
+    # Prometheus metrics
+    path('metrics', views.metrics_view, name='metrics'),
     
     # Template management
     path('templates/', views.TemplateListView.as_view(), name='templates_list'),
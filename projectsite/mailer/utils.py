@@ -1,9 +1,28 @@
 import os
 import time
-from django.core.mail import EmailMultiAlternatives, get_connection
+import hashlib
+import atexit
+import weakref
+import threading
+from collections import OrderedDict, namedtuple
+from django.db import transaction
+from django.db.models import F, Count
+from django.utils import timezone
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import EmailConfiguration, EmailLog
+from .models import EmailConfiguration, EmailLog, CertificateBatch, BatchItem
+from .pool import SMTPConnectionPool
+from .ratelimit import get_rate_limiter
+from .spool import build_pdf_attachment
+from .messages import CertificateMessageFactory
+from .retry import RetryPolicy, RetryQueue
+from .events import ProgressPublisher
+from .timing import NULL_TIMER, get_stage_timer
+from .metrics import record_send_result, record_smtp_send
+from .stats import record_send_stats
+from .dedup import (
+    DUPLICATE_WAIT_SECONDS, IN_FLIGHT, SENT_BY_ITEM, DuplicateGuard, get_duplicate_action, describe_duplicate
+)
 
 # ============================================================
 # TESTING MODE CONFIGURATION
@@ -77,90 +96,529 @@ def validate_certificate_filename(filename):
     return True, student_id, email
 
 
-def send_certificate_email(certificate_file, template, connection=None):
+def scan_certificate_archive(archive):
+    """
+    Split the entries of a ZIP archive into valid certificates and errors.
+    
+    Only the archive's central directory is read; nothing is decompressed.
+    Folders, hidden files and macOS metadata entries are ignored.
+    
+    Args:
+        archive: Open zipfile.ZipFile
+    
+    Returns:
+        tuple: (entries: list of ZipInfo in archive order, errors: list of str)
+    """
+    max_size = getattr(settings, 'CERTIFICATE_MAX_FILE_SIZE', 10485760)
+    entries = []
+    errors = []
+    
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        
+        is_valid, _, _ = validate_certificate_filename(name)
+        if not is_valid:
+            errors.append(f"'{info.filename}' in the ZIP archive is not a PDF file.")
+            continue
+        if info.file_size > max_size:
+            errors.append(f"'{info.filename}' in the ZIP archive is larger than {max_size // 1048576}MB.")
+            continue
+        
+        entries.append(info)
+    
+    return entries, errors
+
+
+# ============================================================
+# RENDERED EMAIL CACHE
+# ============================================================
+# The email content is identical for every recipient of a batch, so it is
+# rendered once and shared. Rendered bodies are also kept in a small
+# process-level LRU keyed on template id + updated_at + college, so repeated
+# batches with an unchanged template skip rendering entirely.
+# ============================================================
+
+# Snapshot of a template's rendered content
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'text_body', 'html_body'])
+
+_rendered_email_cache = OrderedDict()
+_rendered_email_cache_lock = threading.Lock()
+
+
+def render_certificate_email(template):
+    """
+    Render the subject, plain-text and HTML bodies of a template.
+    
+    Args:
+        template: EmailTemplate instance
+    
+    Returns:
+        RenderedEmail: Immutable snapshot of the template content
+    """
+    cache_key = (template.pk, template.updated_at, template.college)
+    
+    with _rendered_email_cache_lock:
+        rendered = _rendered_email_cache.get(cache_key)
+        if rendered is not None:
+            _rendered_email_cache.move_to_end(cache_key)
+            return rendered
+    
+    # Get college information for the template
+    college_info = settings.COLLEGES.get(template.college, {})
+    
+    email_html = render_to_string('email_template.html', {
+        'header_message': template.header_message,
+        'body_content': template.body_content,
+        'college_info': college_info,
+        'for_preview': False,
+    })
+    rendered = RenderedEmail(
+        subject=template.subject,
+        text_body=f"{template.header_message}\n\n{template.body_content}",
+        html_body=email_html,
+    )
+    
+    # Unsaved templates have no stable key, so they are never cached
+    if template.pk is not None:
+        cache_size = getattr(settings, 'EMAIL_RENDER_CACHE_SIZE', 32)
+        with _rendered_email_cache_lock:
+            _rendered_email_cache[cache_key] = rendered
+            while len(_rendered_email_cache) > cache_size:
+                _rendered_email_cache.popitem(last=False)
+    
+    return rendered
+
+
+# ============================================================
+# BUFFERED EMAIL LOGS
+# ============================================================
+# Writing one EmailLog per email costs one INSERT and one SQLite commit
+# inside the sending loop. During batches the rows are buffered and written
+# with bulk_create in a single transaction every EMAIL_LOG_FLUSH_SIZE rows
+# or EMAIL_LOG_FLUSH_INTERVAL seconds. Buffers are always flushed when the
+# batch ends (including on errors) and at interpreter exit.
+# ============================================================
+
+_active_log_buffers = weakref.WeakSet()
+
+
+# Buffered writer for EmailLog rows
+class EmailLogBuffer:
+    def __init__(self, flush_size=None, flush_interval=None, auto_flush=True, timer=NULL_TIMER):
+        self.flush_size = flush_size or getattr(settings, 'EMAIL_LOG_FLUSH_SIZE', 50)
+        self.flush_interval = flush_interval or getattr(settings, 'EMAIL_LOG_FLUSH_INTERVAL', 5)
+        # With auto_flush=False, add() never touches the database (pool worker
+        # threads add rows; the batch thread calls flush_if_due())
+        self.auto_flush = auto_flush
+        self.timer = timer
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        _active_log_buffers.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, **fields):
+        # Queue an EmailLog row (sent_at is taken now, not at flush time)
+        with self._lock:
+            self._pending.append(EmailLog(**fields))
+        if self.auto_flush:
+            self.flush_if_due()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def is_due(self):
+        with self._lock:
+            return (len(self._pending) >= self.flush_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        # Write all buffered rows in one transaction; returns the rows written
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+
+        if not rows:
+            return rows
+
+        try:
+            # The daily statistics are updated in the same transaction
+            with self.timer.stage('log_insert'), transaction.atomic():
+                EmailLog.objects.bulk_create(rows)
+                record_send_stats(rows)
+        except Exception:
+            # Keep the rows so the next flush can write them
+            self.requeue(rows)
+            raise
+        return rows
+
+    def requeue(self, rows):
+        # Put back rows whose write was rolled back (also by an enclosing transaction)
+        for row in rows:
+            row.pk = None
+            row._state.adding = True
+        with self._lock:
+            self._pending = rows + self._pending
+
+    def close(self):
+        self.flush()
+        _active_log_buffers.discard(self)
+
+
+@atexit.register
+def _flush_log_buffers_at_exit():
+    # Last chance to keep the audit trail complete if a worker is stopped mid-batch
+    for log_buffer in list(_active_log_buffers):
+        try:
+            log_buffer.close()
+        except Exception:
+            pass
+
+
+# ============================================================
+# BATCH PROGRESS
+# ============================================================
+# Progress counters are written with field-scoped F() increments at most
+# every BATCH_PROGRESS_EVERY emails or BATCH_PROGRESS_INTERVAL seconds
+# instead of a full-row save() after every email. The exact totals are
+# written once more when the batch ends.
+#
+# Batches queued through the worker also checkpoint every certificate in a
+# BatchItem (pending -> sending -> sent/failed/skipped). Items are marked
+# 'sending' a chunk at a time just before they are sent. The log buffer of
+# a batch is only flushed through BatchProgress, so the final state of an
+# item is written in the same transaction as its email log and a stopped
+# batch can resume without resending what was already delivered.
+# Skipped items are duplicates (see mailer.dedup) and count as failed.
+# ============================================================
+
+# Coalesced progress counters for a CertificateBatch
+class BatchProgress:
+    def __init__(self, batch_obj, log_buffer=None, every=None, interval=None, timer=NULL_TIMER):
+        self.batch_obj = batch_obj
+        self.log_buffer = log_buffer
+        self.timer = timer
+        self.every = every or getattr(settings, 'BATCH_PROGRESS_EVERY', 25)
+        self.interval = interval or getattr(settings, 'BATCH_PROGRESS_INTERVAL', 2)
+        self._successful = 0
+        self._failed = 0
+        self._item_status = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, success, batch_item=None, skipped=False):
+        if success:
+            self._successful += 1
+        else:
+            self._failed += 1
+        if batch_item is not None:
+            self._item_status[batch_item.pk] = 'sent' if success else 'skipped' if skipped else 'failed'
+
+        if (self._successful + self._failed >= self.every
+                or time.monotonic() - self._last_flush >= self.interval):
+            self.flush()
+
+    def flush_if_due(self):
+        # Flush when the log buffer is due, with the item checkpoints of its logs
+        if self.log_buffer is not None and self.log_buffer.is_due():
+            self.flush()
+
+    def _flush_item_checkpoints(self):
+        for status in ('sent', 'failed', 'skipped'):
+            item_ids = [pk for pk, item_status in self._item_status.items() if item_status == status]
+            if item_ids:
+                BatchItem.objects.filter(pk__in=item_ids).update(status=status, updated_at=timezone.now())
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        has_logs = self.log_buffer is not None and len(self.log_buffer)
+        if not (self._successful or self._failed or has_logs):
+            return
+
+        # Logs, item checkpoints and counters are written together, and the
+        # logs first, so progress never runs ahead of the audit trail
+        written_logs = []
+        try:
+            with transaction.atomic():
+                if self.log_buffer is not None:
+                    written_logs = self.log_buffer.flush()
+                if self._successful or self._failed:
+                    with self.timer.stage('batch_save'):
+                        self._flush_item_checkpoints()
+                        CertificateBatch.objects.filter(pk=self.batch_obj.pk).update(
+                            successful_sends=F('successful_sends') + self._successful,
+                            failed_sends=F('failed_sends') + self._failed,
+                        )
+        except Exception:
+            # The logs were rolled back with their checkpoints; the next flush writes both
+            if written_logs:
+                self.log_buffer.requeue(written_logs)
+            raise
+        self._item_status = {}
+        self._successful = 0
+        self._failed = 0
+
+    def finish(self, successful, failed):
+        # Final exact write of the counters. Batches with item checkpoints
+        # count their items, so totals stay exact across resumed runs.
+        # The stage timings of the run are saved with them.
+        written_logs = []
+        try:
+            with transaction.atomic():
+                if self.log_buffer is not None:
+                    written_logs = self.log_buffer.flush()
+                with self.timer.stage('batch_save'):
+                    self._flush_item_checkpoints()
+                    item_counts = dict(
+                        self.batch_obj.items.values_list('status').annotate(count=Count('pk')).order_by()
+                    )
+                if item_counts:
+                    successful = item_counts.get('sent', 0)
+                    failed = item_counts.get('failed', 0) + item_counts.get('skipped', 0)
+
+                self.batch_obj.successful_sends = successful
+                self.batch_obj.failed_sends = failed
+                update_fields = ['successful_sends', 'failed_sends']
+                if self.timer.store:
+                    self.batch_obj.stage_timings = self.timer.as_dict()
+                    update_fields.append('stage_timings')
+                self.batch_obj.save(update_fields=update_fields)
+        except Exception:
+            if written_logs:
+                self.log_buffer.requeue(written_logs)
+            raise
+        self._item_status = {}
+        self._successful = 0
+        self._failed = 0
+
+
+def mark_items_sending(certificate_files):
+    # Checkpoint: these certificates are about to be sent
+    item_ids = [
+        cert_file.batch_item.pk for cert_file in certificate_files
+        if getattr(cert_file, 'batch_item', None) is not None
+    ]
+    if item_ids:
+        BatchItem.objects.filter(pk__in=item_ids, status='pending').update(
+            status='sending', updated_at=timezone.now()
+        )
+
+
+def _record_email_log(log_buffer, timer=NULL_TIMER, **fields):
+    # Buffer the log row during batches (timed when flushed), write it directly otherwise
+    if log_buffer is not None:
+        log_buffer.add(**fields)
+    else:
+        with timer.stage('log_insert'), transaction.atomic():
+            record_send_stats([EmailLog.objects.create(**fields)])
+
+
+# Certificate read and encoded ahead of its SMTP send (attachment is None on errors),
+# with the SHA-256 of its content computed in the same pass
+PreparedCertificate = namedtuple(
+    'PreparedCertificate', ['file', 'attachment', 'attempt', 'content_hash'], defaults=[1, None]
+)
+
+
+def prepare_certificate(certificate_file, attempt=1, timer=NULL_TIMER, content_hash=None):
+    # Read-ahead step of the SMTP pool; errors are raised again (and logged) at send time.
+    # A certificate waiting for a copy of it (content_hash known) is only read once it's released.
+    if content_hash:
+        return PreparedCertificate(certificate_file, None, attempt, content_hash)
+    try:
+        digest = hashlib.sha256()
+        with timer.stage('attachment'):
+            attachment = build_pdf_attachment(certificate_file, digest=digest)
+        return PreparedCertificate(certificate_file, attachment, attempt, digest.hexdigest())
+    except Exception:
+        return PreparedCertificate(certificate_file, None, attempt)
+
+
+# Outcome of one send attempt; `retry` is True if the failure will be attempted again,
+# `duplicate` if the certificate was already sent to this recipient (see mailer.dedup).
+# With both set, the certificate waits for a copy of it that is still being sent;
+# `content_hash` is then kept so the certificate isn't read again while it waits.
+SendResult = namedtuple('SendResult', ['success', 'student_id', 'email', 'error', 'retry', 'duplicate',
+                                       'content_hash'], defaults=[False, None])
+
+
+def send_certificate_email(certificate_file, template, connection=None, rendered=None, log_buffer=None,
+                           message_factory=None, attachment=None, attempt=1, retry_policy=None,
+                           timer=NULL_TIMER, content_hash=None, duplicate_guard=None):
     """
     Send a certificate email to a student.
     
     Args:
-        certificate_file: InMemoryUploadedFile or File object
+        certificate_file: SpooledCertificate, UploadedFile or File object
         template: EmailTemplate instance
         connection: Optional persistent SMTP connection (for batch sending)
+        rendered: Optional RenderedEmail snapshot shared by the whole batch
+        log_buffer: Optional EmailLogBuffer (for batch sending)
+        message_factory: Optional CertificateMessageFactory shared by the whole batch
+        attachment: Optional certificate MIME part encoded ahead of time
+        attempt: Number of this send attempt (1 = first try)
+        retry_policy: Optional RetryPolicy; transient failures it accepts are
+            logged as 'retrying' instead of 'failed'
+        timer: Optional StageTimer collecting the duration of each stage
+        content_hash: SHA-256 of the certificate, computed with the prepared attachment
+            (or without an attachment, for a certificate waiting for a copy of it)
+        duplicate_guard: Optional DuplicateGuard of the batch; certificates already
+            sent to the recipient are skipped or flagged
     
     Returns:
-        tuple: (success: bool, student_id: str, email: str, error_message: str or None)
+        SendResult: (success: bool, student_id: str, email: str, error_message: str or None, retry: bool,
+                     duplicate: bool, content_hash: str or None)
     """
     try:
         # Validate filename and extract info
-        is_valid, student_id, email = validate_certificate_filename(certificate_file.name)
+        with timer.stage('validate'):
+            is_valid, student_id, email = validate_certificate_filename(certificate_file.name)
         
         if not is_valid:
             error_msg = f"Invalid filename format: {certificate_file.name}"
-            return False, certificate_file.name, None, error_msg
+            record_send_result(template, False)
+            return SendResult(False, certificate_file.name, None, error_msg, False)
         
-        # Get email configuration
-        config = EmailConfiguration.get_config()
-        from_email = f"{config.from_name} <{config.from_email}>"
+        # Batches pass a shared factory; single sends build their own
+        if message_factory is None:
+            with timer.stage('config'):
+                config = EmailConfiguration.get_config()
+            if rendered is None:
+                with timer.stage('render'):
+                    rendered = render_certificate_email(template)
+            message_factory = CertificateMessageFactory(rendered, f"{config.from_name} <{config.from_email}>")
         
-         # Prepare email content
-        email_message = EmailMultiAlternatives(
-            subject=template.subject,
-            body=f"{template.header_message}\n\n{template.body_content}",
-            from_email=from_email,
-            to=[email],
-            connection=connection,  # Use persistent connection if provided
-        )
+        # Attach certificate (read, hashed and encoded in chunks, unless prepared ahead)
+        if attachment is None and content_hash is None:
+            digest = hashlib.sha256()
+            with timer.stage('attachment'):
+                attachment = build_pdf_attachment(certificate_file, digest=digest)
+            content_hash = digest.hexdigest()
         
-        # Get college information for the template
-        college_info = settings.COLLEGES.get(template.college, {})
-
-         # Create email with alternative content (HTML)
-        email_html = render_to_string('email_template.html', {
-            'header_message': template.header_message,
-            'body_content': template.body_content,
-            'college_info': college_info,
-            'for_preview': False,
-        })
-        email_message.attach_alternative(email_html, 'text/html')
+        # Same certificate already sent to this recipient (batches only)
+        batch_item = getattr(certificate_file, 'batch_item', None)
+        duplicate_note = None
+        if duplicate_guard is not None and content_hash:
+            sent_before = duplicate_guard.claim(email, content_hash, certificate_file)
+            if sent_before == SENT_BY_ITEM:
+                # Delivered (and logged) before the worker stopped; nothing to do
+                return SendResult(True, student_id, email, None, False)
+            if sent_before == IN_FLIGHT and duplicate_guard.action == 'skip':
+                # Wait for the copy being sent: skipped if it's delivered, sent if it fails
+                return SendResult(False, student_id, email, None, True, True, content_hash)
+            if sent_before is not None:
+                duplicate_note = describe_duplicate(email, sent_before)
+                if duplicate_guard.action == 'skip':
+                    _record_email_log(
+                        log_buffer,
+                        timer,
+                        student_id=student_id,
+                        email=email,
+                        certificate_filename=certificate_file.name,
+                        template_used=template,
+                        college=template.college,
+                        status='duplicate',
+                        error_message=duplicate_note,
+                        attempt=attempt,
+                        content_hash=content_hash,
+                        batch_item=batch_item
+                    )
+                    record_send_result(template, False, duplicate=True)
+                    return SendResult(False, student_id, email, duplicate_note, False, True)
         
-        # Attach certificate
-        email_message.attach(
-            certificate_file.name,
-            certificate_file.read(),
-            'application/pdf'
-        )
+        # A waiting copy that was released is read now
+        if attachment is None:
+            with timer.stage('attachment'):
+                attachment = build_pdf_attachment(certificate_file)
+
+        # Only the recipient and the certificate differ per email
+        with timer.stage('mime'):
+            email_message = message_factory.build(
+                email,
+                attachment,
+                connection=connection,  # Use persistent connection if provided
+                idempotency_key=batch_item.idempotency_key if batch_item else None
+            )
         
-        # Send email
-        email_message.send(fail_silently=False)
+        # Send email (failed sends count toward the latency metric too)
+        smtp_started = time.perf_counter()
+        try:
+            with timer.stage('smtp_send'):
+                email_message.send(fail_silently=False)
+        finally:
+            smtp_seconds = time.perf_counter() - smtp_started
+            record_smtp_send(smtp_seconds)
+        if duplicate_guard is not None and content_hash:
+            duplicate_guard.confirm(email, content_hash, certificate_file)
         
         # Log success
-        EmailLog.objects.create(
+        _record_email_log(
+            log_buffer,
+            timer,
             student_id=student_id,
             email=email,
             certificate_filename=certificate_file.name,
             template_used=template,
-            status='success'
+            college=template.college,
+            status='success',
+            error_message=duplicate_note,  # Flagged duplicates are sent, with a note
+            attempt=attempt,
+            smtp_seconds=smtp_seconds,
+            content_hash=content_hash,
+            batch_item=batch_item
         )
+        record_send_result(template, True, duplicate=duplicate_note is not None)
         
-        return True, student_id, email, None
+        return SendResult(True, student_id, email, None, False, duplicate_note is not None)
         
     except Exception as e:
         error_message = str(e)
-        EmailLog.objects.create(
+        # Transient failures (timeouts, 4xx replies) are sent again later
+        retry = retry_policy is not None and retry_policy.should_retry(e, attempt)
+        if duplicate_guard is not None and content_hash and not retry:
+            # Failed for good: another copy of the certificate may still be sent
+            duplicate_guard.release(email, content_hash, certificate_file)
+        _record_email_log(
+            log_buffer,
+            timer,
             student_id=student_id if 'student_id' in locals() else 'unknown',
             email=email if 'email' in locals() else 'unknown',
             certificate_filename=certificate_file.name,
             template_used=template,
-            status='failed',
-            error_message=error_message
+            college=template.college,
+            status='retrying' if retry else 'failed',
+            error_message=error_message,
+            attempt=attempt,
+            smtp_seconds=smtp_seconds if 'smtp_seconds' in locals() else None,
+            content_hash=content_hash or '',
+            batch_item=getattr(certificate_file, 'batch_item', None)
         )
+        record_send_result(template, False, retry=retry)
         
-        return False, student_id if 'student_id' in locals() else certificate_file.name, \
-               email if 'email' in locals() else None, error_message
+        return SendResult(False, student_id if 'student_id' in locals() else certificate_file.name,
+                          email if 'email' in locals() else None, error_message, retry)
 
 
 def send_certificates_batch(certificate_files, template, batch_obj=None):
     """
-    Send multiple certificates in a batch using persistent SMTP connection.
+    Send multiple certificates in a batch using a pool of persistent SMTP connections.
+    
+    The pool size is EmailConfiguration.smtp_pool_size and all connections
+    share the sender account's rate limiter. Transient failures are retried
+    with backoff (see mailer.retry) while the rest of the batch continues.
+    Logs and progress are written from the calling thread; results keep the
+    original file order.
     
     Args:
         certificate_files: List of file objects
@@ -174,49 +632,149 @@ def send_certificates_batch(certificate_files, template, batch_obj=None):
         'total': len(certificate_files),
         'successful': 0,
         'failed': 0,
+        'retried': 0,
+        'duplicates': 0,
         'errors': []
     }
     
-    # Create persistent SMTP connection for entire batch
-    connection = get_connection()
+    # Per-stage timings of this batch (see mailer.timing)
+    timer = get_stage_timer() if batch_obj else NULL_TIMER
+    
+    # Snapshot the template content so edits made mid-batch are not mixed in
+    with timer.stage('render'):
+        rendered = render_certificate_email(template)
+    
+    # Load the configuration here so pool workers hit the cache, not the database
+    with timer.stage('config'):
+        config = EmailConfiguration.get_config()
+    
+    # Subject, sender and body parts are built once for the whole batch
+    message_factory = CertificateMessageFactory(rendered, f"{config.from_name} <{config.from_email}>")
+    
+    # Certificates recently sent to these recipients, looked up once (see mailer.dedup)
+    duplicate_action = get_duplicate_action()
+    duplicate_guard = DuplicateGuard(duplicate_action) if duplicate_action else None
+    if duplicate_guard:
+        with timer.stage('duplicate_check'):
+            duplicate_guard.preload(
+                email for is_valid, _, email in
+                (validate_certificate_filename(cert_file.name) for cert_file in certificate_files)
+                if is_valid
+            )
+    
+    rate_limiter = get_rate_limiter(
+        settings.EMAIL_HOST_USER or config.from_email,
+        config.rate_limit_per_minute,
+        config.rate_limit_burst
+    )
+    pool = SMTPConnectionPool(size=config.smtp_pool_size, rate_limiter=rate_limiter)
+    retry_policy = RetryPolicy()
+    retries = RetryQueue()
+    
+    # Workers only queue log rows; this thread writes them
+    log_buffer = EmailLogBuffer(auto_flush=False, timer=timer)
+    progress = BatchProgress(batch_obj, log_buffer=log_buffer, timer=timer) if batch_obj else None
+    # Live progress for the Server-Sent Events stream (see mailer.events)
+    publisher = ProgressPublisher(batch_obj, rate_limiter=rate_limiter, retries=retries) if batch_obj else None
+    outcomes = [None] * len(certificate_files)
+    
+    # Items are marked 'sending' one chunk at a time by the read-ahead thread
+    checkpoint_chunk = log_buffer.flush_size
+    feed_positions = iter(range(len(certificate_files)))
+    
+    def prepare(task):
+        cert_file, attempt, requeued, content_hash = task
+        if not requeued:
+            # First attempts are fed in file order; requeued ones are already marked
+            position = next(feed_positions)
+            if batch_obj and position % checkpoint_chunk == 0:
+                mark_items_sending(certificate_files[position:position + checkpoint_chunk])
+        return prepare_certificate(cert_file, attempt, timer=timer, content_hash=content_hash)
+    
+    def send_one(prepared, connection):
+        return send_certificate_email(
+            prepared.file,
+            template,
+            connection=connection,  # Pooled connection of this worker
+            log_buffer=log_buffer,
+            message_factory=message_factory,
+            attachment=prepared.attachment,
+            attempt=prepared.attempt,
+            retry_policy=retry_policy,
+            timer=timer,
+            content_hash=prepared.content_hash,
+            duplicate_guard=duplicate_guard
+        )
+    
+    tasks = [(cert_file, 1, False, None) for cert_file in certificate_files]
+    attempts = [1] * len(certificate_files)
+    # Logs of checkpointed items are only written together with their item state
+    flush_logs_if_due = progress.flush_if_due if progress else log_buffer.flush_if_due
     
     try:
-        # Open the connection once
-        connection.open()
+        if publisher:
+            publisher.publish()
         
-        for index, cert_file in enumerate(certificate_files, start=1):
-            # Send email using persistent connection
-            success, student_id, email, error = send_certificate_email(
-                cert_file, 
-                template, 
-                connection=connection  # Pass connection to reuse
-            )
+        # The cooldown keeps being published while throttled connections wait
+        on_idle = publisher.tick if publisher else None
+        
+        # Attachments are read and encoded by the pool's read-ahead thread
+        for index, outcome in pool.imap_unordered(send_one, tasks, prepare=prepare, retries=retries,
+                                                  on_idle=on_idle):
+            if outcome.retry and outcome.duplicate:
+                # A copy of this certificate is still being sent; check again later, by its hash
+                retries.schedule(index, (certificate_files[index], attempts[index], True, outcome.content_hash),
+                                 DUPLICATE_WAIT_SECONDS)
+                if publisher:
+                    publisher.tick()
+                continue
+            if outcome.retry:
+                # Not final yet: the pool sends it again once the backoff is over
+                delay = retry_policy.delay(attempts[index])
+                attempts[index] += 1
+                retries.schedule(index, (certificate_files[index], attempts[index], True, None), delay)
+                results['retried'] += 1
+                if publisher:
+                    # Throttled sends pause the limiter; show the cooldown
+                    publisher.tick()
+                flush_logs_if_due()
+                continue
+            
+            outcomes[index] = outcome
+            success = outcome.success
             
             if success:
                 results['successful'] += 1
             else:
+                # Skipped duplicates weren't sent either; they count as failed sends
                 results['failed'] += 1
-                results['errors'].append({
-                    'student_id': student_id,
-                    'email': email,
-                    'error': error
-                })
-            
-            # Update batch if provided
-            if batch_obj:
-                batch_obj.successful_sends = results['successful']
-                batch_obj.failed_sends = results['failed']
-                batch_obj.save()
+            if outcome.duplicate:
+                results['duplicates'] += 1
             
-            # COOLDOWN: Every 80 emails, pause for 100 seconds to avoid rate limiting
-            if index % 80 == 0 and index < len(certificate_files):
-                print(f"[INFO] Cooldown after {index} emails - waiting 100 seconds to avoid rate limits...")
-                connection.close()  # Close connection during cooldown
-                time.sleep(100)
-                connection.open()  # Reopen after cooldown
-                print(f"[INFO] Resuming after cooldown...")
+            # Update batch progress if provided (coalesced)
+            if progress:
+                progress.record(
+                    success,
+                    getattr(certificate_files[index], 'batch_item', None),
+                    skipped=outcome.duplicate and not success
+                )
+            if publisher:
+                publisher.record(success, certificate_files[index].name)
+            flush_logs_if_due()
         
     finally:
-        connection.close()
+        # The last logs are written in the same transaction as the final item states
+        if progress:
+            progress.finish(results['successful'], results['failed'])
+        log_buffer.close()
+    
+    # Report errors in the original file order
+    for success, student_id, email, error, *_ in outcomes:
+        if not success:
+            results['errors'].append({
+                'student_id': student_id,
+                'email': email,
+                'error': error
+            })
     
-    return results
\ No newline at end of file
+    return results
@@ -1,22 +1,36 @@
+import zipfile
+import datetime
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.conf import settings
 from django.template.loader import render_to_string
-from .models import EmailTemplate, EmailLog, CertificateBatch
+from django.utils.crypto import constant_time_compare
+from .models import EmailTemplate, EmailLog, CertificateBatch, DailySendStats
 from .forms import EmailTemplateForm, SendCertificatesForm
-from .utils import send_certificates_batch, validate_certificate_filename
+from .utils import validate_certificate_filename, scan_certificate_archive
+from .jobs import enqueue_batch
+from .events import batch_snapshot, stream_batch_events
+from .metrics import BATCH_QUEUE_DEPTH, metrics_enabled, render_metrics
+from .search import search_email_logs
+from .stats import get_academic_year_start
+from .preflight import run_preflight
+
+# Preflight problems listed on the send page
+PREFLIGHT_PROBLEMS_SHOWN = 100
 
 
 @login_required
 def send_certificates_view(request):
     # Main view for sending certificates page
     testing_mode = getattr(settings, 'CERTIFICATE_TESTING_MODE', False)
+    preflight = None
     
     if request.method == 'POST':
         # Pass user to form for college filtering
@@ -30,7 +44,26 @@ def send_certificates_view(request):
             validation_errors = []
             valid_files = []
             
+            certificate_count = 0
+            
             for file in certificate_files:
+                # ZIP archive of certificates: only the file listing is read here
+                if file.name.lower().endswith('.zip'):
+                    try:
+                        with zipfile.ZipFile(file) as archive:
+                            entries, archive_errors = scan_certificate_archive(archive)
+                    except zipfile.BadZipFile:
+                        validation_errors.append(f"'{file.name}' is not a valid ZIP archive.")
+                        continue
+                    
+                    validation_errors.extend(archive_errors)
+                    if not entries:
+                        validation_errors.append(f"'{file.name}' contains no certificate files.")
+                        continue
+                    valid_files.append(file)
+                    certificate_count += len(entries)
+                    continue
+                
                 if not file.name.lower().endswith('.pdf'):
                     validation_errors.append(f"'{file.name}' is not a PDF file.")
                     continue
@@ -43,6 +76,7 @@ def send_certificates_view(request):
                         continue
                 
                 valid_files.append(file)
+                certificate_count += 1
             
             # Display validation errors if any
             if validation_errors:
@@ -57,10 +91,10 @@ def send_certificates_view(request):
                 messages.error(request, "No valid certificate files to process.")
                 # Get user's college for filtering logs
                 if request.user.is_superuser:
-                    recent_logs = EmailLog.objects.select_related('template_used').all()[:20]
+                    recent_logs = EmailLog.objects.all()[:20]
                 elif hasattr(request.user, 'profile') and request.user.profile:
-                    recent_logs = EmailLog.objects.select_related('template_used').filter(
-                        template_used__college=request.user.profile.college)[:20]
+                    recent_logs = EmailLog.objects.filter(
+                        college=request.user.profile.college)[:20]
                 else:
                     recent_logs = EmailLog.objects.none()[:20]
                 
@@ -70,71 +104,44 @@ def send_certificates_view(request):
                     'testing_mode': testing_mode,
                 })
         
-        if form.is_valid() and valid_files:
+        if form.is_valid() and valid_files and 'preflight' in request.POST:
+            # Dry run: check the files and estimate the sending time, send nothing
+            preflight = run_preflight(valid_files, form.cleaned_data['template'])
+        elif form.is_valid() and valid_files:
             template = form.cleaned_data['template']
             
             # Show info about skipped files if any
             if validation_errors:
                 messages.warning(
                     request,
-                    f"⚠ Processing {len(valid_files)} valid file(s). Skipped {len(validation_errors)} invalid file(s)."
+                    f"⚠ Processing {certificate_count} valid file(s). Skipped {len(validation_errors)} invalid file(s)."
                 )
             
-            # Create batch record
+            # Create batch record; the worker picks it up from the queue
             batch = CertificateBatch.objects.create(
                 template_used=template,
-                total_certificates=len(valid_files),
-                status='processing'
+                total_certificates=certificate_count,
+                status='pending'
             )
             
             try:
-                # Send certificates
-                results = send_certificates_batch(
-                    certificate_files=valid_files,
-                    template=template,
-                    batch_obj=batch
+                # Store certificates for the background worker
+                enqueue_batch(batch, valid_files)
+                messages.success(
+                    request,
+                    f"✓ Batch #{batch.id} queued: {certificate_count} certificate(s) will be sent in the background."
                 )
-                
-                # Update batch completion
-                batch.update_completion()
-                
-                # Display results
-                if results['failed'] == 0:
-                    messages.success(
-                        request,
-                        f"✓ Success! All {results['successful']} certificates were sent successfully."
-                    )
-                elif results['successful'] == 0:
-                    messages.error(
-                        request,
-                        f"✗ Failed! All {results['failed']} certificates failed to send."
-                    )
-                else:
-                    messages.warning(
-                        request,
-                        f"⚠ Partial Success: {results['successful']} out of {results['total']} sent. "
-                        f"{results['failed']} failed."
-                    )
-                
-                # Show specific errors if any
-                if results['errors']:
-                    error_list = "<br>".join([
-                        f"• {err['student_id']}: {err['error']}"
-                        for err in results['errors'][:5] # Show first 5 errors
-                    ])
-                    if len(results['errors']) > 5:
-                        error_list += f"<br>... and {len(results['errors']) - 5} more errors"
-                    messages.error(request, f"Error Details:<br>{error_list}")
             
-            # Catch any unexpected exceptions 
+            # Catch storage errors so the batch is not left pending forever
             except Exception as e:
                 batch.status = 'failed'
                 batch.error_details = str(e)
                 batch.completed_at = timezone.now()
                 batch.save()
                 messages.error(request, f"An unexpected error occurred: {str(e)}")
+                return redirect('send_certificates')
             
-            return redirect('send_certificates')
+            return redirect(f"{reverse('send_certificates')}?batch={batch.id}")
     else:
         # Pass user to form for college filtering
         form = SendCertificatesForm(user=request.user)
@@ -142,17 +149,23 @@ def send_certificates_view(request):
     # Get recent logs for display (last 20)
     # Filter by college for non-superusers
     if request.user.is_superuser:
-        recent_logs = EmailLog.objects.select_related('template_used').all()[:20]
+        recent_logs = EmailLog.objects.all()[:20]
     elif hasattr(request.user, 'profile') and request.user.profile:
-        recent_logs = EmailLog.objects.select_related('template_used').filter(
-            template_used__college=request.user.profile.college)[:20]
+        recent_logs = EmailLog.objects.filter(
+            college=request.user.profile.college)[:20]
     else:
         recent_logs = EmailLog.objects.none()[:20]
         
+    # Batch just queued by this user (progress modal polls it)
+    active_batch_id = request.GET.get('batch')
+    
     context = {
         'form': form,
         'recent_logs': recent_logs,
         'testing_mode': testing_mode,
+        'active_batch_id': active_batch_id if active_batch_id and active_batch_id.isdigit() else None,
+        'preflight': preflight,
+        'preflight_problems': preflight['problems'][:PREFLIGHT_PROBLEMS_SHOWN] if preflight else None,
     }
     return render(request, 'send_certificates.html', context)
 
@@ -173,6 +186,127 @@ def get_batch_progress(request, batch_id):
         return JsonResponse({'error': 'Batch not found'}, status=404)
 
 
+@login_required
+async def stream_batch_progress(request, batch_id):
+    # Server-Sent Events stream of batch progress (served by the ASGI application)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would buffer the whole stream; 204 tells EventSource
+        # not to reconnect, and the page falls back to get_batch_progress
+        return HttpResponse(status=204)
+    
+    batch = await CertificateBatch.objects.filter(id=batch_id).afirst()
+    if batch is None:
+        return JsonResponse({'error': 'Batch not found'}, status=404)
+    
+    return StreamingHttpResponse(
+        stream_batch_events(batch.id, batch_snapshot(batch)),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@login_required
+def send_stats_view(request):
+    # Sending report per college and template, read from the daily statistics only
+    today = timezone.localdate()
+    try:
+        since = datetime.date.fromisoformat(request.GET['since']) if request.GET.get('since') else get_academic_year_start(today)
+        until = datetime.date.fromisoformat(request.GET['until']) if request.GET.get('until') else today
+    except ValueError:
+        messages.error(request, "Invalid date; showing the current academic year.")
+        since, until = get_academic_year_start(today), today
+    
+    # Filter by college for non-superusers
+    stats = DailySendStats.objects.filter(day__gte=since, day__lte=until)
+    if not request.user.is_superuser:
+        if hasattr(request.user, 'profile') and request.user.profile:
+            stats = stats.filter(college=request.user.profile.college)
+        else:
+            stats = stats.none()
+    
+    rows = {}
+    months = {}
+    for entry in stats.values('day', 'college', 'template_name', 'status', 'count', 'smtp_count', 'smtp_seconds'):
+        row = rows.setdefault((entry['college'], entry['template_name']), {
+            'college': entry['college'],
+            'template': entry['template_name'] or '(deleted template)',
+            'success': 0, 'failed': 0, 'retrying': 0, 'duplicate': 0, 'smtp_count': 0, 'smtp_seconds': 0.0,
+        })
+        month = months.setdefault(
+            entry['day'].replace(day=1), {'success': 0, 'failed': 0, 'retrying': 0, 'duplicate': 0}
+        )
+        row[entry['status']] += entry['count']
+        month[entry['status']] += entry['count']
+        row['smtp_count'] += entry['smtp_count']
+        row['smtp_seconds'] += entry['smtp_seconds']
+    
+    for row in rows.values():
+        finished = row['success'] + row['failed']
+        row['failure_rate'] = row['failed'] / finished * 100 if finished else None
+        row['mean_smtp_ms'] = row['smtp_seconds'] / row['smtp_count'] * 1000 if row['smtp_count'] else None
+    
+    return render(request, 'send_stats.html', {
+        'since': since,
+        'until': until,
+        'rows': sorted(rows.values(), key=lambda row: (row['college'], row['template'])),
+        'months': sorted(months.items()),
+        'total_success': sum(row['success'] for row in rows.values()),
+        'total_failed': sum(row['failed'] for row in rows.values()),
+    })
+
+
+@login_required
+def lookup_email_logs(request):
+    # JSON search of the email logs ("did student X get their certificate?")
+    search_term = request.GET.get('q', '').strip()
+    if not search_term:
+        return JsonResponse({'error': 'Missing search term (q)'}, status=400)
+    
+    # Filter by college for non-superusers
+    if request.user.is_superuser:
+        logs = EmailLog.objects.all()
+    elif hasattr(request.user, 'profile') and request.user.profile:
+        logs = EmailLog.objects.filter(college=request.user.profile.college)
+    else:
+        logs = EmailLog.objects.none()
+    
+    logs = search_email_logs(logs, search_term)[:50]
+    return JsonResponse({'results': [
+        {
+            'student_id': log.student_id,
+            'email': log.email,
+            'certificate_filename': log.certificate_filename,
+            'college': log.college,
+            'status': log.status,
+            'attempt': log.attempt,
+            'error_message': log.error_message,
+            'sent_at': log.sent_at.isoformat(),
+        }
+        for log in logs
+    ]})
+
+
+def metrics_view(request):
+    # Prometheus scrape endpoint, for scrapers sending the MAILER_METRICS_TOKEN
+    # bearer token and for staff users; hidden from everyone else
+    if not metrics_enabled():
+        return HttpResponse(status=404)
+    
+    token = getattr(settings, 'MAILER_METRICS_TOKEN', None)
+    has_token = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (has_token or request.user.is_staff):
+        if token:
+            return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+        return HttpResponse(status=404)
+    
+    # The queue depth is read now rather than reported (and left stale) by the workers
+    queue_depth = CertificateBatch.objects.filter(status='pending').count()
+    return HttpResponse(
+        render_metrics({BATCH_QUEUE_DEPTH: queue_depth}),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 # List all email templates
 class TemplateListView(LoginRequiredMixin, ListView):
     model = EmailTemplate
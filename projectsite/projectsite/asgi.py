@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "projectsite.settings")
 
 application = get_asgi_application()
+
+# The web server shares its /metrics values with the batch workers
+# (imported once the apps are loaded)
+from mailer.metrics import start_metrics_sync
+
+start_metrics_sync()
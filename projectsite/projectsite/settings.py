@@ -84,9 +84,20 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, not at its first write
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
+# SQLite connection settings for the web server and workers sharing the
+# database (mailer/sqlite.py): WAL journal, wait up to SQLITE_BUSY_TIMEOUT
+# milliseconds for a lock, fsync only at checkpoints
+SQLITE_WAL = True
+SQLITE_BUSY_TIMEOUT = 20000
+SQLITE_SYNCHRONOUS = 'NORMAL'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -132,6 +143,8 @@ STATICFILES_DIRS = (
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Email Configuration
+# 'mailer.backends.AsyncSMTPBackend' runs the SMTP sessions on one asyncio
+# event loop and pipelines commands when the server supports it
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -141,9 +154,94 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
 
 # File uploads
+# Certificates are always spooled to temporary files on disk (never kept in
+# memory) and moved into CERTIFICATE_UPLOAD_ROOT when the batch is queued
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+# Largest certificate accepted inside a ZIP archive
+CERTIFICATE_MAX_FILE_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 
+# Seconds a worker trusts its cached EmailConfiguration before re-checking the database
+EMAIL_CONFIG_CACHE_TTL = 30
+
+# Number of rendered email templates kept in memory per process
+EMAIL_RENDER_CACHE_SIZE = 32
+
+# EmailLog rows are written in bulk during batches: every N rows or every N seconds
+EMAIL_LOG_FLUSH_SIZE = 50
+EMAIL_LOG_FLUSH_INTERVAL = 5
+
+# CertificateBatch progress is written every N emails or every N seconds
+BATCH_PROGRESS_EVERY = 25
+BATCH_PROGRESS_INTERVAL = 2
+
+# Rate limiter used for batch sending (limits are set per sender in Email Configuration)
+EMAIL_RATE_LIMITER = 'mailer.ratelimit.AdaptiveRateLimiter'
+# Pause after a throttling reply (421/450/451/452/454), doubled on each consecutive one
+EMAIL_THROTTLE_BACKOFF = 30
+EMAIL_THROTTLE_MAX_BACKOFF = 600
+
+# Retries of transient send failures (timeouts, 4xx replies) within a batch.
+# Attempts include the first try; the delay doubles per retry, with jitter.
+EMAIL_RETRY_MAX_ATTEMPTS = 3
+EMAIL_RETRY_BASE_DELAY = 10
+EMAIL_RETRY_MAX_DELAY = 300
+
+# Certificates whose exact file was already sent to the same address within
+# this many hours are duplicates (0 turns the check off). EMAIL_DUPLICATE_ACTION
+# is 'skip' (don't send, log as 'duplicate') or 'flag' (send, with a note in the log).
+EMAIL_DUPLICATE_WINDOW_HOURS = 72
+EMAIL_DUPLICATE_ACTION = 'skip'
+
+# Preflight checks ("Check Only" / `manage.py preflight`): sends of the last N
+# days give the mean SMTP time and recent failures; without any, a send is
+# assumed to take PREFLIGHT_SMTP_SECONDS
+PREFLIGHT_HISTORY_DAYS = 30
+PREFLIGHT_SMTP_SECONDS = 1.0
+
+# Time every stage of the send pipeline and store per-batch histograms
+# (shown in the Certificate Batch admin). False makes the timers no-ops.
+EMAIL_STAGE_TIMING = True
+
+# Email logs older than this are moved to the archive by `manage.py archive_logs`
+EMAIL_LOG_RETENTION_DAYS = 365
+# Academic terms (starting month, name) archived logs are labelled with;
+# the academic year starts with the first one
+ACADEMIC_TERMS = [
+    (8, '1st Semester'),
+    (1, '2nd Semester'),
+    (6, 'Midyear'),
+]
+
+# Admin changelists of the large tables (email logs, batches, batch items):
+# estimated row counts, exact counts only up to COUNT_LIMIT, prefix search on
+# indexed columns and date hierarchy links cached for FACET_CACHE_SECONDS.
+# False restores Django's default changelists.
+MAILER_ADMIN_FAST_CHANGELISTS = True
+MAILER_ADMIN_COUNT_LIMIT = 10000
+MAILER_ADMIN_FACET_CACHE_SECONDS = 300
+
+# Uploaded certificates waiting for the background worker (manage.py process_batches)
+CERTIFICATE_UPLOAD_ROOT = BASE_DIR / 'certificate_uploads'
+# A 'processing' batch counts as stopped (and may be resumed) once neither its
+# items nor its progress snapshot changed for this many minutes; keep it above
+# EMAIL_THROTTLE_MAX_BACKOFF so a throttled batch isn't mistaken for a dead one
+BATCH_STALE_MINUTES = 15
+
+# Prometheus metrics at /metrics. The web server and the workers each write
+# their values to MAILER_METRICS_DIR (at most every SYNC_INTERVAL seconds)
+# and /metrics adds them up; gauges of processes silent for GAUGE_TTL seconds
+# are dropped. Set MAILER_METRICS_DIR = None for a single process. Only staff
+# users and scrapers sending "Authorization: Bearer <token>" can read it.
+MAILER_METRICS_ENABLED = True
+MAILER_METRICS_DIR = CERTIFICATE_UPLOAD_ROOT / 'metrics'
+MAILER_METRICS_SYNC_INTERVAL = 1
+MAILER_METRICS_GAUGE_TTL = 60
+MAILER_METRICS_TOKEN = os.getenv('MAILER_METRICS_TOKEN')
+
 # Message tags
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {